@@ -0,0 +1,79 @@
+# admission.py
+import asyncio
+import collections
+import math
+
+
+class Overloaded(Exception):
+    """Raised when a request is shed; `retry_after` is in whole seconds"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"overloaded, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Concurrency limit with a bounded FIFO queue, for a single event loop.
+
+    Up to `max_concurrency` requests run at once and up to `max_queue` more
+    wait their turn; anything beyond that, or anything that waited longer
+    than `max_wait` seconds, is rejected with Overloaded right away. Under
+    overload the pod keeps serving at its limit and the excess fails fast,
+    instead of every request slowing down until callers time out.
+    """
+
+    def __init__(self, max_concurrency=100, max_queue=200, max_wait=1.0):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.inflight = 0
+        self.queued = 0
+        self.shed = 0
+        self.service_time = 0.05   # EWMA of how long a slot is held
+        self._waiters = collections.deque()
+
+    def retry_after(self):
+        # Time to drain the queue at the current service rate, at least 1s
+        backlog = (self.queued + 1) * self.service_time / self.max_concurrency
+        return max(1, math.ceil(backlog))
+
+    def _reject(self):
+        self.shed += 1
+        raise Overloaded(self.retry_after())
+
+    async def acquire(self):
+        if self.inflight < self.max_concurrency and not self.queued:
+            self.inflight += 1
+            return
+        if self.queued >= self.max_queue:
+            self._reject()
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued += 1
+        try:
+            await asyncio.wait({waiter}, timeout=self.max_wait)
+        except asyncio.CancelledError:
+            # The caller went away; pass on a slot we may have been given
+            if waiter.done() and not waiter.cancelled():
+                self.release(None)
+            else:
+                waiter.cancel()
+            raise
+        finally:
+            self.queued -= 1
+        if not waiter.done():
+            # Waited too long; the cancelled waiter is skipped by release()
+            waiter.cancel()
+            self._reject()
+
+    def release(self, held):
+        """Give the slot back, or hand it straight to the oldest waiter"""
+        if held is not None:
+            self.service_time = 0.9 * self.service_time + 0.1 * held
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.inflight -= 1
@@ -0,0 +1,164 @@
+# async_backend.py
+#
+# asyncio variant of the backend service. Same /status, /status/batch,
+# /metrics/prometheus and /health contract as backend.py, but simulated processing yields to the
+# event loop instead of holding a thread, and admission control sheds load
+# with 503 + Retry-After once the concurrency limit and queue are full.
+import asyncio
+import bisect
+import os
+import random
+import time
+
+from aiohttp import web
+
+from admission import AdmissionController, Overloaded
+
+# Zone lookup and metrics are shared with the Flask backend
+import backend as core
+from profiling import ProfilerBusy, profile_params
+
+admission = AdmissionController(
+    max_concurrency=int(os.environ.get("MAX_CONCURRENCY", "100")),
+    max_queue=int(os.environ.get("MAX_QUEUE", "200")),
+    max_wait=float(os.environ.get("MAX_QUEUE_WAIT", "1"))
+)
+
+def sync_load_metrics():
+    with core.metrics_lock:
+        core.inflight_requests = admission.inflight
+        core.queued_requests = admission.queued
+        core.shed_requests = admission.shed
+
+def overloaded_payload(retry_after):
+    return {'error': 'overloaded', 'zone': core.CURRENT_ZONE, 'pod_name': core.POD_NAME,
+            'inflight': admission.inflight, 'queue_depth': admission.queued, 'retry_after': retry_after}
+
+async def process():
+    """Admit and process one request (or batched item), returning its
+    /status payload and the load at admission; raises Overloaded if shed"""
+    try:
+        with core.stages('admission'):
+            await admission.acquire()
+    except Overloaded:
+        sync_load_metrics()
+        raise
+    
+    started = time.monotonic()
+    inflight, queue_depth = admission.inflight, admission.queued
+    with core.metrics_lock:
+        core.request_count += 1
+        count = core.request_count
+    sync_load_metrics()
+    
+    # Simulate some processing time, without blocking other requests
+    processing_time = random.uniform(0.01, 0.1)
+    try:
+        with core.stages('processing'):
+            await asyncio.sleep(processing_time)
+    finally:
+        admission.release(time.monotonic() - started)
+        sync_load_metrics()
+        with core.metrics_lock:
+            core.processing_counts[bisect.bisect_left(core.PROCESSING_BUCKETS, processing_time)] += 1
+            core.processing_sum += processing_time
+    return core.status_payload(count, processing_time, inflight, queue_depth), inflight, queue_depth
+
+async def status(request):
+    try:
+        payload, inflight, queue_depth = await process()
+    except Overloaded as e:
+        headers = core.load_headers(admission.inflight, admission.queued)
+        headers['Retry-After'] = str(e.retry_after)
+        return web.json_response(overloaded_payload(e.retry_after), status=503, headers=headers)
+    
+    with core.stages('encode'):
+        return web.json_response(payload, headers=core.load_headers(inflight, queue_depth))
+
+async def status_batch(request):
+    """Process {"items": [...]} in one request, streaming one NDJSON line per
+    item in completion order. Every item goes through admission control on
+    its own, so a shed item gets an "overloaded" line and the rest still run."""
+    try:
+        items = core.batch_items(await request.json())
+    except ValueError as e:
+        return web.json_response({'error': str(e)}, status=400)
+    with core.metrics_lock:
+        core.batch_count += 1
+    
+    async def process_item(index):
+        try:
+            payload, _, _ = await process()
+        except Overloaded as e:
+            payload = overloaded_payload(e.retry_after)
+        return index, payload
+    
+    response = web.StreamResponse(headers=core.load_headers(admission.inflight, admission.queued))
+    response.content_type = 'application/x-ndjson'
+    await response.prepare(request)
+    tasks = [asyncio.ensure_future(process_item(index)) for index in range(len(items))]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            index, payload = await next_done
+            with core.stages('encode'):
+                line = core.batch_line(index, payload)
+            await response.write(line.encode())
+    finally:
+        # The caller went away mid-stream: give the admission slots back
+        for task in tasks:
+            task.cancel()
+    await response.write_eof()
+    return response
+
+async def prometheus(request):
+    return web.Response(body=core.render_prometheus().encode(),
+                        headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+async def debug_stages(request):
+    return web.json_response(core.stages_payload())
+
+async def debug_profile(request):
+    """Sample every thread, the event loop's included, for ?seconds=N"""
+    try:
+        seconds, interval = profile_params(request.query)
+    except ValueError as e:
+        return web.json_response({'error': str(e)}, status=400)
+    try:
+        # Sampled from a worker thread, so the loop keeps serving meanwhile
+        text, samples = await asyncio.get_running_loop().run_in_executor(
+            None, core.profiler.profile, seconds, interval)
+    except ProfilerBusy:
+        return web.json_response({'error': 'a profile is already running'}, status=409)
+    return web.Response(text=text, headers={'X-Profile-Samples': str(samples)})
+
+async def ready(request):
+    is_ready, payload = core.readiness()
+    return web.json_response(payload, status=200 if is_ready else 503)
+
+async def health(request):
+    return web.json_response({
+        'status': 'healthy',
+        'zone': core.CURRENT_ZONE,
+        'pod_name': core.POD_NAME,
+        'pod_ip': core.POD_IP
+    })
+
+async def on_startup(app):
+    print(f"Starting async backend service in zone: {core.CURRENT_ZONE} "
+          f"(from {core.zone_resolver.source or 'a background lookup'})")
+
+def create_app():
+    app = web.Application()
+    app.router.add_get('/status', status)
+    app.router.add_post('/status/batch', status_batch)
+    app.router.add_get('/metrics/prometheus', prometheus)
+    app.router.add_get('/debug/stages', debug_stages)
+    app.router.add_get('/debug/profile', debug_profile)
+    app.router.add_get('/ready', ready)
+    app.router.add_get('/health', health)
+    app.on_startup.append(on_startup)
+    return app
+
+if __name__ == '__main__':
+    app = create_app()
+    web.run_app(app, host=os.environ.get("BIND_ADDRESS", "0.0.0.0"), port=8080)
@@ -3,20 +3,22 @@ import os
 import time
 import random
 import json
-from flask import Flask, jsonify
+import bisect
+import threading
+from flask import Flask, Response, jsonify, request
 import socket
-from kubernetes import client, config
+
+from profiling import (ProfilerBusy, SamplingProfiler, StageHistograms, StageTimer, profile_params,
+                       prometheus_lines, stage_summary)
+from startup import LazyApi, ZoneResolver, in_cluster, node_zone_lookup
 
 app = Flask(__name__)
 
-# Try to load Kubernetes config
-try:
-    config.load_incluster_config()
-    kube_client = client.CoreV1Api()
-    IN_CLUSTER = True
-except:
-    IN_CLUSTER = False
+# The kubernetes client is only imported once something calls the API
+IN_CLUSTER = in_cluster()
+if not IN_CLUSTER:
     print("Not running in Kubernetes cluster")
+kube_client = LazyApi("CoreV1Api")
 
 # Get Pod information
 POD_NAME = os.environ.get("POD_NAME", "unknown")
@@ -24,55 +26,224 @@ POD_NAMESPACE = os.environ.get("POD_NAMESPACE", "default")
 NODE_NAME = os.environ.get("NODE_NAME", "unknown")
 POD_IP = os.environ.get("POD_IP", "127.0.0.1")
 
-# Get node information to determine the zone
+# The zone, from ZONE, the downward API labels in ZONE_LABELS_FILE or the
+# ZONE_CACHE_FILE of an earlier run, else read from the node in the
+# background (with backoff, refreshed every ZONE_LOOKUP_INTERVAL seconds).
+# Requests never wait for it; /ready reports 503 until it is known.
 CURRENT_ZONE = "unknown"
 
-def get_current_zone():
+def on_zone_resolved(zone):
     global CURRENT_ZONE
-    if not IN_CLUSTER:
-        return "unknown"
-    
-    try:
-        node = kube_client.read_node(NODE_NAME)
-        labels = node.metadata.labels
-        CURRENT_ZONE = labels.get("topology.kubernetes.io/zone", "unknown")
-        return CURRENT_ZONE
-    except Exception as e:
-        print(f"Exception when calling CoreV1Api->read_node: {e}")
-        return "unknown"
-
-# Request counter
+    CURRENT_ZONE = zone
+
+zone_resolver = ZoneResolver.from_env(node_zone_lookup(kube_client, NODE_NAME) if IN_CLUSTER else None)
+zone_resolver.add_listener(on_zone_resolved)
+zone_resolver.start()
+
+def readiness():
+    """(ready, /ready payload): ready once the zone is resolved"""
+    ready = zone_resolver.resolved or not IN_CLUSTER
+    return ready, {'ready': ready, 'zone': zone_resolver.stats(), 'pod_name': POD_NAME}
+
+# Request counter, batched work items included
 request_count = 0
+batch_count = 0
+
+# POST /status/batch takes up to BATCH_MAX_ITEMS work items in one request
+# and streams one NDJSON line per item back as soon as it is done
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", "100"))
+
+# Load metrics, exposed on /metrics/prometheus. Updated under metrics_lock
+# and rendered to text at most once per PROMETHEUS_RENDER_INTERVAL seconds.
+metrics_lock = threading.Lock()
+inflight_requests = 0
+queued_requests = 0   # waiting for a slot (async mode only)
+shed_requests = 0     # rejected with 503 (async mode only)
+PROCESSING_BUCKETS = (0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 1.0)
+processing_counts = [0] * (len(PROCESSING_BUCKETS) + 1)
+processing_sum = 0.0
+PROMETHEUS_RENDER_INTERVAL = float(os.environ.get("PROMETHEUS_RENDER_INTERVAL", "1"))
+rendered_metrics = {'text': '', 'at': None}
+
+# Where /status spends its time, per stage, and /debug/profile sampling
+# (idle until called, at most PROFILE_MAX_SECONDS per call)
+stage_histograms = StageHistograms()
+stages = StageTimer(stage_histograms)
+profiler = SamplingProfiler(max_seconds=float(os.environ.get("PROFILE_MAX_SECONDS", "60")))
+
+def render_prometheus():
+    """Prometheus text for the backend's counters, cached between renders"""
+    now = time.monotonic()
+    with metrics_lock:
+        if rendered_metrics['at'] is not None and now - rendered_metrics['at'] < PROMETHEUS_RENDER_INTERVAL:
+            return rendered_metrics['text']
+        labels = f'zone="{CURRENT_ZONE}",pod="{POD_NAME}"'
+        lines = [
+            '# HELP backend_requests_total Requests served by /status, one per batched item',
+            '# TYPE backend_requests_total counter',
+            f'backend_requests_total{{{labels}}} {request_count}',
+            '# HELP backend_batches_total Requests to /status/batch',
+            '# TYPE backend_batches_total counter',
+            f'backend_batches_total{{{labels}}} {batch_count}',
+            '# HELP backend_inflight_requests Requests currently being processed',
+            '# TYPE backend_inflight_requests gauge',
+            f'backend_inflight_requests{{{labels}}} {inflight_requests}',
+            '# HELP backend_queued_requests Requests waiting for a processing slot',
+            '# TYPE backend_queued_requests gauge',
+            f'backend_queued_requests{{{labels}}} {queued_requests}',
+            '# HELP backend_shed_requests_total Requests rejected with 503 because of overload',
+            '# TYPE backend_shed_requests_total counter',
+            f'backend_shed_requests_total{{{labels}}} {shed_requests}',
+            '# HELP backend_processing_seconds Simulated processing time per request',
+            '# TYPE backend_processing_seconds histogram',
+        ]
+        cumulative = 0
+        for bound, count in zip([repr(b) for b in PROCESSING_BUCKETS] + ['+Inf'], processing_counts):
+            cumulative += count
+            lines.append(f'backend_processing_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'backend_processing_seconds_sum{{{labels}}} {processing_sum}')
+        lines.append(f'backend_processing_seconds_count{{{labels}}} {cumulative}')
+        lines += prometheus_lines('backend_stage_seconds', 'Time spent per /status stage',
+                                  stage_histograms.collect(), stage_histograms.buckets, labels)
+        rendered_metrics['text'] = '\n'.join(lines) + '\n'
+        rendered_metrics['at'] = now
+        return rendered_metrics['text']
+
+def status_payload(count, processing_time, inflight, queue_depth):
+    """Build the /status payload"""
+    return {
+        'service': 'backend',
+        'zone': CURRENT_ZONE,
+        'pod_name': POD_NAME,
+        'node_name': NODE_NAME,
+        'pod_ip': POD_IP,
+        'request_count': count,
+        'processing_time_ms': processing_time * 1000,
+        # Load when the request was admitted, so callers can route on it
+        'inflight': inflight,
+        'queue_depth': queue_depth
+    }
+
+def batch_items(body):
+    """The work items of a /status/batch body, ValueError if it is malformed"""
+    items = body.get('items') if isinstance(body, dict) else None
+    if not isinstance(items, list) or not items:
+        raise ValueError('expected {"items": [...]} with at least one item')
+    if len(items) > BATCH_MAX_ITEMS:
+        raise ValueError(f'at most {BATCH_MAX_ITEMS} items per batch')
+    return items
+
+def batch_line(index, payload):
+    """One NDJSON line of a /status/batch reply"""
+    payload['index'] = index
+    return json.dumps(payload) + '\n'
+
+def load_headers(inflight, queue_depth):
+    return {'X-Inflight': str(inflight), 'X-Queue-Depth': str(queue_depth)}
+
+def stages_payload():
+    return {'pod_name': POD_NAME, 'stages': stage_summary(stage_histograms.collect(), stage_histograms.buckets)}
 
 @app.route('/status')
 def status():
-    global request_count
-    request_count += 1
-    
-    # Make sure zone is up to date
-    if CURRENT_ZONE == "unknown":
-        get_current_zone()
+    global request_count, inflight_requests, processing_sum
+    with metrics_lock:
+        request_count += 1
+        count = request_count
+        inflight_requests += 1
+        inflight = inflight_requests
     
     # Simulate some processing time
     processing_time = random.uniform(0.01, 0.1)
-    time.sleep(processing_time)
+    try:
+        with stages('processing'):
+            time.sleep(processing_time)
+    finally:
+        with metrics_lock:
+            inflight_requests -= 1
+            processing_counts[bisect.bisect_left(PROCESSING_BUCKETS, processing_time)] += 1
+            processing_sum += processing_time
     
-    return jsonify({
-        'service': 'backend',
-        'zone': CURRENT_ZONE,
-        'pod_name': POD_NAME,
-        'node_name': NODE_NAME,
-        'pod_ip': POD_IP,
-        'request_count': request_count,
-        'processing_time_ms': processing_time * 1000
-    })
+    with stages('encode'):
+        response = jsonify(status_payload(count, processing_time, inflight, 0))
+    return response, 200, load_headers(inflight, 0)
+
+@app.route('/status/batch', methods=['POST'])
+def status_batch():
+    """Process {"items": [...]} in one request. Replies with one NDJSON line
+    per item, its /status payload plus its "index", in completion order"""
+    global request_count, batch_count, inflight_requests
+    try:
+        items = batch_items(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    with metrics_lock:
+        first_count = request_count + 1
+        request_count += len(items)
+        batch_count += 1
+        inflight_requests += len(items)
+        inflight = inflight_requests
+    
+    # The items are independent waits, so they run side by side: each is
+    # done its own simulated processing time after the batch came in
+    started = time.monotonic()
+    schedule = sorted((random.uniform(0.01, 0.1), index) for index in range(len(items)))
+    unfinished = {'items': len(schedule)}
+    
+    def stream():
+        global inflight_requests, processing_sum
+        for processing_time, index in schedule:
+            delay = started + processing_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            with metrics_lock:
+                inflight_requests -= 1
+                unfinished['items'] -= 1
+                processing_counts[bisect.bisect_left(PROCESSING_BUCKETS, processing_time)] += 1
+                processing_sum += processing_time
+            with stages('encode'):
+                line = batch_line(index, status_payload(first_count + index, processing_time, inflight, 0))
+            yield line
+    
+    def release_unfinished():
+        # The caller went away mid-stream
+        global inflight_requests
+        with metrics_lock:
+            inflight_requests -= unfinished['items']
+            unfinished['items'] = 0
+    
+    response = Response(stream(), mimetype='application/x-ndjson', headers=load_headers(inflight, 0))
+    response.call_on_close(release_unfinished)
+    return response
+
+@app.route('/metrics/prometheus')
+def prometheus():
+    return Response(render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/debug/stages')
+def debug_stages():
+    return jsonify(stages_payload())
+
+@app.route('/debug/profile')
+def debug_profile():
+    """Sample every thread for ?seconds=N and return collapsed stacks"""
+    try:
+        seconds, interval = profile_params(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        text, samples = profiler.profile(seconds, interval)
+    except ProfilerBusy:
+        return jsonify({'error': 'a profile is already running'}), 409
+    return Response(text, mimetype='text/plain', headers={'X-Profile-Samples': str(samples)})
+
+@app.route('/ready')
+def ready():
+    is_ready, payload = readiness()
+    return jsonify(payload), 200 if is_ready else 503
 
 @app.route('/health')
 def health():
-    # Make sure zone is up to date
-    if CURRENT_ZONE == "unknown":
-        get_current_zone()
-        
     return jsonify({
         'status': 'healthy', 
         'zone': CURRENT_ZONE,
@@ -81,7 +252,5 @@ def health():
     })
 
 if __name__ == '__main__':
-    # Initial zone lookup
-    get_current_zone()
-    print(f"Starting backend service in zone: {CURRENT_ZONE}")
-    app.run(host='0.0.0.0', port=8080)
\ No newline at end of file
+    print(f"Starting backend service in zone: {CURRENT_ZONE} (from {zone_resolver.source or 'a background lookup'})")
+    app.run(host=os.environ.get("BIND_ADDRESS", "0.0.0.0"), port=8080)
\ No newline at end of file
@@ -0,0 +1,211 @@
+# startup.py
+#
+# Cold start: the pod's zone without an API call on the request path, and
+# the kubernetes client imported only once something needs it. Each
+# service image ships its own directory: src/backend and src/frontend
+# carry this whole file, src/dashboard (no zone of its own) the lazy
+# client only. Change them together.
+import os
+import random
+import threading
+import time
+
+ZONE_LABEL = "topology.kubernetes.io/zone"
+SERVICE_ACCOUNT_TOKEN = "/var/run/secrets/kubernetes.io/serviceaccount/token"
+
+_kubernetes = None
+_kubernetes_lock = threading.Lock()
+
+
+def in_cluster():
+    """Whether there is an API server to talk to, judged without importing the client"""
+    if os.environ.get("KUBE_API_URL"):
+        return True
+    return bool(os.environ.get("KUBERNETES_SERVICE_HOST")) and os.path.exists(SERVICE_ACCOUNT_TOKEN)
+
+
+def load_kubernetes():
+    """Import and configure the kubernetes client, once per process"""
+    global _kubernetes
+    with _kubernetes_lock:
+        if _kubernetes is None:
+            # A third of a second of imports, paid by the first caller only
+            import kubernetes.client
+            from kubernetes import config
+            if os.environ.get("KUBE_API_URL"):
+                # Local API stand-in (src/harness/fake_kube.py): plain HTTP, no auth
+                configuration = kubernetes.client.Configuration()
+                configuration.host = os.environ["KUBE_API_URL"]
+                kubernetes.client.Configuration.set_default(configuration)
+            else:
+                config.load_incluster_config()
+            _kubernetes = kubernetes.client
+        return _kubernetes
+
+
+class LazyApi:
+    """Stands in for a kubernetes API object (CoreV1Api, DiscoveryV1Api, ...)
+    and builds it on first attribute access"""
+
+    def __init__(self, name):
+        self._name = name
+        self._api = None
+
+    def __getattr__(self, attr):
+        api = self._api
+        if api is None:
+            api = self._api = getattr(load_kubernetes(), self._name)()
+        return getattr(api, attr)
+
+
+def read_labels_file(path):
+    """{label: value} from a downward API labels file (key="value" per line)"""
+    labels = {}
+    with open(path) as f:
+        for line in f:
+            key, sep, value = line.strip().partition('=')
+            if sep:
+                labels[key] = value.strip('"')
+    return labels
+
+
+def node_zone_lookup(kube_client, node_name):
+    """A lookup for ZoneResolver: the zone label of the pod's node"""
+    def lookup():
+        node = kube_client.read_node(node_name)
+        return (node.metadata.labels or {}).get(ZONE_LABEL, "unknown")
+    return lookup
+
+
+class ZoneResolver:
+    """The pod's zone, resolved once at startup without blocking on the API.
+
+    Local sources are tried first, in order: an injected zone (env), a
+    labels file (a downward API volume, or one written by an init
+    container) and the cache file a previous lookup left behind (on an
+    emptyDir it survives container restarts). The first two are
+    authoritative and end the search. Otherwise `lookup()` (the API) runs on
+    a background thread, retried with jittered exponential backoff until it
+    answers and repeated every `refresh_interval` seconds after that, so a
+    cached zone gets confirmed. Callers only ever read `zone`.
+
+    The zone counts as resolved once any source has answered, "unknown"
+    included when the node has no zone label.
+    """
+
+    def __init__(self, lookup=None, env_zone=None, labels_file=None, cache_file=None,
+                 refresh_interval=300.0, initial_backoff=0.5, max_backoff=30.0):
+        self.lookup = lookup
+        self.env_zone = env_zone
+        self.labels_file = labels_file
+        self.cache_file = cache_file
+        self.refresh_interval = refresh_interval
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.zone = "unknown"
+        self.source = None
+        self.lookups = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+        self._resolved = threading.Event()
+        self._listeners = []
+        self._thread = None
+
+    @classmethod
+    def from_env(cls, lookup=None):
+        """Configured from ZONE, ZONE_LABELS_FILE, ZONE_CACHE_FILE,
+        ZONE_LOOKUP_INTERVAL and ZONE_LOOKUP_MAX_BACKOFF"""
+        return cls(lookup,
+                   env_zone=os.environ.get("ZONE"),
+                   labels_file=os.environ.get("ZONE_LABELS_FILE", "/etc/podinfo/labels"),
+                   cache_file=os.environ.get("ZONE_CACHE_FILE"),
+                   refresh_interval=float(os.environ.get("ZONE_LOOKUP_INTERVAL", "300")),
+                   max_backoff=float(os.environ.get("ZONE_LOOKUP_MAX_BACKOFF", "30")))
+
+    @property
+    def resolved(self):
+        return self._resolved.is_set()
+
+    def wait(self, timeout=None):
+        """Block until the zone is resolved, False on timeout"""
+        return self._resolved.wait(timeout)
+
+    def add_listener(self, callback):
+        """Call `callback(zone)` whenever the zone changes"""
+        self._listeners.append(callback)
+
+    def start(self):
+        if self.env_zone:
+            self._set(self.env_zone, 'env')
+            return self
+        zone = self._read_labels_file()
+        if zone:
+            self._set(zone, 'labels')
+            return self
+        zone = self._read_cache()
+        if zone:
+            self._set(zone, 'cache')
+        if self.lookup:
+            self._thread = threading.Thread(target=self._run, name="zone-resolver", daemon=True)
+            self._thread.start()
+        return self
+
+    def stats(self):
+        return {'zone': self.zone, 'source': self.source, 'resolved': self.resolved,
+                'lookups': self.lookups, 'failures': self.failures}
+
+    def _set(self, zone, source):
+        with self._lock:
+            changed = zone != self.zone
+            self.zone = zone
+            self.source = source
+            self._resolved.set()
+        if changed:
+            for callback in self._listeners:
+                callback(zone)
+
+    def _read_labels_file(self):
+        if not self.labels_file:
+            return None
+        try:
+            return read_labels_file(self.labels_file).get(ZONE_LABEL)
+        except OSError:
+            return None
+
+    def _read_cache(self):
+        if not self.cache_file:
+            return None
+        try:
+            with open(self.cache_file) as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def _write_cache(self, zone):
+        if not self.cache_file or zone == "unknown":
+            return
+        try:
+            partial = f"{self.cache_file}.{os.getpid()}"
+            with open(partial, 'w') as f:
+                f.write(zone)
+            os.replace(partial, self.cache_file)
+        except OSError as e:
+            print(f"Could not cache zone in {self.cache_file}: {e}")
+
+    def _run(self):
+        backoff = self.initial_backoff
+        while True:
+            self.lookups += 1
+            try:
+                zone = self.lookup()
+            except Exception as e:
+                self.failures += 1
+                delay = random.uniform(backoff / 2, backoff)
+                print(f"Zone lookup failed, retrying in {delay:.1f}s: {e}")
+                time.sleep(delay)
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+            backoff = self.initial_backoff
+            self._set(zone, 'api')
+            self._write_cache(zone)
+            time.sleep(self.refresh_interval)
@@ -0,0 +1,105 @@
+# test_admission.py
+import asyncio
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+import async_backend
+from admission import AdmissionController, Overloaded
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_requests_within_the_limit_are_admitted_right_away():
+    async def main():
+        admission = AdmissionController(max_concurrency=2, max_queue=0)
+        await admission.acquire()
+        await admission.acquire()
+        assert admission.inflight == 2
+        with pytest.raises(Overloaded):
+            await admission.acquire()
+        admission.release(0.05)
+        await admission.acquire()
+        assert admission.shed == 1
+    run(main())
+
+
+def test_queued_requests_get_freed_slots_in_order():
+    async def main():
+        admission = AdmissionController(max_concurrency=1, max_queue=2)
+        await admission.acquire()
+        order = []
+
+        async def queued(name):
+            await admission.acquire()
+            order.append(name)
+        waiters = [asyncio.ensure_future(queued(name)) for name in ('first', 'second')]
+        await asyncio.sleep(0)
+        assert admission.queued == 2
+        admission.release(0.05)
+        await asyncio.sleep(0)
+        admission.release(0.05)
+        await asyncio.gather(*waiters)
+        assert order == ['first', 'second']
+        # The slot went from one holder to the next, never freed in between
+        assert admission.inflight == 1
+    run(main())
+
+
+def test_a_full_queue_sheds_with_a_retry_after():
+    async def main():
+        admission = AdmissionController(max_concurrency=1, max_queue=1)
+        admission.service_time = 3.0
+        await admission.acquire()
+        waiter = asyncio.ensure_future(admission.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as shed:
+            await admission.acquire()
+        # Two requests' worth of backlog at 3s each
+        assert shed.value.retry_after == 6
+        waiter.cancel()
+    run(main())
+
+
+def test_waiting_too_long_sheds_and_the_slot_skips_the_timed_out_waiter():
+    async def main():
+        admission = AdmissionController(max_concurrency=1, max_queue=1, max_wait=0.01)
+        await admission.acquire()
+        with pytest.raises(Overloaded):
+            await admission.acquire()
+        assert admission.queued == 0
+        admission.release(0.05)
+        assert admission.inflight == 0
+    run(main())
+
+
+def test_a_cancelled_waiter_passes_its_slot_on():
+    async def main():
+        admission = AdmissionController(max_concurrency=1, max_queue=2)
+        await admission.acquire()
+        first = asyncio.ensure_future(admission.acquire())
+        second = asyncio.ensure_future(admission.acquire())
+        await asyncio.sleep(0)
+        # The slot is handed to `first`, which is cancelled before it runs
+        admission.release(0.05)
+        first.cancel()
+        await second
+        assert admission.inflight == 1 and admission.queued == 0
+    run(main())
+
+
+def test_status_answers_503_with_retry_after_when_shedding(monkeypatch):
+    monkeypatch.setattr(async_backend, 'admission', AdmissionController(max_concurrency=1, max_queue=0))
+
+    async def main():
+        async with TestClient(TestServer(async_backend.create_app())) as client:
+            responses = await asyncio.gather(*(client.get('/status') for _ in range(2)))
+            statuses = sorted(response.status for response in responses)
+            shed = [response for response in responses if response.status == 503][0]
+            return statuses, shed.headers['Retry-After'], await shed.json()
+    statuses, retry_after, payload = run(main())
+    assert statuses == [200, 503]
+    assert int(retry_after) >= 1
+    assert payload['error'] == 'overloaded'
@@ -0,0 +1,264 @@
+# cost.py
+#
+# Cross-zone transfer cost from the traffic the client pods measured, as
+# zone x zone numpy arrays, with what-if predictions for other replica
+# layouts.
+import json
+import threading
+
+import numpy as np
+
+GIB = 1024 ** 3
+TRAFFIC_FIELDS = ('requests', 'request_bytes', 'response_bytes')
+
+
+def traffic_from_metrics(all_metrics):
+    """{(client zone, backend zone): [requests, request bytes, response bytes]}
+    summed over /metrics payloads"""
+    traffic = {}
+    for metrics in all_metrics:
+        for client_zone, backends in metrics.get('by_zone_pair', {}).items():
+            for backend_zone, count in backends.items():
+                traffic.setdefault((client_zone, backend_zone), [0, 0, 0])[0] += count
+        for client_zone, backends in metrics.get('bytes_by_zone_pair', {}).items():
+            for backend_zone, sizes in backends.items():
+                pair = traffic.setdefault((client_zone, backend_zone), [0, 0, 0])
+                pair[1] += sizes.get('request', 0)
+                pair[2] += sizes.get('response', 0)
+    return traffic
+
+
+def traffic_from_counters(totals):
+    """The same from pushed counters named traffic|<client zone>|<backend zone>|<field>"""
+    traffic = {}
+    for name, value in totals.items():
+        if not name.startswith('traffic|'):
+            continue
+        parts = name.split('|')
+        if len(parts) != 4 or parts[3] not in TRAFFIC_FIELDS:
+            continue
+        traffic.setdefault((parts[1], parts[2]), [0, 0, 0])[TRAFFIC_FIELDS.index(parts[3])] += value
+    return traffic
+
+
+def load_pair_prices(path):
+    """{(source zone, destination zone): $/GiB} from a JSON file of
+    {"source zone": {"destination zone": price}}"""
+    if not path:
+        return {}
+    with open(path) as f:
+        table = json.load(f)
+    return {(source, destination): float(price)
+            for source, destinations in table.items() for destination, price in destinations.items()}
+
+
+# Both routing models send a client zone's requests as diag(keep) + outer(spill, to):
+# `keep` is the fraction a zone serves locally, `spill` the fraction it sends
+# out and `to` how the spilled requests split over the backend zones. Pricing
+# that form takes matrix-vector products, never a (zones, zones) array per
+# scenario.
+
+def random_allocation(backends):
+    """Topology-unaware routing: every client zone spreads its requests over
+    the backend zones in proportion to their replicas"""
+    total = backends.sum(-1, keepdims=True)
+    share = np.divide(backends, total, out=np.zeros_like(backends), where=total > 0)
+    return np.zeros_like(share), np.ones_like(share), share
+
+
+def weighted_allocation(demand, backends):
+    """Capacity-proportional zone-aware routing, the topology hints allocation:
+    a zone serves its own demand up to its share of the backends and the
+    deficit spills to zones with spare capacity, in proportion to that spare"""
+    demand_total = demand.sum(-1, keepdims=True)
+    backend_total = backends.sum(-1, keepdims=True)
+    d = np.divide(demand, demand_total, out=np.zeros_like(demand), where=demand_total > 0)
+    c = np.divide(backends, backend_total, out=np.zeros_like(backends), where=backend_total > 0)
+    local = np.minimum(d, c)
+    deficit = d - local
+    spare = c - local
+    spare_total = spare.sum(-1, keepdims=True)
+    spare_share = np.divide(spare, spare_total, out=np.zeros_like(spare), where=spare_total > 0)
+    # As fractions of each zone's own demand
+    keep = np.divide(local, d, out=np.zeros_like(d), where=d > 0)
+    spill = np.divide(deficit, d, out=np.zeros_like(d), where=d > 0)
+    return keep, spill, spare_share
+
+
+def cross_zone(allocation, per_zone):
+    """How much of `per_zone` (anything a client zone sends) leaves its zone"""
+    _, spill, to = allocation
+    return (per_zone * spill * (to.sum(-1, keepdims=True) - to)).sum(-1)
+
+
+class CostEngine:
+    """Zone x zone traffic, prices and cost predictions.
+
+    Zones get an index the first time they are seen. Traffic is kept
+    oriented by sender: requests[c, b] counts requests from clients in zone
+    c to backends in zone b, sent[c, b] the request bytes going c -> b and
+    received[c, b] the response bytes coming back b -> c. prices[i, j] is
+    the $/GiB of data going from zone i to zone j.
+
+    The baseline is topology-unaware routing over the current backend
+    replicas. What-ifs swap in other replica counts and price the measured
+    demand under both topology-unaware and zone-aware routing; a batch of
+    scenarios is evaluated as (scenarios, zones) arrays in one pass.
+    """
+
+    def __init__(self, cross_zone_per_gb=0.01, same_zone_per_gb=0.0, pair_prices=None):
+        self.cross_zone_per_gb = cross_zone_per_gb
+        self.same_zone_per_gb = same_zone_per_gb
+        self.pair_prices = dict(pair_prices or {})
+        self._lock = threading.Lock()
+        self.zones = []
+        self._index = {}
+        self.requests = np.zeros((0, 0))
+        self.sent = np.zeros((0, 0))
+        self.received = np.zeros((0, 0))
+        self.prices = np.zeros((0, 0))
+        self.backends = np.zeros(0)
+        self.clients = np.zeros(0)
+
+    def _add_zones(self, zones):
+        # Called with the lock held
+        new = sorted(zone for zone in set(zones) if zone not in self._index)
+        if not new:
+            return
+        for zone in new:
+            self._index[zone] = len(self.zones)
+            self.zones.append(zone)
+        grow = len(new)
+        for name in ('requests', 'sent', 'received'):
+            setattr(self, name, np.pad(getattr(self, name), ((0, grow), (0, grow))))
+        self.backends = np.pad(self.backends, (0, grow))
+        self.clients = np.pad(self.clients, (0, grow))
+        self.prices = self._price_matrix(self._index)
+
+    def _price_matrix(self, index):
+        prices = np.full((len(index), len(index)), self.cross_zone_per_gb)
+        np.fill_diagonal(prices, self.same_zone_per_gb)
+        for (source, destination), price in self.pair_prices.items():
+            if source in index and destination in index:
+                prices[index[source], index[destination]] = price
+        return prices
+
+    def _vector(self, counts_by_zone, index=None):
+        index = self._index if index is None else index
+        vector = np.zeros(len(index))
+        for zone, count in counts_by_zone.items():
+            vector[index[zone]] = count
+        return vector
+
+    def update(self, traffic, backends_by_zone=None, clients_by_zone=None):
+        """Replace the traffic with the cumulative `traffic` of traffic_from_*()
+        and, when given, the replicas per zone"""
+        with self._lock:
+            self._add_zones([zone for pair in traffic for zone in pair]
+                            + list(backends_by_zone or ()) + list(clients_by_zone or ()))
+            n = len(self.zones)
+            requests, sent, received = np.zeros((n, n)), np.zeros((n, n)), np.zeros((n, n))
+            if traffic:
+                rows = np.fromiter((self._index[c] for c, _ in traffic), dtype=np.intp, count=len(traffic))
+                cols = np.fromiter((self._index[b] for _, b in traffic), dtype=np.intp, count=len(traffic))
+                values = np.array(list(traffic.values()), dtype=float)
+                requests[rows, cols] = values[:, 0]
+                sent[rows, cols] = values[:, 1]
+                received[rows, cols] = values[:, 2]
+            self.requests, self.sent, self.received = requests, sent, received
+            if backends_by_zone is not None:
+                self.backends = self._vector(backends_by_zone)
+            if clients_by_zone is not None:
+                self.clients = self._vector(clients_by_zone)
+
+    def _price(self, allocation, sent_by_zone, received_by_zone, prices=None):
+        """(cost in $, cross-zone GiB, served fraction) of routing each client
+        zone's bytes by `allocation`"""
+        prices = self.prices if prices is None else prices
+        keep, spill, to = allocation
+        total = sent_by_zone + received_by_zone
+        # Request bytes flow c -> b at prices[c, b], responses b -> c at prices[b, c]
+        cost = ((total * keep * np.diagonal(prices)).sum(-1)
+                + (sent_by_zone * spill * (to @ prices.T)).sum(-1)
+                + (received_by_zone * spill * (to @ prices)).sum(-1))
+        cross = cross_zone(allocation, total)
+        demand = total.sum(-1)
+        served = (total * (keep + spill * to.sum(-1, keepdims=True))).sum(-1)
+        served = np.divide(served, demand, out=np.ones_like(served), where=demand > 0)
+        return cost / GIB, cross / GIB, served
+
+    def summary(self):
+        """Measured cost, and what topology-unaware routing would have cost"""
+        with self._lock:
+            off_diagonal = 1 - np.eye(len(self.zones))
+            cost = float((self.sent * self.prices).sum() + (self.received * self.prices.T).sum()) / GIB
+            cross_gb = float(((self.sent + self.received) * off_diagonal).sum()) / GIB
+            baseline = random_allocation(self.backends)
+            baseline_cost, baseline_gb, _ = self._price(baseline, self.sent.sum(1), self.received.sum(1))
+            baseline_requests = cross_zone(baseline, self.requests.sum(1))
+            cross_requests = float((self.requests * off_diagonal).sum())
+            return {
+                'transfer_gb': float(self.sent.sum() + self.received.sum()) / GIB,
+                'estimated_data_transfer_gb': cross_gb,
+                'estimated_cost_usd': cost,
+                'baseline_cross_zone_requests': float(baseline_requests),
+                'baseline_data_transfer_gb': float(baseline_gb),
+                'baseline_cost_usd': float(baseline_cost),
+                'saved_cross_zone_requests': float(baseline_requests) - cross_requests,
+                'saved_data_gb': float(baseline_gb) - cross_gb,
+                'saved_cost_usd': float(baseline_cost) - cost,
+            }
+
+    def matrix(self):
+        """Zones, bytes sent from zone i to zone j, prices and cost per pair"""
+        with self._lock:
+            flows = self.sent + self.received.T
+            return {
+                'zones': list(self.zones),
+                'bytes': flows.tolist(),
+                'price_per_gb': self.prices.tolist(),
+                'cost_usd': (flows * self.prices / GIB).tolist(),
+                'requests': self.requests.tolist(),
+                'backends': self.backends.tolist(),
+                'clients': self.clients.tolist(),
+            }
+
+    def what_if(self, scenarios):
+        """Price the measured demand under each scenario's replica counts.
+
+        A scenario is {"backends": {zone: n}} with an optional "clients":
+        {zone: n}, which moves the demand in proportion to the clients (each
+        client pod sending as much as the average one does now). Zones the
+        engine hasn't seen are priced on padded copies and not remembered.
+        """
+        with self._lock:
+            new = sorted({zone for scenario in scenarios for key in ('backends', 'clients')
+                          for zone in scenario.get(key) or {}} - set(self._index))
+            zones = self.zones + new
+            index = dict(self._index, **{zone: len(self.zones) + i for i, zone in enumerate(new)})
+            prices = self._price_matrix(index) if new else self.prices
+            current = np.pad(self.backends, (0, len(new)))
+            backends = np.array([self._vector(s['backends'], index) if s.get('backends') is not None else current
+                                 for s in scenarios]).reshape(len(scenarios), len(zones))
+            sent = np.pad(self.sent.sum(1), (0, len(new)))
+            received = np.pad(self.received.sum(1), (0, len(new)))
+            sent_by_zone = np.tile(sent, (len(scenarios), 1))
+            received_by_zone = np.tile(received, (len(scenarios), 1))
+            for i, scenario in enumerate(scenarios):
+                if scenario.get('clients'):
+                    clients = self._vector(scenario['clients'], index)
+                    share = clients / clients.sum() if clients.sum() > 0 else clients
+                    sent_by_zone[i] = sent.sum() * share
+                    received_by_zone[i] = received.sum() * share
+            demand = sent_by_zone + received_by_zone
+
+            results = {name: self._price(allocation, sent_by_zone, received_by_zone, prices)
+                       for name, allocation in (('random', random_allocation(backends)),
+                                                ('zone-weighted', weighted_allocation(demand, backends)))}
+            return [{
+                'backends': dict(zip(zones, backends[i].tolist())),
+                # unserved_fraction: demand with no backend to go to, in a scenario without any
+                **{name: {'cost_usd': float(cost[i]), 'cross_zone_gb': float(cross_gb[i]),
+                          'unserved_fraction': 1 - float(served[i])}
+                   for name, (cost, cross_gb, served) in results.items()}
+            } for i in range(len(scenarios))]
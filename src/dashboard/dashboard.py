@@ -3,34 +3,195 @@ import os
 import requests
 import time
 import json
-from flask import Flask, render_template, jsonify
-from kubernetes import client, config
+import threading
+from flask import Flask, Response, render_template, jsonify, request
+
+from cost import CostEngine, load_pair_prices, traffic_from_counters, traffic_from_metrics
+from ingest import IngestAggregator
+from loadgen import LoadEngine, TooManyJobs
+from profiling import (ProfilerBusy, SamplingProfiler, StageHistograms, StageTimer, profile_params,
+                       prometheus_lines, stage_summary)
+from scraper import MetricsScraper
+from startup import LazyApi, in_cluster
+from stream import Broadcaster
+from topology import TopologySnapshot
+from timeseries import CounterAccumulator, TimeSeriesStore
 
 app = Flask(__name__)
 
-# Try to load Kubernetes config
-try:
-    config.load_incluster_config()
-    kube_client = client.CoreV1Api()
-    IN_CLUSTER = True
-except:
-    IN_CLUSTER = False
+# The kubernetes client is only imported once something calls the API
+IN_CLUSTER = in_cluster()
+if not IN_CLUSTER:
     print("Not running in Kubernetes cluster")
+kube_client = LazyApi("CoreV1Api")
+
+# Client pods are scraped in parallel, each with its own timeout and all
+# of them within a global deadline
+scraper = MetricsScraper(
+    max_workers=int(os.environ.get("SCRAPE_WORKERS", "32")),
+    timeout=float(os.environ.get("SCRAPE_TIMEOUT", "2")),
+    deadline=float(os.environ.get("SCRAPE_DEADLINE", "3"))
+)
+
+# Zones and pods per zone, from one node list and one pod list per app at
+# most every ZONE_REFRESH_INTERVAL seconds, however many callers there are
+ZONE_REFRESH_INTERVAL = float(os.environ.get("ZONE_REFRESH_INTERVAL", "5"))
+topology = None
+if IN_CLUSTER:
+    topology = TopologySnapshot(kube_client, ('client-service', 'backend-service'),
+                                ttl=ZONE_REFRESH_INTERVAL)
 
 def get_client_pods():
     """Get all client service pods"""
     if not IN_CLUSTER:
         return ["mock-client-1", "mock-client-2", "mock-client-3"]
     
-    try:
-        pods = kube_client.list_namespaced_pod(
-            namespace="default",
-            label_selector="app=client-service"
-        )
-        return [pod.status.pod_ip for pod in pods.items if pod.status.pod_ip]
-    except Exception as e:
-        print(f"Exception when calling CoreV1Api: {e}")
-        return []
+    return topology.pod_ips('client-service')
+
+# "pull" scrapes every client pod's /metrics, "push" has the client pods
+# send counter deltas to /ingest so refreshing costs the same at any fleet size
+METRICS_SOURCE = os.environ.get("METRICS_SOURCE", "pull")
+ingest = IngestAggregator(expiry=float(os.environ.get("REPORTER_EXPIRY", "30")))
+
+# Background collection: every SCRAPE_INTERVAL seconds client pods are
+# scraped (or pushed reports expired), counters folded into fleet totals
+# and kept as history
+SCRAPE_INTERVAL = float(os.environ.get("SCRAPE_INTERVAL", "1"))
+HISTORY_SERIES = ('total_requests', 'same_zone_requests', 'cross_zone_requests',
+                  'failed_requests', 'hedged_requests')
+counter_totals = CounterAccumulator(HISTORY_SERIES)
+history = TimeSeriesStore(HISTORY_SERIES)
+latest_scrape = {'results': None, 'time': None}
+collector_lock = threading.Lock()
+collector_thread = None
+
+# Cross-zone transfer pricing in $ per GiB: CROSS_ZONE_COST_PER_GB between two
+# zones, SAME_ZONE_COST_PER_GB within one, and per (source, destination) pair
+# overrides from ZONE_PRICING_FILE ({"source zone": {"destination zone": price}})
+cost_engine = CostEngine(
+    cross_zone_per_gb=float(os.environ.get("CROSS_ZONE_COST_PER_GB", "0.01")),
+    same_zone_per_gb=float(os.environ.get("SAME_ZONE_COST_PER_GB", "0")),
+    pair_prices=load_pair_prices(os.environ.get("ZONE_PRICING_FILE"))
+)
+COST_MAX_SCENARIOS = int(os.environ.get("COST_MAX_SCENARIOS", "1000"))
+
+# Live updates: the collector computes one snapshot per scrape and the
+# broadcaster pushes the changes to every /stream viewer
+broadcaster = Broadcaster(max_queue=int(os.environ.get("STREAM_QUEUE_SIZE", "16")))
+
+# Where each collection cycle spends its time, per stage, and /debug/profile
+# sampling (idle until called, at most PROFILE_MAX_SECONDS per call)
+stage_histograms = StageHistograms()
+stages = StageTimer(stage_histograms)
+profiler = SamplingProfiler(max_seconds=float(os.environ.get("PROFILE_MAX_SECONDS", "60")))
+
+def collect_pushed_metrics():
+    """Record the fleet totals from the reports pushed to /ingest"""
+    now = time.time()
+    with stages('fold'):
+        active_reporters = ingest.expire(now)
+        totals, _ = ingest.snapshot()
+        with collector_lock:
+            history.append(now, {name: totals.get(name, 0) for name in HISTORY_SERIES})
+    
+    summary = summarize_totals(totals, traffic_from_counters(totals))
+    summary['reporters'] = active_reporters
+    publish_snapshot(now, summary, totals, {})
+
+def collect_metrics():
+    """Scrape every client pod once and record the fleet totals"""
+    with stages('discovery'):
+        client_pods = get_client_pods()
+    with stages('scrape'):
+        scrape_results = scraper.scrape(client_pods)
+    for r in scrape_results:
+        if r['status'] != 'ok':
+            print(f"Error fetching metrics from {r['pod_ip']}: {r['status']} {r['error'] or ''}")
+    
+    reports = {r['pod_ip']: r['data']['metrics'] for r in scrape_results
+               if r['status'] == 'ok' and 'metrics' in r['data']}
+    now = time.time()
+    with stages('fold'), collector_lock:
+        totals = counter_totals.update(reports, known_pods=client_pods)
+        history.append(now, totals)
+        latest_scrape['results'] = scrape_results
+        latest_scrape['time'] = now
+    
+    publish_snapshot(now, summarize_metrics(scrape_results), totals,
+                     {r['pod_ip']: r['status'] for r in scrape_results})
+    return scrape_results
+
+def publish_snapshot(now, summary, totals, scrape):
+    """Send the latest state to the /stream viewers"""
+    with stages('topology'):
+        zones = get_zone_info()
+    with stages('publish'):
+        broadcaster.publish({
+            'time': now,
+            'summary': summary,
+            'totals': totals,
+            'zones': zones,
+            'scrape': scrape
+        })
+
+def collector_loop():
+    while True:
+        started = time.monotonic()
+        try:
+            if METRICS_SOURCE == "push":
+                collect_pushed_metrics()
+            else:
+                collect_metrics()
+        except Exception as e:
+            print(f"Error collecting metrics: {e}")
+        time.sleep(max(0, SCRAPE_INTERVAL - (time.monotonic() - started)))
+
+def start_collector():
+    global collector_thread
+    with collector_lock:
+        if collector_thread is None:
+            collector_thread = threading.Thread(target=collector_loop, name="collector", daemon=True)
+            collector_thread.start()
+
+def update_cost_engine(traffic):
+    """Load the measured zone pair traffic and the current replicas per zone"""
+    pods = get_zone_info().get('pods')
+    if pods is None:
+        # The topology snapshot is an {'error': ...}: keep the last known replicas
+        cost_engine.update(traffic)
+        return
+    cost_engine.update(traffic, pods.get('backend-service', {}), pods.get('client-service', {}))
+
+def summarize_totals(totals, traffic):
+    """Same/cross-zone split from fleet-wide request counts, costs from the
+    measured bytes per zone pair"""
+    total_same_zone_requests = totals.get('same_zone_requests', 0)
+    total_cross_zone_requests = totals.get('cross_zone_requests', 0)
+    total_requests = totals.get('total_requests', 0)
+    
+    # Savings are against topology-unaware routing over the same backend replicas
+    with stages('cost'):
+        update_cost_engine(traffic)
+        cost_summary = cost_engine.summary()
+    summary = {
+        'total_same_zone_requests': total_same_zone_requests,
+        'total_cross_zone_requests': total_cross_zone_requests,
+        'total_requests': total_requests,
+        'same_zone_percentage': (total_same_zone_requests / total_requests * 100) if total_requests > 0 else 0
+    }
+    summary.update(cost_summary)
+    return summary
+
+def summarize_metrics(scrape_results):
+    """Aggregate statistics over the pods that answered a scrape"""
+    all_metrics = [r['data']['metrics'] for r in scrape_results
+                   if r['status'] == 'ok' and 'metrics' in r['data']]
+    names = ('same_zone_requests', 'cross_zone_requests', 'total_requests')
+    summary = summarize_totals({name: sum(m[name] for m in all_metrics) for name in names},
+                               traffic_from_metrics(all_metrics))
+    summary['pods_scraped'] = len(all_metrics)
+    summary['pods_failed'] = len(scrape_results) - len(all_metrics)
+    return summary
 
 @app.route('/')
 def dashboard():
@@ -38,117 +199,262 @@ def dashboard():
 
 @app.route('/aggregate-metrics')
 def aggregate_metrics():
-    all_metrics = []
-    client_pods = get_client_pods()
+    start_collector()
     
-    for client_ip in client_pods:
+    # Incremental mode: only deltas and rates since the caller's last poll
+    if 'since' in request.args:
         try:
-            response = requests.get(f"http://{client_ip}:8080/metrics", timeout=2)
-            if response.status_code == 200:
-                all_metrics.append(response.json())
-        except Exception as e:
-            print(f"Error fetching metrics from {client_ip}: {e}")
-    
-    # Calculate aggregate statistics
-    total_same_zone_requests = sum(m['metrics']['same_zone_requests'] for m in all_metrics if 'metrics' in m)
-    total_cross_zone_requests = sum(m['metrics']['cross_zone_requests'] for m in all_metrics if 'metrics' in m)
-    total_requests = sum(m['metrics']['total_requests'] for m in all_metrics if 'metrics' in m)
+            since = float(request.args['since'])
+            step = float(request.args.get('step', SCRAPE_INTERVAL))
+        except ValueError:
+            return jsonify({'error': 'since and step must be numbers'}), 400
+        if METRICS_SOURCE == "push":
+            # counter_totals only folds scrapes, pushed totals live in the ingest store
+            pushed, _ = ingest.snapshot()
+            totals = {name: pushed.get(name, 0) for name in HISTORY_SERIES}
+        else:
+            with collector_lock:
+                totals = dict(counter_totals.totals)
+        result = history.query(since, max(step, 0.001), time.time())
+        result['totals'] = totals
+        result['latest'] = history.latest_time
+        return jsonify(result)
     
-    # Calculate potential cost savings
-    # Assume cost of cross-AZ traffic is $0.01 per GB and average request is 10KB
-    cross_az_data_gb = (total_cross_zone_requests * 10) / 1024 / 1024
-    potential_cost = cross_az_data_gb * 0.01
+    if METRICS_SOURCE == "push":
+        now = time.time()
+        totals, active_reporters = ingest.snapshot()
+        summary = summarize_totals(totals, traffic_from_counters(totals))
+        summary['reporters'] = active_reporters
+        return jsonify({'raw_metrics': ingest.reporters(now), 'summary': summary})
     
-    # Calculate savings from zone-aware routing
-    baseline_cross_az = total_requests * 0.66  # Assuming 66% would be cross-zone without optimization
-    actual_cross_az = total_cross_zone_requests
-    saved_cross_az = baseline_cross_az - actual_cross_az
-    saved_data_gb = (saved_cross_az * 10) / 1024 / 1024
-    saved_cost = saved_data_gb * 0.01
+    # Full snapshot, served from the latest background scrape
+    scrape_results = latest_scrape['results']
+    if scrape_results is None:
+        scrape_results = collect_metrics()
+    all_metrics = [r['data'] for r in scrape_results if r['status'] == 'ok']
     
     return jsonify({
         'raw_metrics': all_metrics,
-        'summary': {
-            'total_same_zone_requests': total_same_zone_requests,
-            'total_cross_zone_requests': total_cross_zone_requests,
-            'total_requests': total_requests,
-            'same_zone_percentage': (total_same_zone_requests / total_requests * 100) if total_requests > 0 else 0,
-            'estimated_data_transfer_gb': cross_az_data_gb,
-            'estimated_cost_usd': potential_cost,
-            'baseline_cross_zone_requests': baseline_cross_az,
-            'saved_cross_zone_requests': saved_cross_az,
-            'saved_data_gb': saved_data_gb,
-            'saved_cost_usd': saved_cost
-        }
+        # Per-pod scrape outcome, so partial results are visible as such
+        'scrape': [{k: r[k] for k in ('pod_ip', 'status', 'latency_ms', 'error')} for r in scrape_results],
+        'summary': summarize_metrics(scrape_results)
     })
 
-@app.route('/zones')
-def zones():
+@app.route('/cost')
+def cost():
+    """Zone x zone bytes, prices and costs behind the summary"""
+    start_collector()
+    return jsonify({'summary': cost_engine.summary(), **cost_engine.matrix()})
+
+def parse_replicas(value):
+    """{zone: replica count} from a request, None if malformed"""
+    if not isinstance(value, dict):
+        return None
+    if not all(isinstance(zone, str) and isinstance(count, (int, float)) and count >= 0
+               for zone, count in value.items()):
+        return None
+    return value
+
+@app.route('/cost/what-if', methods=['POST'])
+def cost_what_if():
+    """Price the measured traffic under other replica layouts, e.g.
+    {"backends": {"zone-a": 3, "zone-b": 1}} or {"scenarios": [...]}"""
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({'error': 'expected a JSON object'}), 400
+    scenarios = body['scenarios'] if 'scenarios' in body else [body]
+    if not isinstance(scenarios, list) or not 0 < len(scenarios) <= COST_MAX_SCENARIOS:
+        return jsonify({'error': f'scenarios must be a list of 1 to {COST_MAX_SCENARIOS}'}), 400
+    parsed = []
+    for scenario in scenarios:
+        if not isinstance(scenario, dict):
+            return jsonify({'error': 'each scenario must be a JSON object'}), 400
+        entry = {}
+        for key in ('backends', 'clients'):
+            if scenario.get(key) is not None:
+                entry[key] = parse_replicas(scenario[key])
+                if entry[key] is None:
+                    return jsonify({'error': f'{key} must map zones to non-negative counts'}), 400
+        parsed.append(entry)
+    
+    start_collector()
+    return jsonify({'current': cost_engine.summary(), 'scenarios': cost_engine.what_if(parsed)})
+
+@app.route('/ingest', methods=['POST'])
+def ingest_metrics():
+    """Accept a batch of counter deltas pushed by a client pod"""
+    report = request.get_json(silent=True)
+    if not isinstance(report, dict):
+        return jsonify({'error': 'expected a JSON object'}), 400
+    reporter = report.get('reporter')
+    seq = report.get('seq')
+    deltas = report.get('deltas', {})
+    meta = report.get('meta') or {}
+    if (not isinstance(reporter, str) or not isinstance(seq, int) or not isinstance(deltas, dict)
+            or not isinstance(meta, dict)
+            or not all(isinstance(v, (int, float)) for v in deltas.values())):
+        return jsonify({'error': 'reporter, seq and numeric deltas are required'}), 400
+    
+    start_collector()
+    applied = ingest.apply(reporter, seq, deltas, meta, time.time())
+    return jsonify({'applied': applied})
+
+@app.route('/stream')
+def stream():
+    """Server-sent events: a full snapshot on connect, then diffs"""
+    start_collector()
+    response = Response(broadcaster.events(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/metrics/prometheus')
+def prometheus():
+    """Dashboard scrape timings in Prometheus text format"""
+    stream_stats = broadcaster.stats()
+    lines = scraper.prometheus_lines() + prometheus_lines(
+        'dashboard_stage_seconds', 'Time spent per collection stage',
+        stage_histograms.collect(), stage_histograms.buckets) + [
+        '# HELP dashboard_stream_subscribers Connected /stream viewers',
+        '# TYPE dashboard_stream_subscribers gauge',
+        f'dashboard_stream_subscribers {stream_stats["subscribers"]}',
+        '# HELP dashboard_stream_dropped_total Viewers dropped for falling behind',
+        '# TYPE dashboard_stream_dropped_total counter',
+        f'dashboard_stream_dropped_total {stream_stats["dropped"]}',
+    ]
+    ingest_stats = ingest.stats()
+    lines += [
+        '# HELP dashboard_ingest_reporters Client pods that pushed metrics recently',
+        '# TYPE dashboard_ingest_reporters gauge',
+        f'dashboard_ingest_reporters {ingest_stats["reporters"]}',
+        '# HELP dashboard_ingest_reports_total Pushed reports applied',
+        '# TYPE dashboard_ingest_reports_total counter',
+        f'dashboard_ingest_reports_total {ingest_stats["reports"]}',
+        '# HELP dashboard_ingest_duplicates_total Resent reports that were already applied',
+        '# TYPE dashboard_ingest_duplicates_total counter',
+        f'dashboard_ingest_duplicates_total {ingest_stats["duplicates"]}',
+        '# HELP dashboard_ingest_expired_total Reporters forgotten after going quiet',
+        '# TYPE dashboard_ingest_expired_total counter',
+        f'dashboard_ingest_expired_total {ingest_stats["expired"]}',
+    ]
+    if topology:
+        topology_stats = topology.stats()
+        lines += [
+            '# HELP dashboard_topology_refreshes_total Zone/pod topology reloads from the API',
+            '# TYPE dashboard_topology_refreshes_total counter',
+            f'dashboard_topology_refreshes_total {topology_stats["refreshes"]}',
+            '# HELP dashboard_topology_errors_total Failed topology reloads',
+            '# TYPE dashboard_topology_errors_total counter',
+            f'dashboard_topology_errors_total {topology_stats["errors"]}',
+        ]
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+@app.route('/debug/stages')
+def debug_stages():
+    return jsonify({'stages': stage_summary(stage_histograms.collect(), stage_histograms.buckets)})
+
+@app.route('/debug/profile')
+def debug_profile():
+    """Sample every thread for ?seconds=N and return collapsed stacks"""
+    try:
+        seconds, interval = profile_params(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        text, samples = profiler.profile(seconds, interval)
+    except ProfilerBusy:
+        return jsonify({'error': 'a profile is already running'}), 409
+    return Response(text, mimetype='text/plain', headers={'X-Profile-Samples': str(samples)})
+
+def get_zone_info():
     """Get information about zones and pods"""
     if not IN_CLUSTER:
-        return jsonify({
+        return {
             'zones': ['EU-FRANKFURT-1-AD-1', 'EU-FRANKFURT-1-AD-2', 'EU-FRANKFURT-1-AD-3'],
             'pods': {
-                'client': {'EU-FRANKFURT-1-AD-1': 1, 'EU-FRANKFURT-1-AD-2': 1, 'EU-FRANKFURT-1-AD-3': 1},
-                'backend': {'EU-FRANKFURT-1-AD-1': 1, 'EU-FRANKFURT-1-AD-2': 1, 'EU-FRANKFURT-1-AD-3': 1}
+                'client-service': {'EU-FRANKFURT-1-AD-1': 1, 'EU-FRANKFURT-1-AD-2': 1, 'EU-FRANKFURT-1-AD-3': 1},
+                'backend-service': {'EU-FRANKFURT-1-AD-1': 1, 'EU-FRANKFURT-1-AD-2': 1, 'EU-FRANKFURT-1-AD-3': 1}
             }
-        })
+        }
     
-    try:
-        # Get nodes by zone
-        nodes = kube_client.list_node()
-        zones = {}
-        for node in nodes.items:
-            zone = node.metadata.labels.get('topology.kubernetes.io/zone')
-            if zone:
-                if zone not in zones:
-                    zones[zone] = []
-                zones[zone].append(node.metadata.name)
-        
-        # Get pods by app and zone
-        pods = {}
-        for app in ['client-service', 'backend-service']:
-            app_pods = kube_client.list_namespaced_pod(
-                namespace="default",
-                label_selector=f"app={app}"
-            )
-            
-            app_pods_by_zone = {}
-            for pod in app_pods.items:
-                pod_node_name = pod.spec.node_name
-                if pod_node_name:
-                    node = kube_client.read_node(pod_node_name)
-                    pod_zone = node.metadata.labels.get('topology.kubernetes.io/zone')
-                    
-                    if pod_zone not in app_pods_by_zone:
-                        app_pods_by_zone[pod_zone] = 0
-                    app_pods_by_zone[pod_zone] += 1
-            
-            pods[app] = app_pods_by_zone
-        
-        return jsonify({
-            'zones': list(zones.keys()),
-            'pods': pods
-        })
-    except Exception as e:
-        print(f"Exception when calling Kubernetes API: {e}")
-        return jsonify({'error': str(e)})
+    # Served from the cached snapshot, no API call unless it has expired
+    return topology.get()
+
+@app.route('/ready')
+def ready():
+    """Ready once the zone topology has been loaded by the collector"""
+    start_collector()
+    is_ready = not IN_CLUSTER or topology.refreshes > 0
+    return jsonify({'ready': is_ready}), 200 if is_ready else 503
+
+@app.route('/zones')
+def zones():
+    return jsonify(get_zone_info())
+
+# Load runs from inside the cluster, each a background job with its own id.
+# Beyond LOAD_MAX_RUNNING jobs at once, /trigger-load answers 429.
+load_engine = LoadEngine(max_jobs=int(os.environ.get("LOAD_MAX_JOBS", "20")),
+                         max_running=int(os.environ.get("LOAD_MAX_RUNNING", "2")))
+LOAD_MAX_RPS = float(os.environ.get("LOAD_MAX_RPS", "1000"))
+LOAD_MAX_CONCURRENCY = int(os.environ.get("LOAD_MAX_CONCURRENCY", "200"))
+LOAD_MAX_DURATION = float(os.environ.get("LOAD_MAX_DURATION", "600"))
 
-@app.route('/trigger-load')
+@app.route('/trigger-load', methods=['GET', 'POST'])
 def trigger_load():
-    """Trigger some load on the client services"""
-    results = []
-    client_pods = get_client_pods()
+    """Start a load job against the client services.
+
+    Parameters (query string or JSON body): rps for an open-loop run at a
+    fixed rate, otherwise concurrency workers send back to back; the run
+    stops after duration seconds or count requests. keys spreads the
+    requests over that many affinity keys.
+    """
+    params = dict(request.args)
+    if request.is_json:
+        params.update(request.get_json(silent=True) or {})
+    try:
+        rps = float(params['rps']) if params.get('rps') else None
+        concurrency = int(params.get('concurrency', 10))
+        duration = float(params['duration']) if params.get('duration') else None
+        count = int(params['count']) if params.get('count') else None
+        keys = int(params['keys']) if params.get('keys') else None
+    except (TypeError, ValueError):
+        return jsonify({'error': 'rps, concurrency, duration, count and keys must be numbers'}), 400
+    if ((rps is not None and not 0 < rps <= LOAD_MAX_RPS)
+            or not 0 < concurrency <= LOAD_MAX_CONCURRENCY
+            or (duration is not None and not 0 < duration <= LOAD_MAX_DURATION)
+            or (count is not None and count <= 0) or (keys is not None and keys <= 0)):
+        return jsonify({'error': f'limits: 0 < rps <= {LOAD_MAX_RPS}, 0 < concurrency <= {LOAD_MAX_CONCURRENCY}, '
+                                 f'0 < duration <= {LOAD_MAX_DURATION}, count > 0, keys > 0'}), 400
     
-    for client_ip in client_pods:
-        try:
-            response = requests.get(f"http://{client_ip}:8080/make-request", timeout=2)
-            if response.status_code == 200:
-                results.append(response.json())
-        except Exception as e:
-            results.append({"error": str(e), "client": client_ip})
+    client_pods = get_client_pods()
+    if count is None and duration is None:
+        # One request per client pod, like a single click used to send
+        count = len(client_pods)
+    if duration is None and rps is None:
+        duration = LOAD_MAX_DURATION
+    elif duration is None:
+        duration = min(LOAD_MAX_DURATION, count / rps)
     
-    return jsonify(results)
+    try:
+        job = load_engine.start(client_pods, rps=rps, concurrency=concurrency, duration=duration, count=count,
+                                keys=keys)
+    except TooManyJobs as e:
+        return jsonify({'error': str(e)}), 429
+    return jsonify({'job_id': job.job_id, 'status_url': f'/load-jobs/{job.job_id}'}), 202
+
+@app.route('/load-jobs')
+def load_jobs():
+    return jsonify([job.summary() for job in load_engine.jobs()])
+
+@app.route('/load-jobs/<job_id>', methods=['GET', 'DELETE'])
+def load_job(job_id):
+    """Status and results of a load job; DELETE cancels it"""
+    job = load_engine.get(job_id)
+    if job is None:
+        return jsonify({'error': f'no such load job: {job_id}'}), 404
+    if request.method == 'DELETE':
+        job.cancel()
+    return jsonify(job.summary())
 
 if __name__ == '__main__':
     # Create templates directory if it doesn't exist
@@ -316,35 +622,105 @@ if __name__ == '__main__':
                     }
                 }
                 
-                // Fetch metrics data
-                function fetchMetrics() {
-                    fetch('/aggregate-metrics')
+                // Render the summary numbers
+                function renderMetrics(data) {
+                    document.getElementById('total-requests').textContent = data.summary.total_requests;
+                    document.getElementById('same-zone-percentage').textContent = 
+                        data.summary.same_zone_percentage.toFixed(1) + '% (' + 
+                        data.summary.total_same_zone_requests + ' of ' + 
+                        data.summary.total_requests + ')';
+                    document.getElementById('data-saved').textContent = 
+                        data.summary.saved_data_gb.toFixed(6) + ' GB';
+                    document.getElementById('cost-saved').textContent = 
+                        '$' + data.summary.saved_cost_usd.toFixed(4);
+                    
+                    document.getElementById('raw-metrics').textContent = 
+                        JSON.stringify(data, null, 2);
+                        
+                    updateCharts(data);
+                }
+                
+                // Render zone info
+                function renderZoneInfo(data) {
+                    if (!data || !data.pods) {
+                        return;
+                    }
+                    const clientPods = data.pods['client-service'] || {};
+                    const backendPods = data.pods['backend-service'] || {};
+                    const zoneNames = ['EU-FRANKFURT-1-AD-1', 'EU-FRANKFURT-1-AD-2', 'EU-FRANKFURT-1-AD-3'];
+                    zoneNames.forEach((zone, i) => {
+                        const clients = clientPods[zone] || 0;
+                        const backends = backendPods[zone] || 0;
+                        document.getElementById('zone' + (i + 1) + '-pods').innerHTML =
+                            'Client pods: <span class="highlight">' + clients + '</span><br>' +
+                            'Backend pods: <span class="' + (backends > 0 ? 'highlight' : 'warning') + '">' + backends + '</span>';
+                    });
+                }
+                
+                // Live updates: a snapshot on connect, then diffs two levels
+                // deep where null means the key went away
+                let state = {};
+                
+                function applyDiff(changes) {
+                    Object.keys(changes).forEach(key => {
+                        const value = changes[key];
+                        if (value === null) {
+                            delete state[key];
+                        } else if (typeof value === 'object' && !Array.isArray(value) &&
+                                   state[key] && typeof state[key] === 'object') {
+                            Object.keys(value).forEach(k => {
+                                if (value[k] === null) {
+                                    delete state[key][k];
+                                } else {
+                                    state[key][k] = value[k];
+                                }
+                            });
+                        } else {
+                            state[key] = value;
+                        }
+                    });
+                }
+                
+                function render() {
+                    if (state.summary) {
+                        renderMetrics(state);
+                    }
+                    renderZoneInfo(state.zones);
+                }
+                
+                function connectStream() {
+                    // EventSource reconnects on its own; every connection
+                    // starts over from a full snapshot
+                    const source = new EventSource('/stream');
+                    source.addEventListener('snapshot', event => {
+                        state = JSON.parse(event.data);
+                        render();
+                    });
+                    source.addEventListener('diff', event => {
+                        applyDiff(JSON.parse(event.data));
+                        render();
+                    });
+                    source.onerror = error => {
+                        console.error('Metrics stream interrupted:', error);
+                    };
+                }
+                
+                // Trigger load on the client services
+                function triggerLoad(count) {
+                    fetch('/trigger-load?count=' + count)
                         .then(response => response.json())
-                        .then(data => {
-                            document.getElementById('total-requests').textContent = data.summary.total_requests;
-                            document.getElementById('same-zone-percentage').textContent = 
-                                data.summary.same_zone_percentage.toFixed(1) + '% (' + 
-                                data.summary.total_same_zone_requests + ' of ' + 
-                                data.summary.total_requests + ')';
-                            document.getElementById('data-saved').textContent = 
-                                data.summary.saved_data_gb.toFixed(6) + ' GB';
-                            document.getElementById('cost-saved').textContent = 
-                                '$' + data.summary.saved_cost_usd.toFixed(4);
-                            
-                            document.getElementById('raw-metrics').textContent = 
-                                JSON.stringify(data, null, 2);
-                                
-                            updateCharts(data);
-                        })
                         .catch(error => {
-                            console.error('Error fetching metrics:', error);
+                            console.error('Error triggering load:', error);
                         });
                 }
                 
-                // Fetch zone info
-                function fetchZoneInfo() {
-                    fetch('/zones')
-                        .then(response => response.json())
-                        .then(data => {
-                            const clientPods = data.pods['client-service'] || {};
-                            const backendPods = data.pods['backend-service'] || {};
\ No newline at end of file
+                // Initialize
+                initCharts();
+                connectStream();
+            </script>
+        </body>
+        </html>
+        """)
+    
+    start_collector()
+    app.run(host=os.environ.get("BIND_ADDRESS", "0.0.0.0"), port=8080)
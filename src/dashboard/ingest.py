@@ -0,0 +1,70 @@
+# ingest.py
+import threading
+from collections import OrderedDict
+
+
+class IngestAggregator:
+    """Fleet-wide counters built from deltas pushed by the client pods.
+
+    Each report adds its deltas to the totals, so the cost of an update
+    depends on the counters it carries, not on the number of pods. Reports
+    are numbered per reporter; a resent batch (same or lower number) is
+    acknowledged but not applied again. Reporters are kept in last-seen
+    order, so expiring the ones that went quiet only touches those.
+    """
+
+    def __init__(self, expiry=30.0):
+        self.expiry = expiry
+        self._lock = threading.Lock()
+        self._reporters = OrderedDict()  # reporter -> state, least recently seen first
+        self.totals = {}
+        self.reports = 0
+        self.duplicates = 0
+        self.expired = 0
+
+    def apply(self, reporter, seq, deltas, meta, now):
+        """Fold one report into the totals, False if it was a duplicate"""
+        with self._lock:
+            state = self._reporters.get(reporter)
+            if state is None:
+                state = self._reporters[reporter] = {'seq': 0, 'totals': {}}
+            else:
+                self._reporters.move_to_end(reporter)
+            state['last_seen'] = now
+            state['meta'] = meta
+            if seq <= state['seq']:
+                self.duplicates += 1
+                return False
+            state['seq'] = seq
+            for name, delta in deltas.items():
+                self.totals[name] = self.totals.get(name, 0) + delta
+                state['totals'][name] = state['totals'].get(name, 0) + delta
+            self.reports += 1
+            return True
+
+    def expire(self, now):
+        """Forget reporters not heard from for `expiry` seconds; their counts stay in the totals"""
+        with self._lock:
+            while self._reporters:
+                reporter, state = next(iter(self._reporters.items()))
+                if now - state['last_seen'] < self.expiry:
+                    break
+                self._reporters.popitem(last=False)
+                self.expired += 1
+            return len(self._reporters)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.totals), len(self._reporters)
+
+    def reporters(self, now):
+        """Per-reporter view for the full /aggregate-metrics payload"""
+        with self._lock:
+            return [dict(state['meta'], reporter=reporter, seq=state['seq'],
+                         age_s=now - state['last_seen'], metrics=dict(state['totals']))
+                    for reporter, state in self._reporters.items()]
+
+    def stats(self):
+        with self._lock:
+            return {'reporters': len(self._reporters), 'reports': self.reports,
+                    'duplicates': self.duplicates, 'expired': self.expired}
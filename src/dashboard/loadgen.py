@@ -0,0 +1,258 @@
+# loadgen.py
+import itertools
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list, None if empty"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class ZoneStats:
+    """Outcomes of the requests sent through one client zone"""
+
+    max_samples = 100000
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.same_zone = 0
+        self.latencies = []  # reservoir sample once it is full
+
+    def record(self, latency, success, same_zone):
+        self.requests += 1
+        if not success:
+            self.errors += 1
+        if same_zone:
+            self.same_zone += 1
+        if len(self.latencies) < self.max_samples:
+            self.latencies.append(latency)
+        else:
+            slot = random.randrange(self.requests)
+            if slot < self.max_samples:
+                self.latencies[slot] = latency
+
+    def summary(self, elapsed):
+        latencies = sorted(self.latencies)
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'same_zone_requests': self.same_zone,
+            'throughput_rps': self.requests / elapsed if elapsed > 0 else 0.0,
+            'latency_ms': {
+                name: None if value is None else value * 1000
+                for name, value in (('p50', percentile(latencies, 50)), ('p90', percentile(latencies, 90)),
+                                    ('p99', percentile(latencies, 99)), ('max', latencies[-1] if latencies else None))
+            }
+        }
+
+
+class LoadJob:
+    """One load run against the client pods, executed in the background.
+
+    With `rps` set the run is open-loop: request i is due at start + i/rps
+    whether or not earlier ones have answered, and its latency is measured
+    from that due time. A slow system therefore shows up as queueing delay
+    in the percentiles instead of silently lowering the request rate
+    (coordinated omission). Without `rps` the run is closed-loop:
+    `concurrency` workers send back to back. Requests are spread round-robin
+    over the client pods. The run ends after `duration` seconds or `count`
+    requests, whichever comes first. With `keys` set, each request carries
+    an X-Affinity-Key header drawn uniformly from that many keys.
+    """
+
+    def __init__(self, job_id, targets, rps=None, concurrency=10, duration=None, count=None,
+                 timeout=5.0, port=8080, keys=None):
+        self.job_id = job_id
+        self.targets = list(targets)
+        self.rps = rps
+        self.concurrency = concurrency
+        self.duration = duration
+        self.count = count
+        self.timeout = timeout
+        self.port = port
+        self.keys = keys
+        self.status = "pending"
+        self.created_at = time.time()
+        self.started = None
+        self.finished = None
+        self.sent = 0
+        self.dropped = 0        # open-loop requests skipped because the backlog was full
+        self.error = None
+        self.by_zone = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._finished = threading.Event()
+        self._backlog = 0
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max(1, len(self.targets)), pool_maxsize=concurrency)
+        self.session.mount("http://", adapter)
+
+    def start(self):
+        threading.Thread(target=self._run, name=f"load-{self.job_id}", daemon=True).start()
+
+    def cancel(self):
+        self._stop.set()
+
+    def wait(self, timeout=None):
+        """Block until the job has finished, False on timeout"""
+        return self._finished.wait(timeout)
+
+    def _done(self, index):
+        if self.count is not None and index >= self.count:
+            return True
+        if self.duration is not None and time.monotonic() - self.started >= self.duration:
+            return True
+        return self._stop.is_set()
+
+    def _run(self):
+        self.started = time.monotonic()
+        self.status = "running"
+        try:
+            if not self.targets:
+                raise RuntimeError("no client pods to send load to")
+            if self.rps:
+                self._run_open_loop()
+            else:
+                self._run_closed_loop()
+            self.status = "cancelled" if self._stop.is_set() else "done"
+        except Exception as e:
+            print(f"Load job {self.job_id} failed: {e}")
+            self.status = "failed"
+            self.error = str(e)
+        finally:
+            self.finished = time.monotonic()
+            self.session.close()
+            self._finished.set()
+
+    def _run_open_loop(self):
+        interval = 1.0 / self.rps
+        max_backlog = self.concurrency * 10
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="load") as executor:
+            for index in itertools.count():
+                due = self.started + index * interval
+                if self._stop.wait(max(0.0, due - time.monotonic())) or self._done(index):
+                    break
+                with self._lock:
+                    if self._backlog >= max_backlog:
+                        self.dropped += 1
+                        continue
+                    self._backlog += 1
+                    self.sent += 1
+                executor.submit(self._send, self.targets[index % len(self.targets)], due)
+
+    def _run_closed_loop(self):
+        counter = itertools.count()
+
+        def worker():
+            while True:
+                with self._lock:
+                    index = next(counter)
+                    if self._done(index):
+                        return
+                    self.sent += 1
+                self._send(self.targets[index % len(self.targets)], None)
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def _send(self, target, due):
+        started = due if due is not None else time.monotonic()
+        client_zone = "unknown"
+        success = same_zone = False
+        try:
+            headers = {'X-Affinity-Key': f"key-{random.randrange(self.keys)}"} if self.keys else None
+            response = self.session.get(f"http://{target}:{self.port}/make-request", headers=headers,
+                                        timeout=self.timeout)
+            result = response.json()
+            client_zone = result.get('client_zone', client_zone)
+            success = response.status_code == 200 and result.get('success', False)
+            same_zone = result.get('same_zone', False)
+        except Exception:
+            pass
+        latency = time.monotonic() - started
+        with self._lock:
+            if due is not None:
+                self._backlog -= 1
+            stats = self.by_zone.get(client_zone)
+            if stats is None:
+                stats = self.by_zone[client_zone] = ZoneStats()
+            stats.record(latency, success, same_zone)
+
+    def summary(self):
+        with self._lock:
+            if self.started is None:
+                elapsed = 0.0
+            else:
+                elapsed = (self.finished or time.monotonic()) - self.started
+            completed = sum(stats.requests for stats in self.by_zone.values())
+            errors = sum(stats.errors for stats in self.by_zone.values())
+            result = {
+                'job_id': self.job_id,
+                'status': self.status,
+                'mode': 'open-loop' if self.rps else 'closed-loop',
+                'config': {'rps': self.rps, 'concurrency': self.concurrency, 'duration': self.duration,
+                           'count': self.count, 'targets': len(self.targets)},
+                'created_at': self.created_at,
+                'elapsed_s': elapsed,
+                'sent': self.sent,
+                'completed': completed,
+                'errors': errors,
+                'dropped': self.dropped,
+                'throughput_rps': completed / elapsed if elapsed > 0 else 0.0,
+                'by_client_zone': {zone: stats.summary(elapsed) for zone, stats in self.by_zone.items()}
+            }
+            if self.status == "failed":
+                result['error'] = self.error
+            return result
+
+
+class TooManyJobs(Exception):
+    """`max_running` load jobs are already pending or running"""
+
+
+class LoadEngine:
+    """Starts load jobs, at most `max_running` at a time, and keeps the most
+    recent `max_jobs` of them around"""
+
+    def __init__(self, max_jobs=20, max_running=2, port=8080):
+        self.max_jobs = max_jobs
+        self.max_running = max_running
+        self.port = port
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._ids = itertools.count(1)
+
+    def start(self, targets, **options):
+        with self._lock:
+            running = sum(1 for j in self._jobs.values() if j.status in ("pending", "running"))
+            if running >= self.max_running:
+                raise TooManyJobs(f"{running} load jobs already running, at most {self.max_running}")
+            job_id = f"load-{next(self._ids)}"
+            job = LoadJob(job_id, targets, port=self.port, **options)
+            self._jobs[job_id] = job
+            # Forget the oldest finished jobs beyond the limit
+            finished = [j for j in self._jobs.values() if j.status not in ("pending", "running")]
+            for old in finished[:max(0, len(self._jobs) - self.max_jobs)]:
+                del self._jobs[old.job_id]
+        job.start()
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs.values())
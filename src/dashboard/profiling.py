@@ -0,0 +1,176 @@
+# profiling.py
+#
+# Request stage timers and an on-demand sampling profiler. Each service
+# image ships its own directory: src/backend and src/dashboard carry this
+# whole file, src/frontend the part it uses (its stages go into the
+# client's MetricsRegistry, not StageHistograms). Change them together.
+import bisect
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# Stage histogram bounds in seconds, 10us to 5s (+Inf is implied)
+STAGE_BUCKETS = (0.00001, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+
+class StageHistograms:
+    """Fixed-bucket histograms of stage durations, keyed by stage name.
+
+    Has the `observe(name, labels, value)` shape of the client's
+    MetricsRegistry, so StageTimer records into either.
+    """
+
+    def __init__(self, buckets=STAGE_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._histograms = {}  # stage -> [bucket counts..., sum]
+
+    def observe(self, name, labels, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            histogram = self._histograms.get(labels)
+            if histogram is None:
+                histogram = self._histograms[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            histogram[index] += 1
+            histogram[-1] += value
+
+    def collect(self):
+        """{stage: {'counts', 'count', 'sum'}}, counts per bucket and not cumulative"""
+        with self._lock:
+            return {labels[0]: {'counts': histogram[:-1], 'count': sum(histogram[:-1]), 'sum': histogram[-1]}
+                    for labels, histogram in self._histograms.items()}
+
+
+class _Stage:
+    __slots__ = ('registry', 'name', 'started')
+
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.registry.observe('stage', (self.name,), time.perf_counter() - self.started)
+        return False
+
+
+class StageTimer:
+    """`with stages('discovery'):` records the block's wall time as a stage.
+
+    Two perf_counter() calls and one histogram update per stage, cheap
+    enough to leave on everywhere.
+    """
+
+    def __init__(self, registry):
+        self.registry = registry
+
+    def __call__(self, name):
+        return _Stage(self.registry, name)
+
+
+def stage_summary(histograms, buckets):
+    """Per stage count, mean and p50/p90/p99 in ms. Percentiles are bucket
+    upper bounds, so they overestimate by at most one bucket."""
+    bounds = list(buckets) + [float('inf')]
+    summary = {}
+    for stage, histogram in sorted(histograms.items()):
+        count = histogram['count']
+        if not count:
+            continue
+        entry = {'count': count, 'mean_ms': histogram['sum'] / count * 1000}
+        for pct in (50, 90, 99):
+            target = count * pct / 100
+            cumulative = 0
+            for bound, bucket_count in zip(bounds, histogram['counts']):
+                cumulative += bucket_count
+                if cumulative >= target:
+                    break
+            entry[f'p{pct}_ms'] = bound * 1000 if bound != float('inf') else None
+        summary[stage] = entry
+    return summary
+
+
+def prometheus_lines(metric, help_text, histograms, buckets, labels=''):
+    """Prometheus text lines for stage histograms, with optional extra labels"""
+    lines = [f'# HELP {metric} {help_text}', f'# TYPE {metric} histogram']
+    prefix = f'{labels},' if labels else ''
+    for stage, histogram in sorted(histograms.items()):
+        cumulative = 0
+        for bound, count in zip([repr(b) for b in buckets] + ['+Inf'], histogram['counts']):
+            cumulative += count
+            lines.append(f'{metric}_bucket{{{prefix}stage="{stage}",le="{bound}"}} {cumulative}')
+        lines.append(f'{metric}_sum{{{prefix}stage="{stage}"}} {histogram["sum"]}')
+        lines.append(f'{metric}_count{{{prefix}stage="{stage}"}} {cumulative}')
+    return lines
+
+
+def profile_params(args):
+    """(seconds, interval) from a request's ?seconds=N&interval_ms=M, ValueError if malformed"""
+    seconds = float(args.get('seconds', '10'))
+    interval = float(args.get('interval_ms', '10')) / 1000
+    if not (seconds > 0 and interval > 0):
+        raise ValueError('seconds and interval_ms must be positive')
+    return seconds, interval
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+class SamplingProfiler:
+    """Wall-clock sampling profiler over every thread of the process.
+
+    Nothing runs until `profile()` is called: it then reads every thread's
+    stack with sys._current_frames() each `interval` seconds, for
+    `seconds`, and returns collapsed stacks ("thread;outer;...;inner count"
+    per line, the flame graph input format). One profile runs at a time.
+    """
+
+    def __init__(self, max_seconds=60.0, default_interval=0.01):
+        self.max_seconds = max_seconds
+        self.default_interval = default_interval
+        self._busy = threading.Lock()
+        self._labels = {}  # code object -> "file.py:function"
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = f'{os.path.basename(code.co_filename)}:{code.co_name}'
+        return label
+
+    def profile(self, seconds, interval=None):
+        """Sample for `seconds` (capped at max_seconds) and return
+        (collapsed stack text, number of samples)"""
+        seconds = min(max(seconds, 0.0), self.max_seconds)
+        interval = max(interval or self.default_interval, 0.001)
+        if not self._busy.acquire(blocking=False):
+            raise ProfilerBusy()
+        try:
+            stacks = Counter()
+            own = threading.get_ident()
+            samples = 0
+            deadline = time.monotonic() + seconds
+            next_sample = time.monotonic()
+            while next_sample < deadline:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == own:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        stack.append(self._label(frame.f_code))
+                        frame = frame.f_back
+                    stack.append(names.get(ident, f'thread-{ident}').replace(';', ':'))
+                    stacks[';'.join(reversed(stack))] += 1
+                samples += 1
+                next_sample += interval
+                time.sleep(max(0.0, next_sample - time.monotonic()))
+            return ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common()), samples
+        finally:
+            self._busy.release()
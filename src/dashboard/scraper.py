@@ -0,0 +1,121 @@
+# scraper.py
+import bisect
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# Upper bounds of the per-pod scrape latency buckets, in seconds
+SCRAPE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class MetricsScraper:
+    """Scrapes /metrics from many client pods in parallel.
+
+    Every pod gets `timeout` seconds and the whole scrape gets `deadline`
+    seconds, so a refresh takes about as long as the slowest pod (capped by
+    the deadline) rather than the sum over all pods. Pods still running when
+    the deadline hits are reported as such and left out of the results.
+    Connections are pooled and reused between scrapes.
+    """
+
+    def __init__(self, max_workers=32, timeout=2.0, deadline=3.0, port=8080):
+        self.timeout = timeout
+        self.deadline = deadline
+        self.port = port
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scrape")
+        self._session = requests.Session()
+        self._session.mount("http://", HTTPAdapter(pool_connections=max_workers,
+                                                   pool_maxsize=max_workers, max_retries=0))
+        # Scrape timings, exposed by the dashboard's /metrics/prometheus
+        self._stats_lock = threading.Lock()
+        self.scrapes_by_status = {}
+        self.latency_counts = [0] * (len(SCRAPE_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.last_duration = 0.0
+        self.last_pods = 0
+
+    def _scrape_one(self, pod_ip, path, timeout):
+        started = time.monotonic()
+        result = {'pod_ip': pod_ip, 'status': 'ok', 'error': None, 'data': None}
+        try:
+            response = self._session.get(f"http://{pod_ip}:{self.port}{path}", timeout=timeout)
+            if response.status_code == 200:
+                result['data'] = response.json()
+            else:
+                result['status'] = 'error'
+                result['error'] = f"HTTP {response.status_code}"
+        except requests.Timeout as e:
+            result['status'] = 'timeout'
+            result['error'] = str(e)
+        except Exception as e:
+            result['status'] = 'error'
+            result['error'] = str(e)
+        result['latency_ms'] = (time.monotonic() - started) * 1000
+        return result
+
+    def scrape(self, pod_ips, path="/metrics"):
+        """Fetch `path` from every pod, returning one result dict per pod.
+
+        Each result has the pod's `status` (ok, error, timeout or
+        deadline_exceeded), `latency_ms`, `error`, and the decoded JSON `data`
+        when the scrape succeeded.
+        """
+        started = time.monotonic()
+        timeout = min(self.timeout, self.deadline)
+        futures = {self._executor.submit(self._scrape_one, ip, path, timeout): ip for ip in pod_ips}
+        done, _ = wait(futures, timeout=self.deadline)
+
+        results = []
+        for future, pod_ip in futures.items():
+            if future in done:
+                results.append(future.result())
+            else:
+                # Still running, its per-pod timeout will end it in the background
+                results.append({'pod_ip': pod_ip, 'status': 'deadline_exceeded', 'error': None,
+                                'data': None, 'latency_ms': (time.monotonic() - started) * 1000})
+        self._record(results, time.monotonic() - started)
+        return results
+
+    def _record(self, results, duration):
+        with self._stats_lock:
+            for result in results:
+                status = result['status']
+                self.scrapes_by_status[status] = self.scrapes_by_status.get(status, 0) + 1
+                latency = result['latency_ms'] / 1000
+                self.latency_counts[bisect.bisect_left(SCRAPE_BUCKETS, latency)] += 1
+                self.latency_sum += latency
+            self.last_duration = duration
+            self.last_pods = len(results)
+
+    def prometheus_lines(self):
+        """Scrape timings in Prometheus text format"""
+        with self._stats_lock:
+            lines = [
+                '# HELP dashboard_scrapes_total Client pod scrapes, by outcome',
+                '# TYPE dashboard_scrapes_total counter',
+            ]
+            for status, count in sorted(self.scrapes_by_status.items()):
+                lines.append(f'dashboard_scrapes_total{{status="{status}"}} {count}')
+            lines += [
+                '# HELP dashboard_scrape_duration_seconds Per-pod scrape latency',
+                '# TYPE dashboard_scrape_duration_seconds histogram',
+            ]
+            cumulative = 0
+            for bound, count in zip([repr(b) for b in SCRAPE_BUCKETS] + ['+Inf'], self.latency_counts):
+                cumulative += count
+                lines.append(f'dashboard_scrape_duration_seconds_bucket{{le="{bound}"}} {cumulative}')
+            lines += [
+                f'dashboard_scrape_duration_seconds_sum {self.latency_sum}',
+                f'dashboard_scrape_duration_seconds_count {cumulative}',
+                '# HELP dashboard_last_scrape_seconds Wall time of the last fan-out scrape',
+                '# TYPE dashboard_last_scrape_seconds gauge',
+                f'dashboard_last_scrape_seconds {self.last_duration}',
+                '# HELP dashboard_last_scrape_pods Client pods in the last fan-out scrape',
+                '# TYPE dashboard_last_scrape_pods gauge',
+                f'dashboard_last_scrape_pods {self.last_pods}',
+            ]
+        return lines
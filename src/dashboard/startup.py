@@ -0,0 +1,54 @@
+# startup.py
+#
+# Cold start: the kubernetes client imported only once something needs
+# it. Each service image ships its own directory: this is the part of
+# src/backend's copy the dashboard uses, it has no zone of its own.
+# Change them together.
+import os
+import threading
+
+SERVICE_ACCOUNT_TOKEN = "/var/run/secrets/kubernetes.io/serviceaccount/token"
+
+_kubernetes = None
+_kubernetes_lock = threading.Lock()
+
+
+def in_cluster():
+    """Whether there is an API server to talk to, judged without importing the client"""
+    if os.environ.get("KUBE_API_URL"):
+        return True
+    return bool(os.environ.get("KUBERNETES_SERVICE_HOST")) and os.path.exists(SERVICE_ACCOUNT_TOKEN)
+
+
+def load_kubernetes():
+    """Import and configure the kubernetes client, once per process"""
+    global _kubernetes
+    with _kubernetes_lock:
+        if _kubernetes is None:
+            # A third of a second of imports, paid by the first caller only
+            import kubernetes.client
+            from kubernetes import config
+            if os.environ.get("KUBE_API_URL"):
+                # Local API stand-in (src/harness/fake_kube.py): plain HTTP, no auth
+                configuration = kubernetes.client.Configuration()
+                configuration.host = os.environ["KUBE_API_URL"]
+                kubernetes.client.Configuration.set_default(configuration)
+            else:
+                config.load_incluster_config()
+            _kubernetes = kubernetes.client
+        return _kubernetes
+
+
+class LazyApi:
+    """Stands in for a kubernetes API object (CoreV1Api, DiscoveryV1Api, ...)
+    and builds it on first attribute access"""
+
+    def __init__(self, name):
+        self._name = name
+        self._api = None
+
+    def __getattr__(self, attr):
+        api = self._api
+        if api is None:
+            api = self._api = getattr(load_kubernetes(), self._name)()
+        return getattr(api, attr)
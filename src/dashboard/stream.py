@@ -0,0 +1,100 @@
+# stream.py
+import json
+import queue
+import threading
+
+
+def diff(old, new):
+    """Changed keys of `new` versus `old`, two levels deep; removed keys map to None"""
+    changes = {}
+    for key, value in new.items():
+        previous = old.get(key)
+        if isinstance(value, dict) and isinstance(previous, dict):
+            nested = {k: v for k, v in value.items() if previous.get(k) != v}
+            nested.update({k: None for k in previous if k not in value})
+            if nested:
+                changes[key] = nested
+        elif previous != value or key not in old:
+            changes[key] = value
+    for key in old:
+        if key not in new:
+            changes[key] = None
+    return changes
+
+
+def format_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload, separators=(',', ':'))}\n\n"
+
+
+class Subscriber:
+    """One connected viewer: a bounded queue of encoded events"""
+
+    def __init__(self, max_queue):
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = False
+
+
+class Broadcaster:
+    """Fans each snapshot out to every connected viewer as server-sent events.
+
+    A snapshot is diffed against the previous one and encoded once, however
+    many viewers there are; each viewer gets the same bytes. Viewers hold a
+    bounded queue: one that can't keep up is dropped rather than letting
+    memory grow, and its browser reconnects and starts from a fresh snapshot.
+    """
+
+    def __init__(self, max_queue=16, keepalive=15.0):
+        self.max_queue = max_queue
+        self.keepalive = keepalive
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._snapshot = None
+        self.dropped = 0
+
+    def publish(self, snapshot):
+        with self._lock:
+            changes = diff(self._snapshot, snapshot) if self._snapshot is not None else snapshot
+            self._snapshot = snapshot
+            if not changes:
+                return
+            message = format_event('diff', changes)
+            for subscriber in list(self._subscribers):
+                try:
+                    subscriber.queue.put_nowait(message)
+                except queue.Full:
+                    subscriber.dropped = True
+                    self._subscribers.discard(subscriber)
+                    self.dropped += 1
+
+    def subscribe(self):
+        subscriber = Subscriber(self.max_queue)
+        with self._lock:
+            # The initial snapshot is queued under the lock so no diff can
+            # slip in ahead of it
+            if self._snapshot is not None:
+                subscriber.queue.put_nowait(format_event('snapshot', self._snapshot))
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def events(self):
+        """Generator of SSE chunks for one viewer, ends when it is dropped"""
+        subscriber = self.subscribe()
+        try:
+            # Tell the browser how long to wait before reconnecting
+            yield "retry: 2000\n\n"
+            while not subscriber.dropped:
+                try:
+                    yield subscriber.queue.get(timeout=self.keepalive)
+                except queue.Empty:
+                    # Comment line, keeps proxies from closing an idle stream
+                    yield ": keepalive\n\n"
+        finally:
+            self.unsubscribe(subscriber)
+
+    def stats(self):
+        with self._lock:
+            return {'subscribers': len(self._subscribers), 'dropped': self.dropped}
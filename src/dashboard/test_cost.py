@@ -0,0 +1,75 @@
+# test_cost.py
+import pytest
+
+from cost import GIB, CostEngine, traffic_from_counters, traffic_from_metrics
+
+
+def engine(**kwargs):
+    cost = CostEngine(cross_zone_per_gb=0.01, **kwargs)
+    # zone-a clients sent 2 GiB to zone-a and 1 GiB to zone-b, got as much back
+    cost.update({('zone-a', 'zone-a'): [200, 2 * GIB, 2 * GIB], ('zone-a', 'zone-b'): [100, GIB, GIB]},
+                backends_by_zone={'zone-a': 1, 'zone-b': 1}, clients_by_zone={'zone-a': 1})
+    return cost
+
+
+def test_traffic_from_metrics_and_counters_agree():
+    metrics = [{'by_zone_pair': {'zone-a': {'zone-b': 3}},
+                'bytes_by_zone_pair': {'zone-a': {'zone-b': {'request': 10, 'response': 20}}}}] * 2
+    counters = {'traffic|zone-a|zone-b|requests': 6, 'traffic|zone-a|zone-b|request_bytes': 20,
+                'traffic|zone-a|zone-b|response_bytes': 40, 'requests': 6, 'traffic|bad': 1}
+    assert traffic_from_metrics(metrics) == traffic_from_counters(counters) == {('zone-a', 'zone-b'): [6, 20, 40]}
+
+
+def test_summary_prices_the_measured_cross_zone_bytes():
+    summary = engine().summary()
+    assert summary['estimated_data_transfer_gb'] == pytest.approx(2)
+    assert summary['estimated_cost_usd'] == pytest.approx(0.02)
+    # Topology-unaware routing would have sent half of the 6 GiB cross-zone
+    assert summary['baseline_data_transfer_gb'] == pytest.approx(3)
+    assert summary['saved_cost_usd'] == pytest.approx(0.01)
+    assert summary['saved_cross_zone_requests'] == pytest.approx(50)
+
+
+def test_update_without_replicas_keeps_the_last_known_ones():
+    # What the dashboard does while the topology snapshot is an error
+    cost = engine()
+    cost.update({('zone-a', 'zone-b'): [100, GIB, GIB]})
+    assert cost.summary()['baseline_data_transfer_gb'] == pytest.approx(1)
+    assert list(cost.backends) == [1, 1]
+
+
+def test_pair_prices_override_the_flat_price():
+    cost = engine(pair_prices={('zone-b', 'zone-a'): 0.05})
+    # Requests go a -> b at 0.01, responses come back b -> a at 0.05
+    assert cost.summary()['estimated_cost_usd'] == pytest.approx(0.06)
+    assert cost.matrix()['price_per_gb'] == [[0.0, 0.01], [0.05, 0.0]]
+
+
+def test_what_if_prices_both_routing_models():
+    local, current = engine().what_if([{'backends': {'zone-a': 2}}, {}])
+    assert local['random'] == local['zone-weighted'] == {'cost_usd': 0, 'cross_zone_gb': 0, 'unserved_fraction': 0}
+    assert current['backends'] == {'zone-a': 1, 'zone-b': 1}
+    assert current['random']['cross_zone_gb'] == pytest.approx(3)
+    # All the demand is in zone-a, which only has half the backends
+    assert current['zone-weighted']['cross_zone_gb'] == pytest.approx(3)
+
+
+def test_what_if_moves_demand_with_the_clients():
+    [result] = engine().what_if([{'backends': {'zone-a': 1, 'zone-b': 1}, 'clients': {'zone-a': 1, 'zone-b': 1}}])
+    assert result['zone-weighted']['cross_zone_gb'] == pytest.approx(0)
+    assert result['random']['cross_zone_gb'] == pytest.approx(3)
+
+
+def test_what_if_with_new_zones_leaves_the_engine_alone():
+    cost = engine()
+    zones, prices = list(cost.zones), cost.prices
+    [result] = cost.what_if([{'backends': {'zone-z': 1}, 'clients': {'zone-y': 1}}])
+    assert set(result['backends']) == {'zone-a', 'zone-b', 'zone-y', 'zone-z'}
+    assert result['random']['cross_zone_gb'] == pytest.approx(6)
+    assert cost.zones == zones and cost.prices is prices
+
+
+def test_what_if_without_backends_reports_unserved_demand():
+    [result] = engine().what_if([{'backends': {}}])
+    assert result['random']['unserved_fraction'] == pytest.approx(1)
+    assert result['random']['cost_usd'] == 0
@@ -0,0 +1,100 @@
+# test_ingest.py
+import threading
+
+from ingest import IngestAggregator
+
+
+def test_reports_add_their_deltas():
+    aggregator = IngestAggregator()
+    assert aggregator.apply('pod-1', 1, {'requests': 5}, {'zone': 'zone-a'}, now=0)
+    assert aggregator.apply('pod-2', 1, {'requests': 2, 'errors': 1}, {'zone': 'zone-b'}, now=0)
+    assert aggregator.apply('pod-1', 2, {'requests': 3}, {'zone': 'zone-a'}, now=1)
+    assert aggregator.snapshot() == ({'requests': 10, 'errors': 1}, 2)
+
+
+def test_resent_or_older_reports_are_not_applied_twice():
+    aggregator = IngestAggregator()
+    aggregator.apply('pod-1', 1, {'requests': 5}, {}, now=0)
+    aggregator.apply('pod-1', 2, {'requests': 5}, {}, now=1)
+    assert not aggregator.apply('pod-1', 2, {'requests': 5}, {}, now=2)
+    assert not aggregator.apply('pod-1', 1, {'requests': 5}, {}, now=2)
+    assert aggregator.snapshot()[0] == {'requests': 10}
+    assert aggregator.stats() == {'reporters': 1, 'reports': 2, 'duplicates': 2, 'expired': 0}
+
+
+def test_a_lost_ack_then_resend_counts_once():
+    aggregator = IngestAggregator()
+    # Applied, but the reporter never saw the answer and resends batch 1
+    aggregator.apply('pod-1', 1, {'requests': 5}, {}, now=0)
+    assert not aggregator.apply('pod-1', 1, {'requests': 5}, {}, now=5)
+    # Its next batch carries only what changed since
+    assert aggregator.apply('pod-1', 2, {'requests': 2}, {}, now=10)
+    assert aggregator.snapshot()[0] == {'requests': 7}
+    assert aggregator.reporters(now=10)[0]['metrics'] == {'requests': 7}
+
+
+def test_a_gap_in_the_sequence_is_applied():
+    aggregator = IngestAggregator()
+    aggregator.apply('pod-1', 1, {'requests': 5}, {}, now=0)
+    assert aggregator.apply('pod-1', 4, {'requests': 1}, {}, now=1)
+    assert not aggregator.apply('pod-1', 3, {'requests': 1}, {}, now=2)
+    assert aggregator.snapshot()[0] == {'requests': 6}
+
+
+def test_a_duplicate_refreshes_meta_but_not_counts():
+    aggregator = IngestAggregator()
+    aggregator.apply('pod-1', 1, {'requests': 5}, {'zone': 'unknown'}, now=0)
+    aggregator.apply('pod-1', 1, {'requests': 5}, {'zone': 'zone-a'}, now=1)
+    assert aggregator.reporters(now=1) == [
+        {'zone': 'zone-a', 'reporter': 'pod-1', 'seq': 1, 'age_s': 0, 'metrics': {'requests': 5}}]
+
+
+def test_an_empty_report_is_a_heartbeat():
+    aggregator = IngestAggregator(expiry=30)
+    aggregator.apply('pod-1', 1, {'requests': 5}, {}, now=0)
+    assert aggregator.apply('pod-1', 2, {}, {}, now=25)
+    assert aggregator.expire(now=40) == 1
+    assert aggregator.snapshot() == ({'requests': 5}, 1)
+
+
+def test_concurrent_resends_of_one_batch_apply_once():
+    aggregator = IngestAggregator()
+    barrier = threading.Barrier(8)
+    applied = []
+
+    def resend():
+        barrier.wait()
+        applied.append(aggregator.apply('pod-1', 1, {'requests': 5}, {}, now=0))
+    threads = [threading.Thread(target=resend) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(applied) == [False] * 7 + [True]
+    assert aggregator.snapshot()[0] == {'requests': 5}
+
+
+def test_sequence_numbers_are_per_reporter():
+    aggregator = IngestAggregator()
+    aggregator.apply('pod-1', 7, {'requests': 1}, {}, now=0)
+    assert aggregator.apply('pod-2', 1, {'requests': 1}, {}, now=0)
+
+
+def test_quiet_reporters_expire_but_their_counts_stay():
+    aggregator = IngestAggregator(expiry=30)
+    aggregator.apply('pod-1', 1, {'requests': 5}, {}, now=0)
+    aggregator.apply('pod-2', 1, {'requests': 5}, {}, now=10)
+    # A duplicate still counts as a sign of life
+    aggregator.apply('pod-1', 1, {'requests': 5}, {}, now=20)
+    assert aggregator.expire(now=45) == 1
+    assert [r['reporter'] for r in aggregator.reporters(now=45)] == ['pod-1']
+    assert aggregator.snapshot() == ({'requests': 10}, 1)
+    # An expired reporter starts over with a fresh sequence
+    assert aggregator.apply('pod-2', 1, {'requests': 1}, {}, now=46)
+
+
+def test_reporters_view():
+    aggregator = IngestAggregator()
+    aggregator.apply('pod-1', 3, {'requests': 5}, {'zone': 'zone-a'}, now=0)
+    assert aggregator.reporters(now=2) == [
+        {'zone': 'zone-a', 'reporter': 'pod-1', 'seq': 3, 'age_s': 2, 'metrics': {'requests': 5}}]
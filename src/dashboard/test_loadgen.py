@@ -0,0 +1,116 @@
+# test_loadgen.py
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from loadgen import LoadEngine, LoadJob, TooManyJobs, ZoneStats, percentile
+
+
+class FakeClient(BaseHTTPRequestHandler):
+    """/make-request answering like a client pod in zone-a, every third one cross-zone"""
+
+    requests = 0
+    keys = set()
+
+    def do_GET(self):
+        cls = type(self)
+        cls.requests += 1
+        if self.headers.get('X-Affinity-Key'):
+            cls.keys.add(self.headers['X-Affinity-Key'])
+        body = json.dumps({'success': True, 'client_zone': 'zone-a', 'same_zone': cls.requests % 3 != 0}).encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def client_port():
+    FakeClient.requests = 0
+    FakeClient.keys = set()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeClient)
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    yield server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+def run(job):
+    job.start()
+    assert job.wait(10)
+    return job.summary()
+
+
+def test_percentile_is_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([7], 99) == 7
+    assert percentile([], 50) is None
+
+
+def test_zone_stats_keep_a_bounded_sample(monkeypatch):
+    monkeypatch.setattr(ZoneStats, 'max_samples', 10)
+    stats = ZoneStats()
+    for i in range(100):
+        stats.record(i / 1000, i % 10 != 0, True)
+    assert len(stats.latencies) == 10
+    summary = stats.summary(elapsed=2.0)
+    assert summary['requests'] == 100 and summary['errors'] == 10
+    assert summary['throughput_rps'] == 50
+
+
+def test_closed_loop_sends_exactly_count_requests(client_port):
+    summary = run(LoadJob('load-1', ['127.0.0.1'], concurrency=4, count=30, port=client_port))
+    assert summary['status'] == 'done' and summary['mode'] == 'closed-loop'
+    assert summary['sent'] == summary['completed'] == FakeClient.requests == 30
+    zone = summary['by_client_zone']['zone-a']
+    assert zone['errors'] == 0 and zone['same_zone_requests'] == 20
+
+
+def test_open_loop_keeps_the_rate(client_port):
+    summary = run(LoadJob('load-1', ['127.0.0.1'], rps=100, concurrency=4, duration=0.5, port=client_port))
+    assert summary['mode'] == 'open-loop'
+    assert 40 <= summary['sent'] <= 51 and summary['dropped'] == 0
+    assert summary['by_client_zone']['zone-a']['latency_ms']['p50'] is not None
+
+
+def test_affinity_keys_are_drawn_from_the_key_space(client_port):
+    run(LoadJob('load-1', ['127.0.0.1'], concurrency=2, count=50, keys=3, port=client_port))
+    assert FakeClient.keys <= {'key-0', 'key-1', 'key-2'} and len(FakeClient.keys) > 1
+
+
+def test_unreachable_clients_count_as_errors():
+    summary = run(LoadJob('load-1', ['127.0.0.1'], concurrency=1, count=3, timeout=0.5, port=1))
+    assert summary['by_client_zone']['unknown']['errors'] == 3
+
+
+def test_a_job_without_targets_fails():
+    summary = run(LoadJob('load-1', [], count=1))
+    assert summary['status'] == 'failed' and 'no client pods' in summary['error']
+
+
+def test_a_cancelled_job_stops(client_port):
+    job = LoadJob('load-1', ['127.0.0.1'], rps=50, duration=30, port=client_port)
+    job.start()
+    job.cancel()
+    assert job.wait(5)
+    assert job.summary()['status'] == 'cancelled'
+
+
+def test_engine_caps_running_jobs_and_keeps_recent_ones(client_port):
+    engine = LoadEngine(max_jobs=2, max_running=1, port=client_port)
+    first = engine.start(['127.0.0.1'], rps=50, duration=30)
+    with pytest.raises(TooManyJobs):
+        engine.start(['127.0.0.1'], count=1)
+    first.cancel()
+    assert first.wait(5)
+    for _ in range(3):
+        assert engine.start(['127.0.0.1'], count=1).wait(5)
+    assert len(engine.jobs()) == 2
+    assert engine.get(first.job_id) is None
@@ -0,0 +1,57 @@
+# test_stream.py
+import json
+
+from stream import Broadcaster, diff, format_event
+
+
+def parse(chunk):
+    event, data = chunk.strip().split('\n')
+    return event.removeprefix('event: '), json.loads(data.removeprefix('data: '))
+
+
+def test_diff_goes_two_levels_deep_and_marks_removals():
+    old = {'summary': {'total': 1, 'same': 1}, 'pods': 3, 'gone': True}
+    new = {'summary': {'total': 2}, 'pods': 3, 'zones': ['a']}
+    assert diff(old, new) == {'summary': {'total': 2, 'same': None}, 'zones': ['a'], 'gone': None}
+    assert diff(new, new) == {}
+
+
+def test_a_new_viewer_starts_from_the_snapshot_then_gets_diffs():
+    broadcaster = Broadcaster()
+    broadcaster.publish({'total': 1, 'zones': {'a': 1}})
+    subscriber = broadcaster.subscribe()
+    broadcaster.publish({'total': 2, 'zones': {'a': 1}})
+    # Nothing changed, nothing sent
+    broadcaster.publish({'total': 2, 'zones': {'a': 1}})
+    assert parse(subscriber.queue.get_nowait()) == ('snapshot', {'total': 1, 'zones': {'a': 1}})
+    assert parse(subscriber.queue.get_nowait()) == ('diff', {'total': 2})
+    assert subscriber.queue.empty()
+
+
+def test_every_viewer_gets_the_same_encoded_event():
+    broadcaster = Broadcaster()
+    first, second = broadcaster.subscribe(), broadcaster.subscribe()
+    broadcaster.publish({'total': 1})
+    assert first.queue.get_nowait() is second.queue.get_nowait()
+
+
+def test_a_viewer_that_falls_behind_is_dropped():
+    broadcaster = Broadcaster(max_queue=2)
+    slow, fast = broadcaster.subscribe(), broadcaster.subscribe()
+    for total in range(3):
+        broadcaster.publish({'total': total})
+        fast.queue.get_nowait()
+    assert slow.dropped and not fast.dropped
+    assert broadcaster.stats() == {'subscribers': 1, 'dropped': 1}
+
+
+def test_events_open_with_the_retry_hint_and_keep_the_stream_alive():
+    broadcaster = Broadcaster(keepalive=0.01)
+    broadcaster.publish({'total': 1})
+    events = broadcaster.events()
+    assert next(events) == "retry: 2000\n\n"
+    assert next(events) == format_event('snapshot', {'total': 1})
+    assert next(events) == ": keepalive\n\n"
+    assert broadcaster.stats()['subscribers'] == 1
+    events.close()
+    assert broadcaster.stats()['subscribers'] == 0
@@ -0,0 +1,36 @@
+# test_timeseries.py
+from timeseries import CounterAccumulator
+
+
+def test_totals_add_each_pods_increase():
+    accumulator = CounterAccumulator(['requests', 'errors'])
+    assert accumulator.update({'p1': {'requests': 10}, 'p2': {'requests': 5, 'errors': 1}}) == \
+        {'requests': 15, 'errors': 1}
+    assert accumulator.update({'p1': {'requests': 12}, 'p2': {'requests': 5, 'errors': 1}}) == \
+        {'requests': 17, 'errors': 1}
+
+
+def test_restarted_pod_counts_from_zero_again():
+    accumulator = CounterAccumulator(['requests'])
+    accumulator.update({'p1': {'requests': 100}})
+    assert accumulator.update({'p1': {'requests': 3}}) == {'requests': 103}
+
+
+def test_pod_that_missed_a_scrape_keeps_its_baseline():
+    accumulator = CounterAccumulator(['requests'])
+    accumulator.update({'p1': {'requests': 10}, 'p2': {'requests': 10}})
+    assert accumulator.update({'p1': {'requests': 11}}, known_pods=['p1', 'p2']) == {'requests': 21}
+    assert accumulator.update({'p2': {'requests': 15}}, known_pods=['p1', 'p2']) == {'requests': 26}
+
+
+def test_pod_that_went_away_keeps_its_counts_in_the_totals():
+    accumulator = CounterAccumulator(['requests'])
+    accumulator.update({'p1': {'requests': 10}, 'p2': {'requests': 10}})
+    assert accumulator.update({'p1': {'requests': 11}}) == {'requests': 21}
+    # p2 was forgotten: coming back under the same name counts from scratch
+    assert accumulator.update({'p1': {'requests': 11}, 'p2': {'requests': 4}}) == {'requests': 25}
+
+
+def test_unknown_counters_are_ignored():
+    accumulator = CounterAccumulator(['requests'])
+    assert accumulator.update({'p1': {'requests': 1, 'other': 50}}) == {'requests': 1}
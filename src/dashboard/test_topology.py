@@ -0,0 +1,138 @@
+# test_topology.py
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import topology
+from topology import TopologySnapshot
+
+
+class FakeKube:
+    """list_node / list_namespaced_pod over fixed nodes and pods, counting calls"""
+
+    def __init__(self, nodes, pods, delay=None):
+        self.nodes = nodes    # name -> zone
+        self.pods = pods      # app -> [(node, ip)]
+        self.delay = delay    # Event the calls wait on, if any
+        self.calls = 0
+        self.fail = None
+
+    def _call(self):
+        self.calls += 1
+        if self.delay is not None:
+            self.delay.wait(5)
+        if self.fail:
+            raise self.fail
+
+    def list_node(self):
+        self._call()
+        return SimpleNamespace(items=[
+            SimpleNamespace(metadata=SimpleNamespace(name=name, labels={'topology.kubernetes.io/zone': zone}))
+            for name, zone in self.nodes.items()])
+
+    def list_namespaced_pod(self, namespace, label_selector):
+        self._call()
+        app = label_selector.split('=', 1)[1]
+        return SimpleNamespace(items=[
+            SimpleNamespace(spec=SimpleNamespace(node_name=node), status=SimpleNamespace(pod_ip=ip))
+            for node, ip in self.pods.get(app, [])])
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(topology.time, 'monotonic', clock)
+    return clock
+
+
+def fake_kube(**kwargs):
+    return FakeKube({'node-1': 'zone-a', 'node-2': 'zone-b'},
+                    {'backend': [('node-1', '10.0.0.1'), ('node-1', '10.0.0.2'), ('node-2', '10.0.1.1')],
+                     'client': [('node-2', '10.0.2.1'), (None, None)]}, **kwargs)
+
+
+def test_snapshot_counts_pods_per_zone(clock):
+    snapshot = TopologySnapshot(fake_kube(), ['backend', 'client'])
+    assert snapshot.get() == {'zones': ['zone-a', 'zone-b'],
+                              'pods': {'backend': {'zone-a': 2, 'zone-b': 1}, 'client': {'zone-b': 1}}}
+    assert snapshot.pod_ips('client') == ['10.0.2.1']
+
+
+def test_refreshes_at_most_once_per_ttl(clock):
+    kube = fake_kube()
+    snapshot = TopologySnapshot(kube, ['backend'], ttl=5.0)
+    first = snapshot.get()
+    clock.now += 4.9
+    assert snapshot.get() is first
+    assert kube.calls == 2
+    clock.now += 0.1
+    snapshot.get()
+    assert kube.calls == 4 and snapshot.refreshes == 2
+
+
+def test_concurrent_callers_share_one_refresh(clock):
+    release = threading.Event()
+    kube = fake_kube(delay=release)
+    snapshot = TopologySnapshot(kube, ['backend'])
+    results = []
+    callers = [threading.Thread(target=lambda: results.append(snapshot.get())) for _ in range(8)]
+    for caller in callers:
+        caller.start()
+    while not snapshot._refreshing:
+        threading.Event().wait(0.001)
+    # The others wait for the first snapshot instead of listing again
+    release.set()
+    for caller in callers:
+        caller.join()
+    assert kube.calls == 2
+    assert len(results) == 8 and all(result is results[0] for result in results)
+
+
+def test_callers_get_the_stale_snapshot_during_a_refresh(clock):
+    release = threading.Event()
+    kube = fake_kube()
+    snapshot = TopologySnapshot(kube, ['backend'], ttl=5.0)
+    stale = snapshot.get()
+    clock.now += 5
+    kube.delay = release
+    refresher = threading.Thread(target=snapshot.get)
+    refresher.start()
+    while not snapshot._refreshing:
+        threading.Event().wait(0.001)
+    # Served right away, without waiting for the refresh
+    assert snapshot.get() is stale
+    release.set()
+    refresher.join()
+    assert snapshot.refreshes == 2
+
+
+def test_errors_keep_the_last_snapshot_and_retry_soon(clock):
+    kube = fake_kube()
+    snapshot = TopologySnapshot(kube, ['backend'], ttl=5.0)
+    good = snapshot.get()
+    clock.now += 5
+    kube.fail = RuntimeError("apiserver down")
+    assert snapshot.get() is good
+    calls = kube.calls
+    clock.now += 0.5
+    snapshot.get()
+    assert kube.calls == calls
+    clock.now += 0.5
+    kube.fail = None
+    assert snapshot.get() is not good
+    assert snapshot.stats() == {'refreshes': 2, 'errors': 1}
+
+
+def test_an_error_before_any_snapshot_is_reported(clock):
+    kube = fake_kube()
+    kube.fail = RuntimeError("apiserver down")
+    assert TopologySnapshot(kube, ['backend']).get() == {'error': "apiserver down"}
@@ -0,0 +1,131 @@
+# timeseries.py
+import math
+import threading
+from array import array
+
+# (resolution in seconds, number of slots): 1 hour at 1s, 1 day at 10s,
+# 2 weeks at 1 minute
+DEFAULT_TIERS = ((1, 3600), (10, 8640), (60, 20160))
+
+
+class CounterAccumulator:
+    """Turns per-pod lifetime counters into fleet-wide monotonic totals.
+
+    Each scrape reports cumulative counters per pod. Only the increase since
+    that pod's previous report is added to the total, so a restarted pod (its
+    counters drop back to zero) or a pod that went away doesn't make the
+    fleet total go backwards.
+    """
+
+    def __init__(self, names):
+        self.names = tuple(names)
+        self.totals = {name: 0.0 for name in self.names}
+        self._last = {}  # pod -> {name: value}
+
+    def update(self, reports, known_pods=None):
+        """Fold in a scrape and return the new totals.
+
+        `reports` maps pod -> {name: cumulative value} for the pods that
+        answered. `known_pods` are all pods that currently exist: a pod that
+        missed one scrape keeps its baseline, only pods gone from
+        `known_pods` are forgotten.
+        """
+        for pod, values in reports.items():
+            last = self._last.get(pod, {})
+            for name in self.names:
+                value = values.get(name, 0)
+                previous = last.get(name, 0)
+                self.totals[name] += value - previous if value >= previous else value
+            self._last[pod] = {name: values.get(name, 0) for name in self.names}
+        # Forget pods that went away; their counts stay in the totals
+        known_pods = set(reports) if known_pods is None else set(known_pods) | set(reports)
+        for pod in [pod for pod in self._last if pod not in known_pods]:
+            del self._last[pod]
+        return dict(self.totals)
+
+
+class TimeSeriesStore:
+    """Fixed-size, array-backed history of cumulative counters.
+
+    Every tier is a ring of `slots` samples at `resolution` seconds; a sample
+    written at time t lands in slot t // resolution of every tier, the last
+    write in an interval winning. Since the stored values are cumulative,
+    keeping only the last value per interval loses nothing for deltas and
+    rates at that resolution. Memory is fixed up front: one float per slot
+    per series plus one slot id per slot per tier.
+    """
+
+    def __init__(self, names, tiers=DEFAULT_TIERS):
+        self.names = tuple(names)
+        self.tiers = []
+        for resolution, slots in tiers:
+            self.tiers.append({
+                'resolution': resolution,
+                'slots': slots,
+                'ids': array('q', [-1]) * slots,
+                'values': {name: array('d', [math.nan]) * slots for name in self.names},
+            })
+        self._lock = threading.Lock()
+        self.latest_time = None
+
+    def append(self, timestamp, values):
+        with self._lock:
+            for tier in self.tiers:
+                slot_id = int(timestamp // tier['resolution'])
+                index = slot_id % tier['slots']
+                tier['ids'][index] = slot_id
+                for name in self.names:
+                    tier['values'][name][index] = values.get(name, math.nan)
+            self.latest_time = timestamp
+
+    def _pick_tier(self, since, step, now):
+        # Finest tier that still covers `since` and isn't finer than needed
+        for tier in self.tiers:
+            covers = now - since <= tier['resolution'] * tier['slots']
+            if covers and tier['resolution'] <= max(step, self.tiers[0]['resolution']):
+                return tier
+        for tier in self.tiers:
+            if now - since <= tier['resolution'] * tier['slots']:
+                return tier
+        return self.tiers[-1]
+
+    def _value_at(self, tier, timestamp, name, max_gap=5):
+        """Most recent value at or before `timestamp`, looking back up to `max_gap` slots"""
+        slot_id = int(timestamp // tier['resolution'])
+        for candidate in range(slot_id, slot_id - max_gap - 1, -1):
+            index = candidate % tier['slots']
+            if tier['ids'][index] == candidate:
+                value = tier['values'][name][index]
+                if not math.isnan(value):
+                    return value
+        return None
+
+    def query(self, since, step, now, max_points=1000):
+        """Deltas and per-second rates of every series over [since, now] in `step` buckets"""
+        with self._lock:
+            if self.latest_time is None:
+                return {'step': step, 'resolution': None, 'points': []}
+            now = min(now, self.latest_time)
+            since = max(since, now - self.tiers[-1]['resolution'] * self.tiers[-1]['slots'])
+            step = max(step, (now - since) / max_points)
+            tier = self._pick_tier(since, step, now)
+            step = max(step, tier['resolution'])
+
+            points = []
+            previous = {name: self._value_at(tier, since, name) for name in self.names}
+            t = since + step
+            while t <= now + 1e-9:
+                deltas = {}
+                rates = {}
+                for name in self.names:
+                    value = self._value_at(tier, t, name)
+                    if value is None or previous[name] is None:
+                        deltas[name] = rates[name] = None
+                    else:
+                        deltas[name] = value - previous[name]
+                        rates[name] = deltas[name] / step
+                    if value is not None:
+                        previous[name] = value
+                points.append({'t': t, 'deltas': deltas, 'rates': rates})
+                t += step
+            return {'step': step, 'resolution': tier['resolution'], 'points': points}
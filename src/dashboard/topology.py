@@ -0,0 +1,103 @@
+# topology.py
+import threading
+import time
+
+
+class TopologySnapshot:
+    """Zones, and pods per zone for a set of apps, refreshed at most every `ttl` seconds.
+
+    A refresh is one node list plus one pod list per app; pods are placed
+    in a zone through a node -> zone index instead of a read per pod.
+    Refreshes are single-flight: while one thread refreshes, the others get
+    the previous snapshot right away (or wait for it if there is none yet),
+    so any number of concurrent callers cost a single round of API calls.
+    """
+
+    def __init__(self, kube_client, apps, namespace="default", ttl=5.0):
+        self.kube_client = kube_client
+        self.apps = tuple(apps)
+        self.namespace = namespace
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._refreshed = threading.Condition(self._lock)
+        self._refreshing = False
+        self._snapshot = None
+        self._pod_ips = {}
+        self._expires = 0.0
+        self.refreshes = 0
+        self.errors = 0
+
+    def get(self):
+        """The current {'zones': [...], 'pods': {app: {zone: count}}} snapshot"""
+        self._ensure_fresh()
+        return self._snapshot
+
+    def pod_ips(self, app):
+        """IPs of an app's running pods as of the last refresh"""
+        self._ensure_fresh()
+        return self._pod_ips.get(app, [])
+
+    def _ensure_fresh(self):
+        if time.monotonic() < self._expires:
+            return
+        with self._lock:
+            if time.monotonic() < self._expires:
+                return
+            if self._refreshing:
+                # Someone else is on it: serve the stale snapshot if there is one
+                while self._refreshing and self._snapshot is None:
+                    self._refreshed.wait()
+                return
+            self._refreshing = True
+        try:
+            snapshot, pod_ips = self._load()
+        except Exception as e:
+            print(f"Exception when calling Kubernetes API: {e}")
+            with self._lock:
+                self.errors += 1
+                if self._snapshot is None or 'error' in self._snapshot:
+                    self._snapshot = {'error': str(e)}
+                # Retry after a short pause instead of on every call
+                self._expires = time.monotonic() + min(self.ttl, 1.0)
+                self._refreshing = False
+                self._refreshed.notify_all()
+            return
+        with self._lock:
+            self._snapshot = snapshot
+            self._pod_ips = pod_ips
+            self._expires = time.monotonic() + self.ttl
+            self.refreshes += 1
+            self._refreshing = False
+            self._refreshed.notify_all()
+
+    def _load(self):
+        # Node -> zone index from a single list
+        zone_of = {}
+        zones = []
+        for node in self.kube_client.list_node().items:
+            zone = (node.metadata.labels or {}).get('topology.kubernetes.io/zone')
+            zone_of[node.metadata.name] = zone or 'unknown'
+            if zone and zone not in zones:
+                zones.append(zone)
+
+        pods = {}
+        pod_ips = {}
+        for app in self.apps:
+            app_pods = self.kube_client.list_namespaced_pod(
+                namespace=self.namespace,
+                label_selector=f"app={app}"
+            )
+            app_pods_by_zone = {}
+            ips = []
+            for pod in app_pods.items:
+                if pod.status.pod_ip:
+                    ips.append(pod.status.pod_ip)
+                if pod.spec.node_name:
+                    pod_zone = zone_of.get(pod.spec.node_name, 'unknown')
+                    app_pods_by_zone[pod_zone] = app_pods_by_zone.get(pod_zone, 0) + 1
+            pods[app] = app_pods_by_zone
+            pod_ips[app] = ips
+        return {'zones': zones, 'pods': pods}, pod_ips
+
+    def stats(self):
+        return {'refreshes': self.refreshes, 'errors': self.errors}
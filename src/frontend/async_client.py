@@ -0,0 +1,282 @@
+# async_client.py
+#
+# asyncio variant of the client service. Same /make-request, /metrics and
+# /health contract as client.py, but backend calls don't hold a worker thread,
+# so one pod can keep hundreds of them in flight.
+import asyncio
+import functools
+import json
+import os
+import time
+
+import aiohttp
+from aiohttp import web
+
+# Discovery, zone lookup, backend selection and metrics are shared with the
+# Flask client
+import client as core
+from coalescing import AsyncCoalescer, item_result
+from profiling import ProfilerBusy, profile_params
+from transfer import aiohttp_sizes
+
+# Upper bounds for /make-request?count=N&concurrency=C
+MAX_COUNT = int(os.environ.get("MAX_FANOUT_COUNT", "10000"))
+MAX_CONCURRENCY = int(os.environ.get("MAX_FANOUT_CONCURRENCY", "500"))
+
+async def send_batch(session, target_ip, items):
+    """POST work items to a backend's /status/batch, yielding (index, payload
+    or exception) for each item as its line of the reply streams in"""
+    core.metrics_registry.inc('batches')
+    core.metrics_registry.inc('batched_requests', (), len(items))
+    request_body = json.dumps({'items': items}).encode()
+    body_read = 0
+    async with session.post(f"http://{target_ip}:8080/status/batch", data=request_body,
+                            headers={'Content-Type': 'application/json'}) as response:
+        try:
+            response.raise_for_status()
+            async for line in response.content:
+                body_read += len(line)
+                if line.strip():
+                    with core.stages('decode'):
+                        yield item_result(json.loads(line))
+        finally:
+            core.record_transfer(core.backend_zone_by_ip.get(target_ip, "unknown"),
+                                 *aiohttp_sizes(response, None, request_body, body_read))
+
+# With COALESCING=on, set up in on_startup once the backend session exists
+coalescer = None
+
+async def fetch_status(session, target_ip, key=None):
+    """GET /status on a backend, or send it as a batched item when
+    coalescing, reporting the outcome to routing and health tracking"""
+    core.backend_call_started(target_ip)
+    started = time.monotonic()
+    outcome = "error"
+    try:
+        if coalescer:
+            with core.stages('upstream'):
+                backend_data = await coalescer.submit(target_ip, core.batch_item(key))
+        else:
+            with core.stages('upstream'):
+                async with session.get(f"http://{target_ip}:8080/status",
+                                       headers=core.affinity_headers(key)) as response:
+                    body = await response.read()
+            core.record_transfer(core.backend_zone_by_ip.get(target_ip, "unknown"), *aiohttp_sizes(response, body))
+            response.raise_for_status()
+            with core.stages('decode'):
+                backend_data = json.loads(body)
+        outcome = "success"
+        return backend_data
+    except asyncio.CancelledError:
+        outcome = "cancelled"
+        raise
+    except asyncio.TimeoutError:
+        outcome = "timeout"
+        raise
+    finally:
+        core.backend_call_finished(target_ip, time.monotonic() - started, outcome)
+
+async def hedged_fetch_status(session, target_ip, key=None):
+    """fetch_status with a hedge to a second backend if the first one is slow"""
+    hedger = core.hedger
+    hedger.budget.on_request()
+    delay = hedger.delay()
+    primary = asyncio.ensure_future(fetch_status(session, target_ip, key))
+    if delay is None:
+        return await primary
+
+    done, _ = await asyncio.wait({primary}, timeout=delay)
+    alternate = None
+    if not done and hedger.budget.try_acquire():
+        alternate = core.pick_hedge_target(target_ip, key)
+    if alternate is None:
+        return await primary
+
+    hedge = asyncio.ensure_future(fetch_status(session, alternate, key))
+    pending = {primary, hedge}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    core.record_hedge(True, task is hedge)
+                    return task.result()
+        core.record_hedge(True, False)
+        return primary.result()
+    finally:
+        # Unlike the threaded client, the loser's request really is aborted
+        for task in pending:
+            task.cancel()
+
+async def call_backend(session, key=None):
+    """Route one request to a backend, returning (result, latency in seconds)"""
+    target_ip, target_zone = core.select_backend(key)
+    started = time.monotonic()
+    try:
+        if not target_ip:
+            # Use service name when IP not available
+            async with session.get("http://backend-service/status", headers=core.affinity_headers(key),
+                                   raise_for_status=True) as response:
+                body = await response.read()
+                backend_data = json.loads(body)
+                core.record_transfer(backend_data.get('zone', 'unknown'), *aiohttp_sizes(response, body))
+        elif core.hedger:
+            backend_data = await hedged_fetch_status(session, target_ip, key)
+        else:
+            backend_data = await fetch_status(session, target_ip, key)
+        latency = time.monotonic() - started
+        with core.stages('record'):
+            result = core.record_response(backend_data, latency)
+    except Exception as e:
+        latency = time.monotonic() - started
+        result = core.record_error(target_zone, str(e) or type(e).__name__)
+    return result, latency
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))
+    return sorted_values[index]
+
+def summarize(results, concurrency, elapsed):
+    """Aggregate the results of a fan-out into one response"""
+    latencies = sorted(latency * 1000 for _, latency in results)
+    by_backend_zone = {}
+    errors = []
+    succeeded = same_zone = 0
+    for result, _ in results:
+        if result['success']:
+            succeeded += 1
+            same_zone += result['same_zone']
+            zone = result['backend_zone']
+            by_backend_zone[zone] = by_backend_zone.get(zone, 0) + 1
+        elif len(errors) < 10:
+            errors.append(result['error'])
+
+    return {
+        'success': succeeded == len(results),
+        'client_zone': core.CURRENT_ZONE,
+        'count': len(results),
+        'concurrency': concurrency,
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded,
+        'same_zone': same_zone,
+        'cross_zone': succeeded - same_zone,
+        'by_backend_zone': by_backend_zone,
+        'duration_ms': elapsed * 1000,
+        'requests_per_second': len(results) / elapsed if elapsed > 0 else 0,
+        'latency_ms': {
+            'p50': percentile(latencies, 50),
+            'p90': percentile(latencies, 90),
+            'p99': percentile(latencies, 99),
+            'max': latencies[-1] if latencies else 0
+        },
+        'errors': errors
+    }
+
+async def make_request(request):
+    session = request.app['backend_session']
+    key = core.affinity_key(request.headers, request.query)
+
+    try:
+        count = int(request.query.get('count', 1))
+        concurrency = int(request.query.get('concurrency', count))
+    except ValueError:
+        return web.json_response({'success': False, 'error': 'count and concurrency must be integers'}, status=400)
+    count = max(1, min(count, MAX_COUNT))
+    concurrency = max(1, min(concurrency, count, MAX_CONCURRENCY))
+
+    if count == 1:
+        # Plain single request, same response as the Flask client
+        result, _ = await call_backend(session, key)
+        with core.stages('encode'):
+            return web.json_response(result, status=200 if result['success'] else 500)
+
+    # Fan out with at most `concurrency` requests in flight
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded_call():
+        async with semaphore:
+            return await call_backend(session, key)
+
+    started = time.monotonic()
+    results = await asyncio.gather(*(bounded_call() for _ in range(count)))
+    summary = summarize(results, concurrency, time.monotonic() - started)
+    with core.stages('encode'):
+        return web.json_response(summary, status=200 if summary['succeeded'] else 500)
+
+async def metrics(request):
+    return web.json_response(core.metrics_snapshot())
+
+async def prometheus(request):
+    return web.Response(body=core.render_prometheus().encode(),
+                        headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+async def debug_stages(request):
+    return web.json_response(core.stages_payload())
+
+async def debug_profile(request):
+    """Sample every thread, the event loop's included, for ?seconds=N"""
+    try:
+        seconds, interval = profile_params(request.query)
+    except ValueError as e:
+        return web.json_response({'error': str(e)}, status=400)
+    try:
+        # Sampled from a worker thread, so the loop keeps serving meanwhile
+        text, samples = await asyncio.get_running_loop().run_in_executor(
+            None, core.profiler.profile, seconds, interval)
+    except ProfilerBusy:
+        return web.json_response({'error': 'a profile is already running'}, status=409)
+    return web.Response(text=text, headers={'X-Profile-Samples': str(samples)})
+
+async def ready(request):
+    is_ready, payload = core.readiness()
+    return web.json_response(payload, status=200 if is_ready else 503)
+
+async def health(request):
+    return web.json_response(core.health_status())
+
+async def on_startup(app):
+    core.zone_resolver.start()
+    # Start watching backends before the first request comes in (off the
+    # loop: the first one imports the kubernetes client)
+    await asyncio.get_running_loop().run_in_executor(None, core.start_discovery)
+    if core.metrics_reporter:
+        core.metrics_reporter.start()
+
+    connect_timeout, read_timeout = core.backend_pools.timeout
+    connector = aiohttp.TCPConnector(
+        limit=MAX_CONCURRENCY,
+        limit_per_host=0,
+        keepalive_timeout=core.backend_pools.idle_timeout
+    )
+    app['backend_session'] = aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+    )
+
+    global coalescer
+    if core.COALESCING:
+        coalescer = AsyncCoalescer(functools.partial(send_batch, app['backend_session']),
+                                   core.BATCH_WINDOW, core.BATCH_MAX_SIZE)
+
+async def on_cleanup(app):
+    await app['backend_session'].close()
+
+def create_app():
+    app = web.Application()
+    app.router.add_get('/make-request', make_request)
+    app.router.add_get('/metrics', metrics)
+    app.router.add_get('/metrics/prometheus', prometheus)
+    app.router.add_get('/debug/stages', debug_stages)
+    app.router.add_get('/debug/profile', debug_profile)
+    app.router.add_get('/ready', ready)
+    app.router.add_get('/health', health)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+if __name__ == '__main__':
+    app = create_app()
+    print("Starting async client service")
+    web.run_app(app, host=os.environ.get("BIND_ADDRESS", "0.0.0.0"), port=8080)
@@ -4,22 +4,33 @@ import requests
 import time
 import random
 import json
-from flask import Flask, jsonify
+from flask import Flask, Response, jsonify, request
 import socket
-import kubernetes.client
-from kubernetes.client.rest import ApiException
-from kubernetes import config
+import threading
+import uuid
+
+from coalescing import Coalescer, item_result
+from discovery import EndpointSliceCache, PodEndpointCache
+from hedging import Hedger
+from metrics import MetricsRegistry, TextExposition
+from outlier import OutlierDetector
+from pools import EndpointPools
+from profiling import STAGE_BUCKETS, ProfilerBusy, SamplingProfiler, StageTimer, profile_params, stage_summary
+from reporter import MetricsReporter
+from routing import create_policy, rendezvous_rank, route
+from shared import SharedEndpointTable, SharedEndpointView, SharedMetricsRegistry
+from startup import LazyApi, ZoneResolver, in_cluster, node_zone_lookup
+from transfer import requests_sizes
 
 app = Flask(__name__)
 
-# Try to load Kubernetes config
-try:
-    config.load_incluster_config()
-    kube_client = kubernetes.client.CoreV1Api()
-    IN_CLUSTER = True
-except:
-    IN_CLUSTER = False
+# The kubernetes client is only imported once something calls the API,
+# which workers never do
+IN_CLUSTER = in_cluster()
+if not IN_CLUSTER:
     print("Not running in Kubernetes cluster")
+kube_client = LazyApi("CoreV1Api")
+discovery_client = LazyApi("DiscoveryV1Api")
 
 # Get Pod information
 POD_NAME = os.environ.get("POD_NAME", "unknown")
@@ -27,143 +38,546 @@ POD_NAMESPACE = os.environ.get("POD_NAMESPACE", "default")
 NODE_NAME = os.environ.get("NODE_NAME", "unknown")
 POD_IP = os.environ.get("POD_IP", "127.0.0.1")
 
-# Get node information to determine the zone
+# Multi-worker mode (gunicorn.conf.py): a "publisher" process runs discovery
+# and writes the endpoint table to shared memory in SHARED_STATE_DIR, the
+# "worker" processes serve requests from it. "standalone" is a single process.
+CLIENT_ROLE = os.environ.get("CLIENT_ROLE", "standalone")
+SHARED_STATE_DIR = os.environ.get("SHARED_STATE_DIR", "/dev/shm/client-service")
+shared_endpoints = None
+if CLIENT_ROLE != "standalone":
+    shared_endpoints = SharedEndpointTable(os.path.join(SHARED_STATE_DIR, "endpoints.shm"))
+
+# The zone, from ZONE, the downward API labels in ZONE_LABELS_FILE or the
+# ZONE_CACHE_FILE of an earlier run, else read from the node in the
+# background (with backoff, refreshed every ZONE_LOOKUP_INTERVAL seconds).
+# Requests never wait for it; /ready reports 503 until it is known.
+# Workers take the publisher's from the shared table instead.
 CURRENT_ZONE = "unknown"
 
+def on_zone_resolved(zone):
+    global CURRENT_ZONE
+    CURRENT_ZONE = zone
+    if CLIENT_ROLE == "publisher":
+        publish_endpoints()
+
+zone_resolver = None
+if CLIENT_ROLE != "worker":
+    zone_resolver = ZoneResolver.from_env(node_zone_lookup(kube_client, NODE_NAME) if IN_CLUSTER else None)
+    zone_resolver.add_listener(on_zone_resolved)
+
 def get_current_zone():
+    """The resolved zone, no API call"""
     global CURRENT_ZONE
-    if not IN_CLUSTER:
-        return "unknown"
-    
-    try:
-        node = kube_client.read_node(NODE_NAME)
-        labels = node.metadata.labels
-        CURRENT_ZONE = labels.get("topology.kubernetes.io/zone", "unknown")
-        return CURRENT_ZONE
-    except ApiException as e:
-        print(f"Exception when calling CoreV1Api->read_node: {e}")
-        return "unknown"
-
-# Tracking metrics
-request_metrics = {
-    'same_zone_requests': 0,
-    'cross_zone_requests': 0,
-    'total_requests': 0,
-    'by_zone': {
-        'EU-FRANKFURT-1-AD-1': 0,
-        'EU-FRANKFURT-1-AD-2': 0,
-        'EU-FRANKFURT-1-AD-3': 0
-    }
+    if CLIENT_ROLE == "worker":
+        # The publisher resolved it
+        CURRENT_ZONE = (shared_endpoints.read()[1] or {}).get("zone", "unknown")
+    return CURRENT_ZONE
+
+# Tracking metrics: per-thread sharded counters, merged when /metrics is read.
+# Requests and latencies are keyed by (client zone, backend zone).
+# With several workers each one counts in shared memory and reads sum them all.
+if CLIENT_ROLE == "standalone":
+    metrics_registry = MetricsRegistry()
+else:
+    metrics_registry = SharedMetricsRegistry(SHARED_STATE_DIR)
+
+# Prometheus text exposition of the same registry, for /metrics/prometheus
+prometheus_metrics = TextExposition(metrics_registry, {
+    'requests': ('routing_requests_total', 'counter',
+                 'Backend requests answered, by client and backend zone', ('client_zone', 'backend_zone')),
+    'failed_requests': ('routing_failed_requests_total', 'counter',
+                        'Backend requests that failed, by client and target zone', ('client_zone', 'target_zone')),
+    'request_bytes': ('routing_request_bytes_total', 'counter',
+                      'Bytes sent to backends, by client and backend zone', ('client_zone', 'backend_zone')),
+    'response_bytes': ('routing_response_bytes_total', 'counter',
+                       'Bytes received from backends, by client and backend zone', ('client_zone', 'backend_zone')),
+    'routed': ('routing_decisions_total', 'counter',
+               'Routing decisions, by target zone', ('target_zone',)),
+    'hedged_requests': ('routing_hedged_requests_total', 'counter',
+                        'Hedge requests sent to a second backend', ()),
+    'hedge_wins': ('routing_hedge_wins_total', 'counter',
+                   'Hedge requests that answered before the primary', ()),
+    'batches': ('routing_batches_total', 'counter',
+                'Coalesced batch requests sent to backends', ()),
+    'batched_requests': ('routing_batched_requests_total', 'counter',
+                         'Backend requests sent as part of a batch', ()),
+    'latency': ('routing_request_duration_seconds', 'histogram',
+                'Backend request latency, by client and backend zone', ('client_zone', 'backend_zone')),
+})
+
+# Time per /make-request stage, in a registry of its own for the finer buckets
+if CLIENT_ROLE == "standalone":
+    stage_registry = MetricsRegistry(STAGE_BUCKETS)
+else:
+    stage_registry = SharedMetricsRegistry(SHARED_STATE_DIR, buckets=STAGE_BUCKETS, name="stages")
+stages = StageTimer(stage_registry)
+stage_metrics = TextExposition(stage_registry, {
+    'stage': ('client_stage_seconds', 'histogram', 'Time spent per /make-request stage', ('stage',)),
+})
+
+# /debug/profile sampling, idle until called, at most PROFILE_MAX_SECONDS per call
+profiler = SamplingProfiler(max_seconds=float(os.environ.get("PROFILE_MAX_SECONDS", "60")))
+
+# Keep-alive connection pools per backend endpoint
+backend_pools = EndpointPools(
+    port=8080,
+    pool_size=int(os.environ.get("BACKEND_POOL_SIZE", "10")),
+    connect_timeout=float(os.environ.get("BACKEND_CONNECT_TIMEOUT", "0.5")),
+    read_timeout=float(os.environ.get("BACKEND_READ_TIMEOUT", "2")),
+    idle_timeout=float(os.environ.get("BACKEND_IDLE_TIMEOUT", "60"))
+)
+
+# How a backend is picked among the discovered endpoints: "zone-preference"
+# (fixed same-zone probability), "least-latency" (EWMA + power of two
+# choices; BACKEND_PARALLELISM is how many of this client's requests one
+# backend serves side by side, its MAX_CONCURRENCY shared by the client
+# pods), "zone-weighted" (zone shares from backend capacity vs client
+# demand) or "affinity" (rendezvous hashing of the request key, bounded load,
+# endpoints weighted down by their outlier ejections)
+routing_policy = create_policy(
+    os.environ.get("ROUTING_POLICY", "zone-preference"),
+    same_zone_preference=float(os.environ.get("SAME_ZONE_PREFERENCE", "0.8")),
+    cross_zone_penalty=float(os.environ.get("CROSS_ZONE_PENALTY_MS", "20")) / 1000,
+    decay_time=float(os.environ.get("LATENCY_DECAY_SECONDS", "5")),
+    parallelism=int(os.environ.get("BACKEND_PARALLELISM", "32")),
+    demand_source=(lambda: get_pods_by_zone("client-service")) if IN_CLUSTER else None,
+    load_factor=float(os.environ.get("AFFINITY_LOAD_FACTOR", "1.25")),
+    weight_source=lambda: outlier_detector.weights()
+)
+
+# Where a request's affinity key comes from: a header, else a query parameter.
+# It is forwarded to the backend in the same header.
+AFFINITY_HEADER = os.environ.get("AFFINITY_HEADER", "X-Affinity-Key")
+AFFINITY_PARAM = os.environ.get("AFFINITY_PARAM", "key")
+
+# Passive health checking: backends that keep failing, time out or are far
+# slower than their zone peers are ejected for an exponentially growing time
+outlier_detector = OutlierDetector(
+    consecutive_errors=int(os.environ.get("OUTLIER_CONSECUTIVE_ERRORS", "5")),
+    consecutive_timeouts=int(os.environ.get("OUTLIER_CONSECUTIVE_TIMEOUTS", "3")),
+    base_ejection_time=float(os.environ.get("OUTLIER_BASE_EJECTION_SECONDS", "10")),
+    max_ejection_time=float(os.environ.get("OUTLIER_MAX_EJECTION_SECONDS", "300")),
+    max_ejection_percent=float(os.environ.get("OUTLIER_MAX_EJECTION_PERCENT", "50")),
+    latency_factor=float(os.environ.get("OUTLIER_LATENCY_FACTOR", "3"))
+)
+
+# Hedging: if a backend hasn't answered by the HEDGE_PERCENTILE latency, send
+# the same request to a second backend and take whichever answers first
+hedger = None
+if os.environ.get("HEDGING", "off") == "on":
+    hedger = Hedger(
+        percentile=float(os.environ.get("HEDGE_PERCENTILE", "95")),
+        budget_percent=float(os.environ.get("HEDGE_BUDGET_PERCENT", "10"))
+    )
+
+# Coalescing: with COALESCING=on, calls to the same backend that arrive
+# within BATCH_WINDOW_MS of the first one (at most BATCH_MAX_SIZE, which must
+# not exceed the backends' BATCH_MAX_ITEMS) go out as one POST /status/batch,
+# at most BATCH_MAX_INFLIGHT batches at a time
+COALESCING = os.environ.get("COALESCING", "off") == "on"
+BATCH_WINDOW = float(os.environ.get("BATCH_WINDOW_MS", "2")) / 1000
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", "32"))
+BATCH_MAX_INFLIGHT = int(os.environ.get("BATCH_MAX_INFLIGHT", "32"))
+
+# Requests through the Service VIP (fallback when no endpoint is known)
+service_session = requests.Session()
+
+# Endpoint caches per (service, namespace), each kept current by a background watch
+endpoint_caches = {}
+endpoint_caches_lock = threading.Lock()
+# The shared table has a single writer, informer threads take turns
+shared_publish_lock = threading.Lock()
+
+# "pods" builds zones from pods and their nodes, "endpointslices" reads the
+# Service's EndpointSlices including the controller's topology hints
+DISCOVERY_MODE = os.environ.get("DISCOVERY_MODE", "pods")
+
+# Backend IP -> zone, for counting bytes against the zone they went to
+backend_zone_by_ip = {}
+
+def on_backends_changed(backends_by_zone):
+    """Drop pools and routing state of backends that went away"""
+    global backend_zone_by_ip
+    backend_zone_by_ip = {ip: zone for zone, zone_ips in backends_by_zone.items() for ip in zone_ips}
+    ips = set(backend_zone_by_ip)
+    backend_pools.retain(ips)
+    routing_policy.retain(ips)
+    outlier_detector.retain(ips)
+
+def get_endpoint_cache(service_name, namespace="default"):
+    """Get the endpoint cache for a service, starting its watch on first use.
+
+    Never waits for the first list: until it is in, the cache is empty and
+    requests go through the Service, while /ready reports 503.
+    """
+    key = (service_name, namespace)
+    cache = endpoint_caches.get(key)
+    if cache is None:
+        with endpoint_caches_lock:
+            cache = endpoint_caches.get(key)
+            if cache is None:
+                if CLIENT_ROLE == "worker":
+                    cache = SharedEndpointView(shared_endpoints, f"{namespace}/{service_name}")
+                elif DISCOVERY_MODE == "endpointslices":
+                    cache = EndpointSliceCache(discovery_client, service_name, namespace)
+                else:
+                    cache = PodEndpointCache(kube_client, service_name, namespace)
+                if service_name == "backend-service":
+                    cache.add_listener(on_backends_changed)
+                if CLIENT_ROLE == "publisher":
+                    cache.add_listener(lambda _: publish_endpoints())
+                cache.start()
+                endpoint_caches[key] = cache
+    return cache
+
+def publish_endpoints():
+    """Write the zone and every watched service's endpoints to the shared table"""
+    caches = dict(endpoint_caches)
+    with shared_publish_lock:
+        shared_endpoints.publish({
+            'zone': CURRENT_ZONE,
+            'zone_resolved': zone_resolver.resolved,
+            'services': {f"{namespace}/{name}": {'endpoints': cache.snapshot(), 'hints': cache.hints(),
+                                                 'synced': cache.wait_for_sync(0)}
+                         for (name, namespace), cache in caches.items()}
+        })
+
+# Mock data for testing outside of cluster. One object for every call, like
+# a cache snapshot between changes, so the identity caches of the routing
+# table and the outlier filter keep hitting.
+MOCK_PODS_BY_ZONE = {
+    'EU-FRANKFURT-1-AD-1': ['backend-1'],
+    'EU-FRANKFURT-1-AD-2': ['backend-2'],
+    'EU-FRANKFURT-1-AD-3': ['backend-3']
 }
 
 def get_pods_by_zone(service_name, namespace="default"):
     """Get pods grouped by zone for a service"""
     if not IN_CLUSTER:
-        # Mock data for testing outside of cluster
-        return {
-            'EU-FRANKFURT-1-AD-1': ['backend-1'],
-            'EU-FRANKFURT-1-AD-2': ['backend-2'],
-            'EU-FRANKFURT-1-AD-3': ['backend-3']
-        }
+        return MOCK_PODS_BY_ZONE
     
-    try:
-        pods = kube_client.list_namespaced_pod(
-            namespace=namespace,
-            label_selector=f"app={service_name}"
-        )
-        
-        pods_by_zone = {}
-        for pod in pods.items:
-            pod_node_name = pod.spec.node_name
-            if pod_node_name:
-                node = kube_client.read_node(pod_node_name)
-                pod_zone = node.metadata.labels.get("topology.kubernetes.io/zone", "unknown")
-                
-                if pod_zone not in pods_by_zone:
-                    pods_by_zone[pod_zone] = []
-                
-                pods_by_zone[pod_zone].append(pod.status.pod_ip)
+    # Served from the watch-maintained index, no API call and no waiting on
+    # the request path
+    return get_endpoint_cache(service_name, namespace).snapshot()
+
+def get_hinted_endpoints(service_name, zone, namespace="default"):
+    """Get the (ip, zone) endpoints the EndpointSlice controller allocated to a zone"""
+    if not IN_CLUSTER:
+        return []
+    return get_endpoint_cache(service_name, namespace).hints().get(zone, [])
+
+def affinity_key(headers, args):
+    """The request's affinity key, None if it has none"""
+    return headers.get(AFFINITY_HEADER) or args.get(AFFINITY_PARAM) or None
+
+def affinity_headers(key):
+    return {AFFINITY_HEADER: key} if key is not None else None
+
+def select_backend(key=None):
+    """Pick the (target_ip, target_zone) for the next backend request.
+
+    A target_ip of None means no endpoint is known and the request should go
+    through the backend Service instead.
+    """
+    with stages('discovery'):
+        # Get backend pods by zone, minus the ones ejected as outliers
+        backends_by_zone = outlier_detector.filter(get_pods_by_zone("backend-service"))
         
-        return pods_by_zone
-    except ApiException as e:
-        print(f"Exception when calling CoreV1Api: {e}")
-        return {}
+        # Endpoints the EndpointSlice controller allocated to our zone, if it published hints
+        hinted_backends = [endpoint for endpoint in get_hinted_endpoints("backend-service", CURRENT_ZONE)
+                           if outlier_detector.available(endpoint[0])]
+    
+    # Hints first, then the routing policy; the Service if there is no zone info
+    with stages('select'):
+        target_ip, target_zone = route(backends_by_zone, CURRENT_ZONE, routing_policy, hinted_backends, key)
+    
+    # Same/cross-zone is counted once the backend tells us its zone
+    metrics_registry.inc('routed', (target_zone,))
+    
+    return target_ip, target_zone
+
+def backend_call_started(target_ip):
+    """Let routing and health tracking know a call to a backend is starting"""
+    routing_policy.request_started(target_ip)
+    outlier_detector.request_started(target_ip)
+
+def backend_call_finished(target_ip, latency, outcome):
+    """Report how a backend call went: success, error, timeout or cancelled"""
+    if outcome == "cancelled":
+        # A hedge loser we gave up on says nothing about the backend's health
+        routing_policy.request_cancelled(target_ip)
+        outlier_detector.request_cancelled(target_ip)
+        return
+    routing_policy.request_finished(target_ip, latency, outcome == "success")
+    outlier_detector.request_finished(target_ip, latency, outcome)
+    if hedger and outcome == "success":
+        hedger.histogram.record(latency)
+
+def pick_hedge_target(primary_ip, key=None):
+    """Pick a second backend for a hedge, preferring the client's zone. A
+    keyed request goes to the key's next-ranked backend, its most likely
+    warm cache after the primary's."""
+    backends_by_zone = outlier_detector.filter(get_pods_by_zone("backend-service"))
+    candidates = [ip for ip in backends_by_zone.get(CURRENT_ZONE, []) if ip != primary_ip]
+    if not candidates:
+        candidates = [ip for zone, ips in backends_by_zone.items() if zone != CURRENT_ZONE
+                      for ip in ips if ip != primary_ip]
+    if not candidates:
+        return None
+    if key is not None:
+        return rendezvous_rank(key, candidates)[0]
+    return random.choice(candidates)
+
+def record_hedge(hedged, hedge_won):
+    if hedged:
+        metrics_registry.inc('hedged_requests')
+    if hedge_won:
+        metrics_registry.inc('hedge_wins')
+
+def batch_item(key):
+    """The /status/batch work item for one request"""
+    return {'key': key} if key is not None else {}
+
+def send_batch(target_ip, items):
+    """POST work items to a backend's /status/batch, yielding (index, payload
+    or exception) for each item as its line of the reply streams in"""
+    metrics_registry.inc('batches')
+    metrics_registry.inc('batched_requests', (), len(items))
+    response = backend_pools.post(target_ip, "/status/batch", json={'items': items}, stream=True)
+    body_read = 0
+    try:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            body_read += len(line) + 1
+            if line:
+                with stages('decode'):
+                    yield item_result(json.loads(line))
+    finally:
+        record_transfer(backend_zone_by_ip.get(target_ip, "unknown"), *requests_sizes(response, body_read))
+        response.close()
+
+coalescer = Coalescer(send_batch, BATCH_WINDOW, BATCH_MAX_SIZE, BATCH_MAX_INFLIGHT) if COALESCING else None
+
+def call_backend(target_ip, key=None, abort=None):
+    """GET /status on a backend, or send it as a batched item when
+    coalescing, reporting the outcome to routing and health tracking. A call
+    aborted through `abort` (a hedge loser) is reported as cancelled."""
+    backend_call_started(target_ip)
+    started = time.monotonic()
+    outcome = "error"
+    try:
+        if coalescer:
+            with stages('upstream'):
+                backend_data = coalescer.submit(target_ip, batch_item(key), abort)
+        else:
+            with stages('upstream'):
+                response = backend_pools.get(target_ip, "/status", abort, headers=affinity_headers(key))
+            record_transfer(backend_zone_by_ip.get(target_ip, "unknown"), *requests_sizes(response))
+            response.raise_for_status()
+            with stages('decode'):
+                backend_data = response.json()
+        outcome = "success"
+        return backend_data
+    except requests.Timeout:
+        outcome = "timeout"
+        raise
+    except Exception:
+        if abort is not None and abort.aborted:
+            outcome = "cancelled"
+        raise
+    finally:
+        backend_call_finished(target_ip, time.monotonic() - started, outcome)
+
+def record_transfer(backend_zone, sent, received):
+    """Count the bytes of one backend call, hedges and failed calls included"""
+    zone_pair = (CURRENT_ZONE, backend_zone)
+    metrics_registry.inc('request_bytes', zone_pair, sent)
+    metrics_registry.inc('response_bytes', zone_pair, received)
+
+def record_response(backend_data, latency):
+    """Record which zone answered and build the /make-request result"""
+    backend_zone = backend_data.get('zone', 'unknown')
+    
+    # Check if we actually got same-zone routing
+    same_zone = (CURRENT_ZONE == backend_zone)
+    zone_pair = (CURRENT_ZONE, backend_zone)
+    metrics_registry.inc('requests', zone_pair)
+    metrics_registry.observe('latency', zone_pair, latency)
+    
+    return {
+        'success': True,
+        'client_zone': CURRENT_ZONE,
+        'backend_zone': backend_zone,
+        'same_zone': same_zone,
+        'backend_response': backend_data
+    }
+
+def record_error(target_zone, error):
+    """Build the /make-request result for a failed backend call"""
+    metrics_registry.inc('failed_requests', (CURRENT_ZONE, target_zone))
+    return {
+        'success': False,
+        'client_zone': CURRENT_ZONE,
+        'target_zone': target_zone,
+        'error': str(error)
+    }
 
 @app.route('/make-request')
 def make_request():
     # Get current zone if needed
-    if CURRENT_ZONE == "unknown":
-        get_current_zone()
+    with stages('zone'):
+        if CURRENT_ZONE == "unknown":
+            get_current_zone()
     
-    # Get backend pods by zone
-    backends_by_zone = get_pods_by_zone("backend-service")
-    
-    # Default to random selection if no zone info
-    if not backends_by_zone or CURRENT_ZONE == "unknown":
-        target_ip = requests.get("http://backend-service/health").json().get("pod_ip")
-        target_zone = "unknown"
-        request_metrics['cross_zone_requests'] += 1
-    else:
-        # Zone-aware routing - try same zone first
-        if CURRENT_ZONE in backends_by_zone and backends_by_zone[CURRENT_ZONE] and random.random() < 0.8:
-            # 80% preference for same zone
-            target_ip = random.choice(backends_by_zone[CURRENT_ZONE])
-            target_zone = CURRENT_ZONE
-            request_metrics['same_zone_requests'] += 1
-        else:
-            # Choose a different zone
-            other_zones = [zone for zone in backends_by_zone.keys() if zone != CURRENT_ZONE and backends_by_zone[zone]]
-            if other_zones:
-                target_zone = random.choice(other_zones)
-                target_ip = random.choice(backends_by_zone[target_zone])
-                request_metrics['cross_zone_requests'] += 1
-            else:
-                # Fallback if no other zones available
-                target_zone = CURRENT_ZONE if CURRENT_ZONE in backends_by_zone and backends_by_zone[CURRENT_ZONE] else "unknown"
-                if target_zone != "unknown":
-                    target_ip = random.choice(backends_by_zone[target_zone])
-                    request_metrics['same_zone_requests'] += 1
-                else:
-                    # Last resort
-                    target_ip = requests.get("http://backend-service/health").json().get("pod_ip")
-                    request_metrics['cross_zone_requests'] += 1
-    
-    request_metrics['total_requests'] += 1
-    if target_zone in request_metrics['by_zone']:
-        request_metrics['by_zone'][target_zone] += 1
+    key = affinity_key(request.headers, request.args)
+    target_ip, target_zone = select_backend(key)
     
     # Make the actual request
+    started = time.monotonic()
     try:
-        if target_ip:
-            response = requests.get(f"http://{target_ip}:8080/status")
-        else:
+        if not target_ip:
             # Use service name when IP not available
-            response = requests.get(f"http://backend-service/status")
-        
-        backend_data = response.json()
-        backend_zone = backend_data.get('zone', 'unknown')
-        
-        # Check if we actually got same-zone routing
-        same_zone = (CURRENT_ZONE == backend_zone)
-        if same_zone:
-            request_metrics['same_zone_requests'] += 1 
+            with stages('upstream'):
+                response = service_session.get("http://backend-service/status", headers=affinity_headers(key),
+                                               timeout=backend_pools.timeout)
+            with stages('decode'):
+                backend_data = response.json()
+            record_transfer(backend_data.get('zone', 'unknown'), *requests_sizes(response))
+        elif hedger:
+            backend_data, _, hedged, hedge_won = hedger.run(lambda ip, abort: call_backend(ip, key, abort),
+                                                            target_ip, lambda ip: pick_hedge_target(ip, key))
+            record_hedge(hedged, hedge_won)
         else:
-            request_metrics['cross_zone_requests'] += 1
-            
-        return jsonify({
-            'success': True,
-            'client_zone': CURRENT_ZONE,
-            'backend_zone': backend_zone,
-            'same_zone': same_zone,
-            'backend_response': backend_data
-        })
+            backend_data = call_backend(target_ip, key)
+        with stages('record'):
+            result = record_response(backend_data, time.monotonic() - started)
+        with stages('encode'):
+            return jsonify(result)
     except Exception as e:
-        return jsonify({
-            'success': False,
-            'client_zone': CURRENT_ZONE,
-            'target_zone': target_zone,
-            'error': str(e)
-        }), 500
+        return jsonify(record_error(target_zone, e)), 500
+
+def metrics_snapshot():
+    """Build the /metrics payload from the merged counters"""
+    counters, histograms = metrics_registry.collect()
+    
+    same_zone_requests = cross_zone_requests = failed_requests = 0
+    by_zone = {}
+    by_zone_pair = {}
+    bytes_by_zone_pair = {}
+    for (name, labels), value in counters.items():
+        if name == 'requests':
+            client_zone, backend_zone = labels
+            by_zone_pair.setdefault(client_zone, {})[backend_zone] = value
+            if client_zone == backend_zone:
+                same_zone_requests += value
+            else:
+                cross_zone_requests += value
+        elif name == 'failed_requests':
+            failed_requests += value
+        elif name == 'routed':
+            by_zone[labels[0]] = value
+        elif name in ('request_bytes', 'response_bytes'):
+            client_zone, backend_zone = labels
+            pair = bytes_by_zone_pair.setdefault(client_zone, {}).setdefault(backend_zone, {})
+            pair[name.split('_')[0]] = value
+    total_requests = sum(by_zone.values())
+    
+    latency = {}
+    for (name, (client_zone, backend_zone)), histogram in histograms.items():
+        if name == 'latency':
+            latency.setdefault(client_zone, {})[backend_zone] = histogram
+    
+    return {
+        'pod_name': POD_NAME,
+        'node_name': NODE_NAME,
+        'zone': CURRENT_ZONE,
+        'metrics': {
+            'same_zone_requests': same_zone_requests,
+            'cross_zone_requests': cross_zone_requests,
+            'failed_requests': failed_requests,
+            'total_requests': total_requests,
+            # Routing decisions by target zone
+            'by_zone': by_zone,
+            # Answered requests by client zone, then backend zone
+            'by_zone_pair': by_zone_pair,
+            # Request and response bytes on the wire, by client zone, then backend zone
+            'bytes_by_zone_pair': bytes_by_zone_pair,
+            'hedged_requests': counters.get(('hedged_requests', ()), 0),
+            'hedge_wins': counters.get(('hedge_wins', ()), 0),
+            'batches': counters.get(('batches', ()), 0),
+            'batched_requests': counters.get(('batched_requests', ()), 0)
+        },
+        'latency_histograms': {
+            'bucket_bounds_ms': [bound * 1000 for bound in metrics_registry.buckets],
+            'by_zone_pair': latency
+        },
+        'ejected_backends': outlier_detector.stats(),
+        'routing_policy': routing_policy.stats(),
+        'same_zone_percentage': (same_zone_requests / total_requests * 100)
+                              if total_requests > 0 else 0
+    }
+
+def start_discovery():
+    """Start the watches the client needs without waiting for their first list"""
+    if IN_CLUSTER:
+        get_endpoint_cache("backend-service")
+        if os.environ.get("ROUTING_POLICY") == "zone-weighted":
+            get_endpoint_cache("client-service")
+
+def readiness():
+    """(ready, /ready payload): ready once the zone is resolved and the
+    backends have been listed, or read from the shared table by a worker"""
+    if CLIENT_ROLE == "worker":
+        document = shared_endpoints.read()[1] or {}
+        zone = {'zone': document.get('zone', 'unknown'), 'resolved': document.get('zone_resolved', False)}
+    else:
+        zone = zone_resolver.stats()
+    ready = zone['resolved'] or not IN_CLUSTER
+    if IN_CLUSTER:
+        ready = ready and get_endpoint_cache("backend-service").wait_for_sync(0)
+    return ready, {'ready': ready, 'zone': zone, 'pod_name': POD_NAME}
+
+def health_status():
+    """Build the /health payload"""
+    return {
+        'status': 'healthy', 
+        'zone': CURRENT_ZONE,
+        'pod_name': POD_NAME,
+        'pod_ip': POD_IP
+    }
+
+def report_counters():
+    """Scalar counters pushed to the dashboard, zone pair traffic flattened to
+    traffic|<client zone>|<backend zone>|<requests, request_bytes or response_bytes>"""
+    metrics = metrics_snapshot()['metrics']
+    counters = {name: value for name, value in metrics.items() if not isinstance(value, dict)}
+    for client_zone, backends in metrics['by_zone_pair'].items():
+        for backend_zone, count in backends.items():
+            counters[f"traffic|{client_zone}|{backend_zone}|requests"] = count
+    for client_zone, backends in metrics['bytes_by_zone_pair'].items():
+        for backend_zone, sizes in backends.items():
+            for direction, size in sizes.items():
+                counters[f"traffic|{client_zone}|{backend_zone}|{direction}_bytes"] = size
+    return counters
+
+# Push mode: instead of the dashboard pulling /metrics from every pod, each
+# pod pushes its counter deltas to METRICS_PUSH_URL
+# (With several workers only the publisher pushes, the totals of all of them)
+metrics_reporter = None
+if os.environ.get("METRICS_PUSH_URL") and CLIENT_ROLE != "worker":
+    metrics_reporter = MetricsReporter(
+        os.environ["METRICS_PUSH_URL"],
+        # Unique per process, so a restarted pod's counters start a new series
+        f"{POD_NAME}-{uuid.uuid4().hex[:8]}",
+        report_counters,
+        meta=lambda: {'pod_name': POD_NAME, 'node_name': NODE_NAME, 'zone': CURRENT_ZONE},
+        interval=float(os.environ.get("METRICS_PUSH_INTERVAL", "5")),
+        jitter=float(os.environ.get("METRICS_PUSH_JITTER", "0.2"))
+    )
+
+def render_prometheus():
+    now = time.monotonic()
+    return prometheus_metrics.render(now) + stage_metrics.render(now)
 
 @app.route('/metrics')
 def metrics():
@@ -171,15 +585,38 @@ def metrics():
     if CURRENT_ZONE == "unknown":
         get_current_zone()
         
-    return jsonify({
-        'pod_name': POD_NAME,
-        'node_name': NODE_NAME,
-        'zone': CURRENT_ZONE,
-        'metrics': request_metrics,
-        'same_zone_percentage': (request_metrics['same_zone_requests'] / 
-                              request_metrics['total_requests'] * 100) 
-                              if request_metrics['total_requests'] > 0 else 0
-    })
+    return jsonify(metrics_snapshot())
+
+@app.route('/metrics/prometheus')
+def prometheus():
+    return Response(render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+def stages_payload():
+    _, histograms = stage_registry.collect()
+    by_stage = {labels[0]: histogram for (name, labels), histogram in histograms.items() if name == 'stage'}
+    return {'pod_name': POD_NAME, 'stages': stage_summary(by_stage, stage_registry.buckets)}
+
+@app.route('/debug/stages')
+def debug_stages():
+    return jsonify(stages_payload())
+
+@app.route('/debug/profile')
+def debug_profile():
+    """Sample every thread of this process for ?seconds=N and return collapsed stacks"""
+    try:
+        seconds, interval = profile_params(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        text, samples = profiler.profile(seconds, interval)
+    except ProfilerBusy:
+        return jsonify({'error': 'a profile is already running'}), 409
+    return Response(text, mimetype='text/plain', headers={'X-Profile-Samples': str(samples)})
+
+@app.route('/ready')
+def ready():
+    is_ready, payload = readiness()
+    return jsonify(payload), 200 if is_ready else 503
 
 @app.route('/health')
 def health():
@@ -187,15 +624,30 @@ def health():
     if CURRENT_ZONE == "unknown":
         get_current_zone()
         
-    return jsonify({
-        'status': 'healthy', 
-        'zone': CURRENT_ZONE,
-        'pod_name': POD_NAME,
-        'pod_ip': POD_IP
-    })
+    return jsonify(health_status())
+
+def run_endpoint_publisher():
+    """Publisher role: run discovery once for all workers, serve no requests"""
+    zone_resolver.start()
+    print(f"Publishing endpoints for zone {CURRENT_ZONE} to {SHARED_STATE_DIR}")
+    start_discovery()
+    publish_endpoints()
+    if metrics_reporter:
+        metrics_reporter.start()
+    # Once more when the first lists are in, even if they changed nothing
+    for cache in list(endpoint_caches.values()):
+        cache.wait_for_sync()
+    publish_endpoints()
+    # From here on zone and endpoint changes are published by their listeners
+    threading.Event().wait()
 
 if __name__ == '__main__':
-    # Initial zone lookup
-    get_current_zone()
-    print(f"Starting client service in zone: {CURRENT_ZONE}")
-    app.run(host='0.0.0.0', port=8080)
\ No newline at end of file
+    if CLIENT_ROLE == "publisher":
+        run_endpoint_publisher()
+    zone_resolver.start()
+    print(f"Starting client service in zone: {CURRENT_ZONE} (from {zone_resolver.source or 'a background lookup'})")
+    # Start watching backends before the first request comes in
+    start_discovery()
+    if metrics_reporter:
+        metrics_reporter.start()
+    app.run(host=os.environ.get("BIND_ADDRESS", "0.0.0.0"), port=8080)
\ No newline at end of file
@@ -0,0 +1,149 @@
+# coalescing.py
+import asyncio
+import threading
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
+
+from pools import Aborted
+
+
+class BatchItemError(Exception):
+    """A batched item that the backend answered with an error line"""
+
+
+class BatchIncomplete(Exception):
+    """The batch reply ended before every item had its line"""
+
+
+class _Batch:
+    def __init__(self):
+        self.items = []
+        self.futures = []
+        self.full = threading.Event()
+        self.timer = None
+
+
+def item_result(line):
+    """(index, payload or exception) for one decoded reply line"""
+    index = line['index']
+    if 'error' in line:
+        return index, BatchItemError(line['error'])
+    return index, line
+
+
+def _settle(future, result):
+    # A caller that gave up (a cancelled hedge) settles its future from its
+    # own thread, possibly between a done() check and the set here: the
+    # first one to settle wins
+    try:
+        if isinstance(result, Exception):
+            future.set_exception(result)
+        else:
+            future.set_result(result)
+    except (InvalidStateError, asyncio.InvalidStateError):
+        pass
+
+
+class Coalescer:
+    """Groups concurrent calls to the same endpoint into one batch request.
+
+    The first call for an endpoint opens a batch and waits up to `window`
+    seconds for others to join, or until `max_size` have. The batch then
+    goes out as one request on a pool of `max_batches` sender threads while
+    each caller waits for its own item. `send_batch(ip, items)` yields
+    (index, payload or exception) in whatever order the reply streams them,
+    so an item is handed back as soon as its line arrives, not when the
+    whole batch is done. The price is at most `window` of added latency.
+    """
+
+    def __init__(self, send_batch, window=0.002, max_size=32, max_batches=32):
+        self.send_batch = send_batch
+        self.window = window
+        self.max_size = max_size
+        self._executor = ThreadPoolExecutor(max_workers=max_batches, thread_name_prefix="coalesce")
+        self._lock = threading.Lock()
+        self._open = {}  # ip -> batch still taking items
+
+    def submit(self, ip, item, abort=None):
+        """Send `item` to `ip` as part of a batch and return its payload.
+        Aborting through `abort` only gives up on the answer, the item stays
+        in its batch."""
+        future = Future()
+        if abort is not None and not abort.bind(lambda: _settle(future, Aborted())):
+            raise Aborted()
+        with self._lock:
+            batch = self._open.get(ip)
+            leader = batch is None
+            if leader:
+                batch = self._open[ip] = _Batch()
+            batch.items.append(item)
+            batch.futures.append(future)
+            if len(batch.items) >= self.max_size:
+                del self._open[ip]
+                batch.full.set()
+        if leader:
+            batch.full.wait(self.window)
+            with self._lock:
+                if self._open.get(ip) is batch:
+                    del self._open[ip]
+            self._executor.submit(self._send, ip, batch)
+        try:
+            return future.result()
+        finally:
+            if abort is not None:
+                abort.finish()
+
+    def _send(self, ip, batch):
+        error = BatchIncomplete(f"batch reply from {ip} ended early")
+        try:
+            for index, result in self.send_batch(ip, batch.items):
+                _settle(batch.futures[index], result)
+        except Exception as e:
+            error = e
+        for future in batch.futures:
+            _settle(future, error)
+
+
+class AsyncCoalescer:
+    """Coalescer for a single event loop. The same batching, with a timer on
+    the loop instead of a waiting leader and a task per batch in flight;
+    `send_batch(ip, items)` is an async generator."""
+
+    def __init__(self, send_batch, window=0.002, max_size=32):
+        self.send_batch = send_batch
+        self.window = window
+        self.max_size = max_size
+        self._open = {}
+        self._sending = set()
+
+    async def submit(self, ip, item):
+        """Send `item` to `ip` as part of a batch and return its payload"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        batch = self._open.get(ip)
+        if batch is None:
+            batch = self._open[ip] = _Batch()
+            batch.timer = loop.call_later(self.window, self._flush, ip, batch)
+        batch.items.append(item)
+        batch.futures.append(future)
+        if len(batch.items) >= self.max_size:
+            batch.timer.cancel()
+            self._flush(ip, batch)
+        return await future
+
+    def _flush(self, ip, batch):
+        if self._open.get(ip) is batch:
+            del self._open[ip]
+        task = asyncio.ensure_future(self._send(ip, batch))
+        # The loop only keeps weak references to tasks
+        self._sending.add(task)
+        task.add_done_callback(self._sending.discard)
+
+    async def _send(self, ip, batch):
+        error = BatchIncomplete(f"batch reply from {ip} ended early")
+        try:
+            async for index, result in self.send_batch(ip, batch.items):
+                _settle(batch.futures[index], result)
+        except Exception as e:
+            error = e
+        for future in batch.futures:
+            _settle(future, error)
@@ -0,0 +1,313 @@
+# discovery.py
+import random
+import threading
+import time
+
+ZONE_LABEL = "topology.kubernetes.io/zone"
+
+
+class Informer:
+    """Background list/watch loop keeping a local copy of one kind of object.
+
+    The initial list hands every object to `on_replace`, then the loop watches
+    from the list's resourceVersion and hands each event to `on_event`. When
+    the resourceVersion expires (410 Gone) or `resync_period` has passed, the
+    objects are listed again, so a missed event can't leave the cache stale
+    for long.
+    """
+
+    def __init__(self, name, list_func, on_replace, on_event, resync_period=300, **list_kwargs):
+        self.name = name
+        self.list_func = list_func
+        self.on_replace = on_replace
+        self.on_event = on_event
+        self.resync_period = resync_period
+        self.list_kwargs = list_kwargs
+        self.resource_version = None
+        self.synced = threading.Event()
+        self._stopped = threading.Event()
+        self._watch = None
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"informer-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._watch:
+            self._watch.stop()
+
+    def _list(self):
+        result = self.list_func(**self.list_kwargs)
+        self.resource_version = result.metadata.resource_version
+        self.on_replace(result.items)
+        self.synced.set()
+
+    def _run(self):
+        # Imported here so that loading this module doesn't pull in the client
+        from kubernetes.client.rest import ApiException
+        backoff = 1
+        while not self._stopped.is_set():
+            try:
+                self._list()
+                resync_at = time.monotonic() + self.resync_period
+                while not self._stopped.is_set() and time.monotonic() < resync_at:
+                    self._watch_once(resync_at)
+                backoff = 1
+            except ApiException as e:
+                if e.status != 410:
+                    print(f"Informer {self.name} failed: {e}")
+                    self._stopped.wait(backoff)
+                    backoff = min(backoff * 2, 60)
+                # 410 Gone: our resourceVersion is too old, list again right away
+            except Exception as e:
+                print(f"Informer {self.name} failed: {e}")
+                self._stopped.wait(backoff)
+                backoff = min(backoff * 2, 60)
+
+    def _watch_once(self, resync_at):
+        # Bound each watch request so we get back control for the resync
+        from kubernetes import watch
+        timeout = max(1, int(resync_at - time.monotonic()))
+        self._watch = watch.Watch()
+        for event in self._watch.stream(self.list_func,
+                                        resource_version=self.resource_version,
+                                        timeout_seconds=timeout,
+                                        allow_watch_bookmarks=True,
+                                        **self.list_kwargs):
+            if event['type'] != 'BOOKMARK':
+                self.on_event(event['type'], event['object'])
+            self.resource_version = self._watch.resource_version
+            if self._stopped.is_set():
+                self._watch.stop()
+                break
+
+
+class PodEndpointCache:
+    """Zone -> pod IP index for an app, maintained from pod and node watches.
+
+    Readers call `snapshot()` which returns the current index without touching
+    the Kubernetes API. Each update builds a new dict and swaps it in, so a
+    snapshot handed out is never mutated afterwards.
+    """
+
+    def __init__(self, kube_client, app, namespace="default", resync_period=300):
+        self.app = app
+        self.version = 0
+        self._lock = threading.Lock()
+        self._node_zones = {}  # node name -> zone
+        self._pods = {}        # pod name -> (node name, pod ip)
+        self._snapshot = {}    # zone -> [pod ip]
+        self._listeners = []
+        # Jitter the resync so a fleet of clients doesn't relist in lockstep
+        resync_period = resync_period * random.uniform(0.8, 1.2)
+        self._informers = [
+            Informer("nodes", kube_client.list_node,
+                     self._replace_nodes, self._on_node_event, resync_period),
+            Informer(f"pods-{app}", kube_client.list_namespaced_pod,
+                     self._replace_pods, self._on_pod_event, resync_period,
+                     namespace=namespace, label_selector=f"app={app}"),
+        ]
+
+    def start(self):
+        for informer in self._informers:
+            informer.start()
+
+    def stop(self):
+        for informer in self._informers:
+            informer.stop()
+
+    def wait_for_sync(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for informer in self._informers:
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            if not informer.synced.wait(remaining):
+                return False
+        return True
+
+    def snapshot(self):
+        """Current zone -> [pod ip] map (must not be modified by the caller)"""
+        return self._snapshot
+
+    def hints(self):
+        # Pods carry no topology hints, routing falls back to zone membership
+        return {}
+
+    def add_listener(self, callback):
+        """Call `callback(snapshot)` whenever the set of endpoints changes"""
+        self._listeners.append(callback)
+
+    @staticmethod
+    def _node_zone(node):
+        labels = node.metadata.labels or {}
+        return labels.get(ZONE_LABEL, "unknown")
+
+    @staticmethod
+    def _pod_entry(pod):
+        # Only route to pods that are serving: scheduled, ready and not terminating
+        if pod.metadata.deletion_timestamp or not pod.spec.node_name or not pod.status.pod_ip:
+            return None
+        conditions = pod.status.conditions or []
+        if not any(c.type == "Ready" and c.status == "True" for c in conditions):
+            return None
+        return (pod.spec.node_name, pod.status.pod_ip)
+
+    def _replace_nodes(self, nodes):
+        with self._lock:
+            self._node_zones = {n.metadata.name: self._node_zone(n) for n in nodes}
+            self._rebuild()
+
+    def _on_node_event(self, event_type, node):
+        with self._lock:
+            name = node.metadata.name
+            if event_type == "DELETED":
+                changed = self._node_zones.pop(name, None) is not None
+            else:
+                zone = self._node_zone(node)
+                changed = self._node_zones.get(name) != zone
+                self._node_zones[name] = zone
+            # Node heartbeats produce a steady stream of MODIFIED events, only
+            # rebuild when a zone actually changed
+            if changed:
+                self._rebuild()
+
+    def _replace_pods(self, pods):
+        with self._lock:
+            self._pods = {}
+            for pod in pods:
+                entry = self._pod_entry(pod)
+                if entry:
+                    self._pods[pod.metadata.name] = entry
+            self._rebuild()
+
+    def _on_pod_event(self, event_type, pod):
+        with self._lock:
+            name = pod.metadata.name
+            entry = None if event_type == "DELETED" else self._pod_entry(pod)
+            if self._pods.get(name) == entry:
+                return
+            if entry:
+                self._pods[name] = entry
+            else:
+                self._pods.pop(name, None)
+            self._rebuild()
+
+    def _rebuild(self):
+        pods_by_zone = {}
+        for node_name, pod_ip in self._pods.values():
+            zone = self._node_zones.get(node_name, "unknown")
+            pods_by_zone.setdefault(zone, []).append(pod_ip)
+        for ips in pods_by_zone.values():
+            ips.sort()
+        if pods_by_zone == self._snapshot:
+            return
+        self._snapshot = pods_by_zone
+        self.version += 1
+        for callback in self._listeners:
+            try:
+                callback(pods_by_zone)
+            except Exception as e:
+                print(f"Endpoint listener failed: {e}")
+
+
+class EndpointSliceCache:
+    """Zone -> endpoint IP index for a Service, maintained from its EndpointSlices.
+
+    One watch on discovery.k8s.io/v1 EndpointSlices replaces the pod watch plus
+    node lookups: each endpoint already carries its `zone`, its
+    `conditions.ready` and, when the Service has topology-aware hints enabled,
+    the `hints.forZones` allocation computed by the EndpointSlice controller.
+    """
+
+    def __init__(self, discovery_client, service_name, namespace="default", resync_period=300):
+        self.app = service_name
+        self.version = 0
+        self._lock = threading.Lock()
+        self._slices = {}    # slice name -> [(ip, zone, hint zones)]
+        self._snapshot = {}  # zone -> [ip]
+        self._hints = {}     # zone -> [(ip, endpoint zone)]
+        self._listeners = []
+        resync_period = resync_period * random.uniform(0.8, 1.2)
+        self._informer = Informer(f"endpointslices-{service_name}",
+                                  discovery_client.list_namespaced_endpoint_slice,
+                                  self._replace_slices, self._on_slice_event, resync_period,
+                                  namespace=namespace,
+                                  label_selector=f"kubernetes.io/service-name={service_name}")
+
+    def start(self):
+        self._informer.start()
+
+    def stop(self):
+        self._informer.stop()
+
+    def wait_for_sync(self, timeout=None):
+        return self._informer.synced.wait(timeout)
+
+    def snapshot(self):
+        """Current zone -> [ip] map (must not be modified by the caller)"""
+        return self._snapshot
+
+    def hints(self):
+        """Current zone -> [(ip, endpoint zone)] map from the slices' topology hints"""
+        return self._hints
+
+    def add_listener(self, callback):
+        """Call `callback(snapshot)` whenever the set of endpoints changes"""
+        self._listeners.append(callback)
+
+    @staticmethod
+    def _slice_entries(endpoint_slice):
+        entries = []
+        for endpoint in endpoint_slice.endpoints or []:
+            # A nil ready condition means ready, per the EndpointSlice API
+            if endpoint.conditions and endpoint.conditions.ready is False:
+                continue
+            if not endpoint.addresses:
+                continue
+            for_zones = ()
+            if endpoint.hints and endpoint.hints.for_zones:
+                for_zones = tuple(z.name for z in endpoint.hints.for_zones)
+            entries.append((endpoint.addresses[0], endpoint.zone or "unknown", for_zones))
+        return entries
+
+    def _replace_slices(self, slices):
+        with self._lock:
+            self._slices = {s.metadata.name: self._slice_entries(s) for s in slices}
+            self._rebuild()
+
+    def _on_slice_event(self, event_type, endpoint_slice):
+        with self._lock:
+            name = endpoint_slice.metadata.name
+            if event_type == "DELETED":
+                if self._slices.pop(name, None) is None:
+                    return
+            else:
+                entries = self._slice_entries(endpoint_slice)
+                if self._slices.get(name) == entries:
+                    return
+                self._slices[name] = entries
+            self._rebuild()
+
+    def _rebuild(self):
+        by_zone = {}
+        hints = {}
+        for entries in self._slices.values():
+            for ip, zone, for_zones in entries:
+                by_zone.setdefault(zone, []).append(ip)
+                for hint_zone in for_zones:
+                    hints.setdefault(hint_zone, []).append((ip, zone))
+        for ips in by_zone.values():
+            ips.sort()
+        for endpoints in hints.values():
+            endpoints.sort()
+        if by_zone == self._snapshot and hints == self._hints:
+            return
+        self._snapshot = by_zone
+        self._hints = hints
+        self.version += 1
+        for callback in self._listeners:
+            try:
+                callback(by_zone)
+            except Exception as e:
+                print(f"Endpoint listener failed: {e}")
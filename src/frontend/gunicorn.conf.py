@@ -0,0 +1,51 @@
+# gunicorn.conf.py
+#
+# Multi-worker client: gunicorn -c gunicorn.conf.py client:app
+#
+# The master starts one publisher process (client.py with
+# CLIENT_ROLE=publisher) that watches the Kubernetes API for the whole pod
+# and writes the endpoint table to SHARED_STATE_DIR. The workers only read
+# that table and count into shared memory, so API load stays that of one
+# process and /metrics on any worker covers all of them.
+import os
+import shutil
+import subprocess
+import sys
+import threading
+
+bind = f'{os.environ.get("BIND_ADDRESS", "0.0.0.0")}:8080'
+workers = int(os.environ.get("CLIENT_WORKERS", str(os.cpu_count() or 1)))
+# Threads per worker: hedges and slow backends hold a thread each
+threads = int(os.environ.get("CLIENT_THREADS", "8"))
+
+publisher_stopping = threading.Event()
+publisher_process = None
+
+
+def supervise_publisher(server):
+    global publisher_process
+    env = dict(os.environ, CLIENT_ROLE="publisher")
+    while not publisher_stopping.is_set():
+        publisher_process = subprocess.Popen([sys.executable, "client.py"],
+                                             cwd=os.path.dirname(os.path.abspath(__file__)), env=env)
+        code = publisher_process.wait()
+        if publisher_stopping.is_set():
+            break
+        # Workers keep serving the last published table meanwhile
+        server.log.warning(f"Endpoint publisher exited with code {code}, restarting")
+        publisher_stopping.wait(1)
+
+
+def on_starting(server):
+    state_dir = os.environ.setdefault("SHARED_STATE_DIR", "/dev/shm/client-service")
+    # Segments left by a previous run would be summed into this one's metrics
+    shutil.rmtree(state_dir, ignore_errors=True)
+    os.makedirs(state_dir)
+    os.environ["CLIENT_ROLE"] = "worker"
+    threading.Thread(target=supervise_publisher, args=(server,), name="publisher", daemon=True).start()
+
+
+def on_exit(server):
+    publisher_stopping.set()
+    if publisher_process and publisher_process.poll() is None:
+        publisher_process.terminate()
@@ -0,0 +1,228 @@
+# hedging.py
+import bisect
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from pools import AbortHandle
+
+
+class LatencyHistogram:
+    """Sliding-window latency histogram with log-spaced buckets.
+
+    Samples land in the current window; percentiles are read over the current
+    and the previous window, so the estimate follows recent behaviour without
+    dropping to nothing right after a rotation.
+    """
+
+    def __init__(self, window=30.0, min_latency=0.001, max_latency=10.0, growth=1.2):
+        self.bounds = []
+        bound = min_latency
+        while bound < max_latency:
+            self.bounds.append(bound)
+            bound *= growth
+        self.bounds.append(max_latency)
+        self.window = window
+        self._lock = threading.Lock()
+        self._current = [0] * (len(self.bounds) + 1)
+        self._previous = [0] * (len(self.bounds) + 1)
+        self._rotate_at = time.monotonic() + window
+
+    def record(self, latency):
+        index = bisect.bisect_left(self.bounds, latency)
+        now = time.monotonic()
+        with self._lock:
+            if now >= self._rotate_at:
+                self._previous = self._current
+                self._current = [0] * (len(self.bounds) + 1)
+                self._rotate_at = now + self.window
+            self._current[index] += 1
+
+    def count(self):
+        with self._lock:
+            return sum(self._current) + sum(self._previous)
+
+    def percentile(self, pct):
+        """Upper bound of the bucket holding the pct-th percentile, None if empty"""
+        with self._lock:
+            counts = [a + b for a, b in zip(self._current, self._previous)]
+        total = sum(counts)
+        if not total:
+            return None
+        rank = total * pct / 100.0
+        seen = 0
+        for index, count in enumerate(counts):
+            seen += count
+            if seen >= rank:
+                return self.bounds[min(index, len(self.bounds) - 1)]
+        return self.bounds[-1]
+
+
+class HedgeBudget:
+    """Token bucket capping hedges to a percentage of requests"""
+
+    def __init__(self, percent=10.0, burst=10.0):
+        self.ratio = percent / 100.0
+        self.burst = burst
+        self._tokens = burst
+        self._lock = threading.Lock()
+
+    def on_request(self):
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def available(self):
+        """Whether a hedge could be paid for now, without taking the token"""
+        return self._tokens >= 1.0
+
+    def try_acquire(self):
+        with self._lock:
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return True
+            return False
+
+
+class DelayQueue:
+    """Runs callbacks at given monotonic times, on one background thread"""
+
+    def __init__(self, name="delay-queue"):
+        self.name = name
+        self._heap = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def schedule(self, when, callback):
+        with self._cond:
+            heapq.heappush(self._heap, (when, next(self._counter), callback))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+            elif self._heap[0][2] is callback:
+                # New earliest deadline
+                self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    if self._heap and self._heap[0][0] <= now:
+                        _, _, callback = heapq.heappop(self._heap)
+                        break
+                    self._cond.wait(self._heap[0][0] - now if self._heap else None)
+            try:
+                callback()
+            except Exception as e:
+                print(f"Delayed callback failed: {e}")
+
+
+class _Race:
+    """A primary call and its hedge; `lock` guards the fields"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.primary_abort = AbortHandle()
+        self.hedge_abort = AbortHandle()
+        self.primary_finished = False
+        self.primary_succeeded = False
+        self.alternate = None      # set once the hedge is sent
+        self.hedge_won = False
+        self.hedge_result = None
+        self.hedge_done = threading.Event()
+
+
+class Hedger:
+    """Sends a second request when the first is slower than usual.
+
+    The hedge delay is the `percentile` of recently observed latencies (never
+    below `min_delay`); until `min_samples` latencies have been seen no hedge
+    is sent. The first successful answer wins and the other call is aborted.
+    Hedges are paid for out of a `HedgeBudget`, so they can add at most
+    `budget_percent` extra load.
+
+    The primary runs on the caller's thread. A single timer thread fires at
+    the hedge delay, and only hedges take one of the `max_workers` pool
+    threads, so the pool never caps or delays the primaries.
+    """
+
+    def __init__(self, percentile=95.0, budget_percent=10.0, min_delay=0.005,
+                 min_samples=100, max_workers=64):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.histogram = LatencyHistogram()
+        self.budget = HedgeBudget(budget_percent)
+        self._timers = DelayQueue("hedge-timer")
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedge")
+
+    def delay(self):
+        """Seconds to wait for the primary before hedging, None to not hedge"""
+        if self.histogram.count() < self.min_samples:
+            return None
+        return max(self.min_delay, self.histogram.percentile(self.percentile))
+
+    def run(self, call, target, pick_alternate):
+        """Run `call(target, abort)`, hedging to `pick_alternate(target)` if it is slow.
+
+        `abort` is the call's AbortHandle (None when no hedge is possible).
+        Returns (result, target that answered, hedged, hedge won). If both
+        calls fail, the primary's exception is raised.
+        """
+        self.budget.on_request()
+        delay = self.delay()
+        if delay is None:
+            return call(target, None), target, False, False
+
+        race = _Race()
+        self._timers.schedule(time.monotonic() + delay,
+                              lambda: self._start_hedge(race, call, target, pick_alternate))
+        try:
+            result = call(target, race.primary_abort)
+        except Exception:
+            with race.lock:
+                race.primary_finished = True
+                hedged = race.alternate is not None
+            if hedged:
+                race.hedge_done.wait()
+                if race.hedge_won:
+                    return race.hedge_result, race.alternate, True, True
+            raise
+        with race.lock:
+            race.primary_finished = race.primary_succeeded = True
+            hedged = race.alternate is not None
+            hedge_won = race.hedge_won
+        if hedge_won:
+            # Both answered, the hedge got there first
+            return race.hedge_result, race.alternate, True, True
+        race.hedge_abort.abort()
+        return result, target, hedged, False
+
+    def _start_hedge(self, race, call, target, pick_alternate):
+        # On the timer thread: keep it short. The token is only taken once
+        # the hedge is sure to go out.
+        if race.primary_finished or not self.budget.available():
+            return
+        self._executor.submit(self._hedge, race, call, target, pick_alternate)
+
+    def _hedge(self, race, call, target, pick_alternate):
+        alternate = pick_alternate(target)
+        with race.lock:
+            if race.primary_finished or alternate is None or not self.budget.try_acquire():
+                return
+            race.alternate = alternate
+        try:
+            result = call(alternate, race.hedge_abort)
+            with race.lock:
+                # A primary that failed meanwhile doesn't take the win away
+                race.hedge_won = not race.primary_succeeded
+                race.hedge_result = result
+            if race.hedge_won:
+                race.primary_abort.abort()
+        except Exception:
+            pass
+        finally:
+            race.hedge_done.set()
@@ -0,0 +1,202 @@
+# metrics.py
+import bisect
+import threading
+
+# Upper bounds of the latency histogram buckets, in seconds (+Inf is implied)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class MetricsRegistry:
+    """Counters and fixed-bucket histograms with per-thread shards.
+
+    Each thread increments a dict only it writes to, so recording takes no
+    lock and can't lose updates: a threading.local attribute read, then the
+    dict update. A thread's first record looks its shard up by thread
+    ident, which the OS hands to the next thread once one exits: the Flask
+    dev server runs each request on a fresh thread, and that thread nearly
+    always takes over a shard left by a finished one. Only an ident never
+    seen before takes the lock, and once the table outgrows twice the live
+    threads the shards of exited ones are folded into a retired total.
+    Reads merge every shard plus that total.
+
+    Counters are keyed by (name, labels) with labels a tuple of strings.
+    In a shard a histogram is one list under (name, labels, None), its
+    bucket counts followed by the sum, so an observation is a single dict
+    lookup. Merged, it has the keys (name, labels, bucket index), with
+    index -1 holding the sum of observed values.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._local = threading.local()  # .counts, this thread's shard
+        self._shards = {}   # thread ident -> counts
+        self._retired = {}  # merged counts of threads that exited
+        self._prune_at = 64
+
+    def _shard(self):
+        # A thread's first record only
+        counts = self._shards.get(threading.get_ident())
+        if counts is None:
+            # Registers threads not started through threading, so pruning sees them
+            threading.current_thread()
+            with self._lock:
+                counts = self._shards.setdefault(threading.get_ident(), {})
+                if len(self._shards) > self._prune_at:
+                    self._prune()
+        self._local.counts = counts
+        return counts
+
+    def _prune(self):
+        # Called with the lock held
+        live = {thread.ident for thread in threading.enumerate()}
+        for ident in [ident for ident in self._shards if ident not in live]:
+            self._merge_into(self._retired, self._shards.pop(ident))
+        self._prune_at = max(64, 2 * len(self._shards))
+
+    def inc(self, name, labels=(), value=1):
+        try:
+            counts = self._local.counts
+        except AttributeError:
+            counts = self._shard()
+        key = (name, labels)
+        counts[key] = counts.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        try:
+            counts = self._local.counts
+        except AttributeError:
+            counts = self._shard()
+        key = (name, labels, None)
+        histogram = counts.get(key)
+        if histogram is None:
+            histogram = counts[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        histogram[bisect.bisect_left(self.buckets, value)] += 1
+        histogram[-1] += value
+
+    def merged(self):
+        """Every shard summed into one {key: value} dict"""
+        with self._lock:
+            merged = dict(self._retired)
+            for counts in list(self._shards.values()):
+                # dict() copies in one step under the GIL, so a concurrent
+                # insert by the owning thread can't break the iteration
+                self._merge_into(merged, dict(counts))
+        return merged
+
+    @staticmethod
+    def _merge_into(merged, counts):
+        for key, value in counts.items():
+            if key[-1] is None and len(key) == 3:
+                name, labels, _ = key
+                for index, count in enumerate(value[:-1]):
+                    if count:
+                        key = (name, labels, index)
+                        merged[key] = merged.get(key, 0) + count
+                key = (name, labels, -1)
+                merged[key] = merged.get(key, 0) + value[-1]
+            else:
+                merged[key] = merged.get(key, 0) + value
+
+    def collect(self):
+        """Merged view: {(name, labels): value} and {(name, labels): histogram}.
+
+        A histogram is a dict with per-bucket `counts` (not cumulative, the
+        last one is +Inf), `count` and `sum`.
+        """
+        merged = self.merged()
+        counters = {}
+        histograms = {}
+        for key, value in merged.items():
+            if len(key) == 2:
+                counters[key] = value
+                continue
+            name, labels, index = key
+            histogram = histograms.get((name, labels))
+            if histogram is None:
+                histogram = histograms[(name, labels)] = {
+                    'counts': [0] * (len(self.buckets) + 1), 'count': 0, 'sum': 0.0}
+            if index < 0:
+                histogram['sum'] += value
+            else:
+                histogram['counts'][index] += value
+                histogram['count'] += value
+        return counters, histograms
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class TextExposition:
+    """Prometheus text format rendering of a MetricsRegistry.
+
+    `definitions` maps registry names to (metric name, type, help, label
+    names). The text is rebuilt at most once per `min_interval`, whatever
+    the scrape rate, and series whose value hasn't changed keep their
+    previously formatted lines, so a scrape costs a merge plus a join.
+    """
+
+    def __init__(self, registry, definitions, min_interval=1.0):
+        self.registry = registry
+        self.definitions = definitions
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._lines = {}  # series key -> (value, formatted lines)
+        self._text = ''
+        self._rendered_at = None
+
+    def render(self, now):
+        with self._lock:
+            if self._rendered_at is not None and now - self._rendered_at < self.min_interval:
+                return self._text
+            counters, histograms = self.registry.collect()
+            by_metric = {name: [] for name in self.definitions}
+            for key, value in counters.items():
+                if key[0] in by_metric:
+                    by_metric[key[0]].append(self._series(key, value, self._counter_lines))
+            for key, histogram in histograms.items():
+                if key[0] in by_metric:
+                    value = (histogram['count'], histogram['sum'])
+                    by_metric[key[0]].append(self._series(key, value, self._histogram_lines, histogram))
+
+            out = []
+            for name, (metric, metric_type, help_text, _) in self.definitions.items():
+                out.append(f'# HELP {metric} {help_text}\n# TYPE {metric} {metric_type}\n')
+                out.extend(by_metric[name])
+            self._text = ''.join(out)
+            self._rendered_at = now
+            return self._text
+
+    def _series(self, key, value, formatter, *args):
+        cached = self._lines.get(key)
+        if cached is None or cached[0] != value:
+            cached = self._lines[key] = (value, formatter(key, value, *args))
+        return cached[1]
+
+    def _counter_lines(self, key, value):
+        name, labels = key
+        metric, _, _, label_names = self.definitions[name]
+        return f'{metric}{format_labels(label_names, labels)} {value}\n'
+
+    def _histogram_lines(self, key, value, histogram):
+        name, labels = key
+        metric, _, _, label_names = self.definitions[name]
+        lines = []
+        cumulative = 0
+        bounds = [repr(float(b)) for b in self.registry.buckets] + ['+Inf']
+        for bound, count in zip(bounds, histogram['counts']):
+            cumulative += count
+            bucket_labels = format_labels(label_names, labels, 'le="%s"' % bound)
+            lines.append(f'{metric}_bucket{bucket_labels} {cumulative}\n')
+        label_text = format_labels(label_names, labels)
+        lines.append(f'{metric}_sum{label_text} {histogram["sum"]}\n')
+        lines.append(f'{metric}_count{label_text} {histogram["count"]}\n')
+        return ''.join(lines)
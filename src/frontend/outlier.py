@@ -0,0 +1,236 @@
+# outlier.py
+import threading
+import time
+
+
+class EndpointHealth:
+    """Passive health state of one backend endpoint"""
+
+    __slots__ = ('consecutive_errors', 'consecutive_timeouts', 'latency', 'ejections',
+                 'ejected_until', 'half_open', 'probing', 'last_ejected')
+
+    def __init__(self):
+        self.consecutive_errors = 0
+        self.consecutive_timeouts = 0
+        self.latency = None       # EWMA of successful call latency
+        self.ejections = 0        # drives the exponential ejection time
+        self.ejected_until = 0.0
+        self.half_open = False    # ejection expired, waiting for a probe result
+        self.probing = False      # a probe request is in flight
+        self.last_ejected = 0.0
+
+
+class OutlierDetector:
+    """Ejects misbehaving backends based on the outcome of real requests.
+
+    An endpoint is ejected after `consecutive_errors` failures or
+    `consecutive_timeouts` timeouts in a row, or when its latency stays above
+    `latency_factor` times the median of its zone. The n-th ejection lasts
+    `base_ejection_time * 2**(n-1)` (capped by `max_ejection_time`); the count
+    decays again once the endpoint has stayed healthy for a while. When an
+    ejection expires the endpoint is half-open: a single probe request is let
+    through, success brings it back, failure ejects it again right away.
+    No more than `max_ejection_percent` of a zone's endpoints are ejected at
+    once, and if everything would be filtered out the full set is used.
+    """
+
+    def __init__(self, consecutive_errors=5, consecutive_timeouts=3, base_ejection_time=10.0,
+                 max_ejection_time=300.0, max_ejection_percent=50, latency_factor=3.0,
+                 min_outlier_latency=0.05, interval=5.0):
+        self.consecutive_errors = consecutive_errors
+        self.consecutive_timeouts = consecutive_timeouts
+        self.base_ejection_time = base_ejection_time
+        self.max_ejection_time = max_ejection_time
+        self.max_ejection_percent = max_ejection_percent
+        self.latency_factor = latency_factor
+        self.min_outlier_latency = min_outlier_latency
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._health = {}          # ip -> EndpointHealth
+        self._zone_of = {}         # ip -> zone, from the last snapshot seen
+        self._snapshot = None
+        self._generation = 0       # bumped whenever the filtered set changes
+        self._filtered = None      # (snapshot, generation, filtered snapshot)
+        self._weights = (-1, {})   # (generation, weights)
+        self._next_expiry = float('inf')
+        self._next_sweep = time.monotonic() + interval
+
+    def _get(self, ip):
+        health = self._health.get(ip)
+        if health is None:
+            health = self._health[ip] = EndpointHealth()
+        return health
+
+    def filter(self, backends_by_zone):
+        """Return the zone -> [ip] map without ejected endpoints.
+
+        The result is cached until either the snapshot or the set of ejected
+        endpoints changes, so downstream policies can keep caching on it.
+        """
+        now = time.monotonic()
+        if now >= self._next_expiry:
+            with self._lock:
+                self._expire(now)
+        filtered = self._filtered
+        if filtered and filtered[0] is backends_by_zone and filtered[1] == self._generation:
+            return filtered[2]
+
+        with self._lock:
+            if backends_by_zone is not self._snapshot:
+                self._snapshot = backends_by_zone
+                self._zone_of = {ip: zone for zone, ips in backends_by_zone.items() for ip in ips}
+            result = {}
+            for zone, ips in backends_by_zone.items():
+                healthy = [ip for ip in ips if self._available(ip)]
+                if healthy:
+                    result[zone] = healthy
+            if not result:
+                # Panic mode: better to try sick endpoints than none at all
+                result = backends_by_zone
+            self._filtered = (backends_by_zone, self._generation, result)
+            return result
+
+    def available(self, ip):
+        """Whether an endpoint may currently receive traffic"""
+        return self._available(ip)
+
+    def _available(self, ip):
+        health = self._health.get(ip)
+        if health is None:
+            return True
+        if health.ejected_until:
+            return False
+        # Half-open endpoints take one probe at a time
+        return not health.probing
+
+    def request_started(self, ip):
+        health = self._health.get(ip)
+        if health is not None and health.half_open and not health.probing:
+            with self._lock:
+                health.probing = True
+                self._generation += 1
+
+    def request_cancelled(self, ip):
+        # An abandoned probe proves nothing, let the next request probe instead
+        health = self._health.get(ip)
+        if health is not None and health.probing:
+            with self._lock:
+                health.probing = False
+                self._generation += 1
+
+    def request_finished(self, ip, latency, outcome):
+        """Record the outcome of a call: success, error or timeout"""
+        now = time.monotonic()
+        with self._lock:
+            health = self._get(ip)
+            was_probe = health.half_open
+            if outcome == "success":
+                health.consecutive_errors = 0
+                health.consecutive_timeouts = 0
+                health.latency = latency if health.latency is None else 0.8 * health.latency + 0.2 * latency
+                if was_probe:
+                    health.half_open = False
+                    health.probing = False
+                    self._generation += 1
+                # Forgive past ejections after a long enough healthy stretch
+                if health.ejections and now - health.last_ejected > self.max_ejection_time:
+                    health.ejections -= 1
+                    health.last_ejected = now
+                    self._generation += 1
+            else:
+                health.consecutive_errors += 1
+                if outcome == "timeout":
+                    health.consecutive_timeouts += 1
+                if (was_probe or health.consecutive_errors >= self.consecutive_errors
+                        or health.consecutive_timeouts >= self.consecutive_timeouts):
+                    self._eject(ip, health, now, force=was_probe)
+            if now >= self._next_sweep:
+                self._sweep_latency(now)
+
+    def _eject(self, ip, health, now, force=False):
+        # Called with the lock held
+        if health.ejected_until:
+            return
+        if not force and not self._can_eject(ip):
+            return
+        health.ejections += 1
+        duration = min(self.base_ejection_time * 2 ** (health.ejections - 1), self.max_ejection_time)
+        health.ejected_until = now + duration
+        health.last_ejected = now
+        health.half_open = False
+        health.probing = False
+        health.consecutive_errors = 0
+        health.consecutive_timeouts = 0
+        self._next_expiry = min(self._next_expiry, health.ejected_until)
+        self._generation += 1
+        print(f"Ejecting backend {ip} for {duration:.0f}s")
+
+    def _can_eject(self, ip):
+        zone = self._zone_of.get(ip)
+        peers = [p for p, z in self._zone_of.items() if z == zone] or [ip]
+        ejected = sum(1 for p in peers if p in self._health and self._health[p].ejected_until)
+        allowed = max(1, int(len(peers) * self.max_ejection_percent / 100))
+        return ejected < allowed
+
+    def _expire(self, now):
+        # Called with the lock held
+        next_expiry = float('inf')
+        for health in self._health.values():
+            if not health.ejected_until:
+                continue
+            if health.ejected_until <= now:
+                health.ejected_until = 0.0
+                health.half_open = True
+                self._generation += 1
+            else:
+                next_expiry = min(next_expiry, health.ejected_until)
+        self._next_expiry = next_expiry
+
+    def _sweep_latency(self, now):
+        # Called with the lock held: eject endpoints far slower than their zone
+        self._next_sweep = now + self.interval
+        by_zone = {}
+        for ip, zone in self._zone_of.items():
+            health = self._health.get(ip)
+            if health and health.latency is not None and not health.ejected_until:
+                by_zone.setdefault(zone, []).append((health.latency, ip))
+        for samples in by_zone.values():
+            if len(samples) < 3:
+                continue
+            samples.sort()
+            median = samples[len(samples) // 2][0]
+            threshold = max(median * self.latency_factor, self.min_outlier_latency)
+            for latency, ip in samples:
+                if latency > threshold:
+                    health = self._health[ip]
+                    self._eject(ip, health, now)
+                    # Start from a clean slate when it comes back
+                    health.latency = None
+
+    def weights(self):
+        """{ip: weight} halving an endpoint's share for each ejection it hasn't
+        been forgiven yet, so one that keeps failing comes back gradually.
+        Endpoints left out weigh 1."""
+        weights = self._weights
+        if weights[0] == self._generation:
+            return weights[1]
+        with self._lock:
+            generation = self._generation
+            weights = {ip: 0.5 ** h.ejections for ip, h in self._health.items() if h.ejections}
+            self._weights = (generation, weights)
+            return weights
+
+    def retain(self, ips):
+        ips = set(ips)
+        with self._lock:
+            for ip in [ip for ip in self._health if ip not in ips]:
+                del self._health[ip]
+            self._generation += 1
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {ip: {'ejected_for_s': max(0.0, h.ejected_until - now) if h.ejected_until else 0.0,
+                         'ejections': h.ejections,
+                         'half_open': h.half_open}
+                    for ip, h in self._health.items() if h.ejected_until or h.half_open or h.ejections}
@@ -0,0 +1,170 @@
+# pools.py
+import socket
+import threading
+import time
+from concurrent.futures import InvalidStateError
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool
+
+
+class Aborted(Exception):
+    """The call was aborted from another thread"""
+
+
+class AbortHandle:
+    """Lets another thread abort a blocking call, e.g. a hedge loser.
+
+    The call binds what aborting means for it (shutting its socket down,
+    failing its future) and `finish()`es the handle when it is over, so a
+    late abort can't touch a connection that went back to the pool.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self.aborted = False
+        self.finished = False
+
+    def bind(self, callback):
+        """Run `callback` on abort; False if the call was aborted already"""
+        with self._lock:
+            if self.aborted:
+                return False
+            if not self.finished:
+                self._callbacks.append(callback)
+            return True
+
+    def abort(self):
+        with self._lock:
+            if self.aborted or self.finished:
+                return
+            self.aborted = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except (OSError, InvalidStateError):
+                # The socket closed or the future settled on its own already
+                pass
+
+    def finish(self):
+        with self._lock:
+            self.finished = True
+            self._callbacks = []
+
+
+# The AbortHandle of the request running on this thread, if any
+_current = threading.local()
+
+
+class AbortablePool(HTTPConnectionPool):
+    """Connection pool whose requests can be aborted through an AbortHandle"""
+
+    def _make_request(self, conn, *args, **kwargs):
+        abort = getattr(_current, 'abort', None)
+        if abort is not None and not abort.bind(lambda: _shutdown(conn)):
+            raise Aborted()
+        return super()._make_request(conn, *args, **kwargs)
+
+
+def _shutdown(conn):
+    # Unlike close(), shutdown() wakes up a thread blocked reading the socket
+    if conn.sock is not None:
+        conn.sock.shutdown(socket.SHUT_RDWR)
+
+
+class AbortableAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = dict(self.poolmanager.pool_classes_by_scheme,
+                                                       http=AbortablePool)
+
+
+class EndpointPools:
+    """Keep-alive HTTP connection pools, one per backend endpoint.
+
+    Each endpoint gets its own `requests.Session` holding up to `pool_size`
+    idle connections, so consecutive requests to the same backend reuse a TCP
+    connection instead of paying a new handshake (and a new ephemeral port)
+    every time. Pools unused for `idle_timeout` seconds are closed, and
+    `retain()` drops the pools of endpoints that left the discovered set.
+    """
+
+    def __init__(self, port=8080, pool_size=10, connect_timeout=0.5, read_timeout=2.0, idle_timeout=60):
+        self.port = port
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._sessions = {}  # ip -> session
+        self._last_used = {}  # ip -> monotonic time of the last request
+        self._next_sweep = time.monotonic() + idle_timeout
+
+    def _new_session(self):
+        session = requests.Session()
+        # Without pool_block, a burst beyond pool_size still gets served, the
+        # extra connections are just not kept around afterwards
+        adapter = AbortableAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+        session.mount("http://", adapter)
+        return session
+
+    def session(self, ip):
+        """Get the pooled session for an endpoint, creating it on first use"""
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(ip)
+            if session is None:
+                session = self._sessions[ip] = self._new_session()
+            self._last_used[ip] = now
+            if now >= self._next_sweep:
+                self._evict_idle(now)
+        return session
+
+    def get(self, ip, path, abort=None, **kwargs):
+        """GET `path` on an endpoint over its pooled connections; `abort`, an
+        AbortHandle, lets another thread cut the request off"""
+        kwargs.setdefault("timeout", self.timeout)
+        _current.abort = abort
+        try:
+            return self.session(ip).get(f"http://{ip}:{self.port}{path}", **kwargs)
+        finally:
+            _current.abort = None
+            if abort is not None:
+                abort.finish()
+
+    def post(self, ip, path, **kwargs):
+        """POST to `path` on an endpoint over its pooled connections"""
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session(ip).post(f"http://{ip}:{self.port}{path}", **kwargs)
+
+    def retain(self, ips):
+        """Close the pools of every endpoint not in `ips`"""
+        ips = set(ips)
+        with self._lock:
+            for ip in [ip for ip in self._sessions if ip not in ips]:
+                self._close(ip)
+
+    def close(self):
+        with self._lock:
+            for ip in list(self._sessions):
+                self._close(ip)
+
+    def stats(self):
+        with self._lock:
+            return {'pools': len(self._sessions)}
+
+    def _evict_idle(self, now):
+        # Called with the lock held
+        for ip, last_used in list(self._last_used.items()):
+            if now - last_used >= self.idle_timeout:
+                self._close(ip)
+        self._next_sweep = now + self.idle_timeout
+
+    def _close(self, ip):
+        # Called with the lock held; requests still holding the session finish
+        # normally, their connections are discarded instead of pooled
+        session = self._sessions.pop(ip)
+        self._last_used.pop(ip, None)
+        session.close()
@@ -0,0 +1,67 @@
+# reporter.py
+import random
+import threading
+import time
+
+import requests
+
+
+class MetricsReporter:
+    """Pushes counter deltas to the dashboard on an interval.
+
+    Every flush sends what changed since the last acknowledged report, as one
+    batch numbered by `seq`. A batch that wasn't acknowledged is resent
+    unchanged with the same number, so the dashboard can drop duplicates and
+    nothing is counted twice or lost. Flushes are spread out by +/- `jitter`
+    of the interval so a large fleet doesn't report in lockstep.
+    """
+
+    def __init__(self, url, reporter_id, source, meta=None, interval=5.0, jitter=0.2, timeout=2.0):
+        self.url = url
+        self.reporter_id = reporter_id
+        self.source = source        # () -> {name: cumulative value}
+        self.meta = meta or dict    # () -> extra fields, e.g. the zone
+        self.interval = interval
+        self.jitter = jitter
+        self.timeout = timeout
+        self.session = requests.Session()
+        self._seq = 0
+        self._sent = {}
+        self._pending = None        # (seq, deltas, values) awaiting an ack
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="metrics-reporter", daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        # Random initial offset so pods started together don't stay in phase
+        time.sleep(random.uniform(0, self.interval))
+        while True:
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error pushing metrics to {self.url}: {e}")
+            time.sleep(self.interval * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def flush(self):
+        if self._pending is None:
+            values = self.source()
+            deltas = {name: value - self._sent.get(name, 0) for name, value in values.items()
+                      if value != self._sent.get(name, 0)}
+            # Sent even when empty: it doubles as the heartbeat that keeps
+            # this reporter from expiring
+            self._seq += 1
+            self._pending = (self._seq, deltas, values)
+        seq, deltas, values = self._pending
+        response = self.session.post(self.url, json={
+            'reporter': self.reporter_id,
+            'seq': seq,
+            'interval': self.interval,
+            'meta': self.meta(),
+            'deltas': deltas
+        }, timeout=self.timeout)
+        response.raise_for_status()
+        self._sent = values
+        self._pending = None
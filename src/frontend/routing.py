@@ -0,0 +1,499 @@
+# routing.py
+import hashlib
+import math
+import random
+import threading
+import time
+
+
+class RoutingPolicy:
+    """Picks a backend endpoint for each request.
+
+    `choose()` gets the current zone -> [ip] map and returns (ip, zone), or
+    (None, "unknown") when there is nothing to pick from. `key` is the
+    request's affinity key, if it carries one; only the affinity policy
+    uses it. The client reports every call back through `request_started()`
+    / `request_finished()`, so policies that care about outcomes can learn
+    from them.
+    """
+
+    def choose(self, backends_by_zone, current_zone, key=None):
+        raise NotImplementedError
+
+    def choose_hinted(self, hinted_backends, key=None):
+        """Pick among the (ip, zone) endpoints topology hints allocated to us"""
+        # Follow the controller's proportional allocation, like kube-proxy does
+        return random.choice(hinted_backends)
+
+    def zone_probabilities(self, backends_by_zone, current_zone):
+        """{zone: probability} of `choose()` picking each zone, endpoints being
+        uniform within a zone. Only defined for policies that don't learn from
+        outcomes; used by the simulator to sample decisions in bulk."""
+        raise NotImplementedError
+
+    def request_started(self, ip):
+        pass
+
+    def request_finished(self, ip, latency, success):
+        pass
+
+    def request_cancelled(self, ip):
+        pass
+
+    def retain(self, ips):
+        """Forget state about endpoints that are no longer discovered"""
+        pass
+
+    def stats(self):
+        return {}
+
+
+class ZonePreferencePolicy(RoutingPolicy):
+    """Same zone with a fixed probability, otherwise a random other zone"""
+
+    def __init__(self, same_zone_preference=0.8):
+        self.same_zone_preference = same_zone_preference
+
+    def choose(self, backends_by_zone, current_zone, key=None):
+        # Zone-aware routing - try same zone first
+        if backends_by_zone.get(current_zone) and random.random() < self.same_zone_preference:
+            return random.choice(backends_by_zone[current_zone]), current_zone
+
+        # Choose a different zone
+        other_zones = [zone for zone, ips in backends_by_zone.items() if zone != current_zone and ips]
+        if other_zones:
+            target_zone = random.choice(other_zones)
+            return random.choice(backends_by_zone[target_zone]), target_zone
+
+        # Fallback if no other zones available
+        if backends_by_zone.get(current_zone):
+            return random.choice(backends_by_zone[current_zone]), current_zone
+        return None, "unknown"
+
+    def zone_probabilities(self, backends_by_zone, current_zone):
+        other_zones = [zone for zone, ips in backends_by_zone.items() if zone != current_zone and ips]
+        if not backends_by_zone.get(current_zone):
+            return {zone: 1.0 / len(other_zones) for zone in other_zones}
+        if not other_zones:
+            return {current_zone: 1.0}
+        probabilities = {zone: (1 - self.same_zone_preference) / len(other_zones) for zone in other_zones}
+        probabilities[current_zone] = self.same_zone_preference
+        return probabilities
+
+
+class EndpointStats:
+    """Decaying average latency and in-flight count of one endpoint, or the
+    average latency of a whole zone"""
+
+    __slots__ = ('ewma', 'inflight', 'updated', 'zone')
+
+    def __init__(self, initial_latency, zone=None):
+        self.ewma = initial_latency
+        self.inflight = 0
+        self.updated = time.monotonic()
+        self.zone = zone
+
+
+class LeastLatencyPolicy(RoutingPolicy):
+    """Power-of-two-choices over EWMA latency, spilling cross-zone on demand.
+
+    Within a zone, two random endpoints are compared on EWMA latency scaled
+    by the requests already in flight to them, and the cheaper one wins,
+    which steers traffic away from slow or busy pods without the herding of
+    always picking the global minimum.
+
+    Requests leave the zone only when even its best endpoint is expected to
+    be slower than a remote candidate plus `cross_zone_penalty`. Both sides
+    are compared the same way: the estimate (plus the penalty for the remote
+    one) scaled by how far the endpoint's in-flight requests exceed the
+    `parallelism` a backend serves side by side. An idle endpoint's estimate
+    fades towards the average of its zone, so one that was slow a while ago
+    is eventually tried again, without idle remote endpoints looking free.
+    """
+
+    def __init__(self, cross_zone_penalty=0.02, decay_time=5.0, initial_latency=0.05, parallelism=32):
+        self.cross_zone_penalty = cross_zone_penalty
+        self.decay_time = decay_time
+        self.initial_latency = initial_latency
+        self.parallelism = max(1, parallelism)
+        self._lock = threading.Lock()
+        self._stats = {}  # ip -> EndpointStats
+        self._zones = {}  # zone -> EndpointStats, the prior idle estimates fade towards
+
+    def _get_stats(self, ip, zone=None):
+        stats = self._stats.get(ip)
+        if stats is None:
+            with self._lock:
+                stats = self._stats.setdefault(ip, EndpointStats(self.initial_latency, zone))
+        if stats.zone is None and zone is not None:
+            stats.zone = zone
+        return stats
+
+    def estimate(self, ip, zone=None):
+        """Expected latency of one more request, before queueing"""
+        stats = self._get_stats(ip, zone)
+        if stats.inflight:
+            return stats.ewma
+        prior = self._zones.get(stats.zone)
+        prior = prior.ewma if prior is not None else self.initial_latency
+        age = time.monotonic() - stats.updated
+        return prior + (stats.ewma - prior) * math.exp(-age / (self.decay_time * 4))
+
+    def cost(self, ip, zone=None):
+        """Load-weighted latency the power of two choices compares"""
+        return self.estimate(ip, zone) * (self._get_stats(ip).inflight + 1)
+
+    def expected(self, ip, zone=None, penalty=0.0):
+        """Expected latency of one more request, queueing beyond `parallelism` included"""
+        stats = self._get_stats(ip, zone)
+        return (self.estimate(ip) + penalty) * max(1.0, (stats.inflight + 1) / self.parallelism)
+
+    def _pick_two(self, endpoints):
+        # endpoints: [(ip, zone)]
+        if len(endpoints) == 1:
+            return endpoints[0]
+        a, b = random.sample(endpoints, 2)
+        return a if self.cost(*a) <= self.cost(*b) else b
+
+    def choose(self, backends_by_zone, current_zone, key=None):
+        local = [(ip, current_zone) for ip in backends_by_zone.get(current_zone) or ()]
+        remote = [(ip, zone) for zone, ips in backends_by_zone.items() if zone != current_zone for ip in ips]
+        if not remote:
+            return self._pick_two(local) if local else (None, "unknown")
+        remote_pick = self._pick_two(remote)
+        if local:
+            best_local = min(self.expected(ip, zone) for ip, zone in local)
+            if best_local <= self.expected(*remote_pick, penalty=self.cross_zone_penalty):
+                return self._pick_two(local)
+        return remote_pick
+
+    def choose_hinted(self, hinted_backends, key=None):
+        # The hints decide which endpoints serve this zone; latency and load
+        # still decide among them
+        return self._pick_two(hinted_backends)
+
+    def request_started(self, ip):
+        stats = self._get_stats(ip)
+        with self._lock:
+            stats.inflight += 1
+
+    def request_finished(self, ip, latency, success):
+        stats = self._get_stats(ip)
+        now = time.monotonic()
+        with self._lock:
+            stats.inflight = max(0, stats.inflight - 1)
+            # Failures count as slow so the endpoint loses its share quickly
+            if not success:
+                latency = max(latency, stats.ewma * 2)
+            # Time-based decay: a sample after a long gap mostly replaces the
+            # old average instead of being averaged into stale history
+            self._update(stats, latency, now)
+            if stats.zone is not None:
+                zone = self._zones.get(stats.zone)
+                if zone is None:
+                    zone = self._zones[stats.zone] = EndpointStats(latency)
+                self._update(zone, latency, now)
+
+    def _update(self, stats, latency, now):
+        weight = math.exp(-(now - stats.updated) / self.decay_time)
+        stats.ewma = stats.ewma * weight + latency * (1 - weight)
+        stats.updated = now
+
+    def request_cancelled(self, ip):
+        stats = self._get_stats(ip)
+        with self._lock:
+            stats.inflight = max(0, stats.inflight - 1)
+
+    def retain(self, ips):
+        ips = set(ips)
+        with self._lock:
+            for ip in [ip for ip in self._stats if ip not in ips]:
+                del self._stats[ip]
+
+    def stats(self):
+        with self._lock:
+            return {ip: {'ewma_ms': s.ewma * 1000, 'inflight': s.inflight}
+                    for ip, s in self._stats.items()}
+
+
+class AliasTable:
+    """Vose alias table: O(1) sampling from a fixed weighted distribution"""
+
+    def __init__(self, items, weights):
+        total = float(sum(weights))
+        n = len(items)
+        self.items = list(items)
+        self.prob = [0.0] * n
+        self.alias = list(range(n))
+        scaled = [w * n / total for w in weights]
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            (small if scaled[l] < 1.0 else large).append(l)
+        for i in small + large:
+            self.prob[i] = 1.0
+
+    def sample(self):
+        i = random.randrange(len(self.items))
+        return self.items[i] if random.random() < self.prob[i] else self.items[self.alias[i]]
+
+
+def zone_weights(backends_by_zone, demand_by_zone, current_zone):
+    """Share of the current zone's traffic each backend zone should receive.
+
+    Same idea as the EndpointSlice controller's hint allocation: a zone that
+    holds at least its proportional share of backends (relative to its share
+    of the demand) keeps all of its traffic local. A zone that is short keeps
+    only what its backends can absorb, local capacity / local demand, and
+    spills the rest to the zones with spare capacity, in proportion to that
+    spare capacity.
+    """
+    supply = {zone: len(ips) for zone, ips in backends_by_zone.items() if ips}
+    if not supply:
+        return {}
+    if current_zone not in supply:
+        # No local backends, spread by capacity
+        return dict(supply)
+
+    zones = set(supply) | set(demand_by_zone)
+    total_supply = float(sum(supply.values()))
+    total_demand = float(sum(demand_by_zone.values()))
+    if total_demand <= 0 or demand_by_zone.get(current_zone, 0) <= 0:
+        # Demand unknown, assume it is spread evenly over the zones
+        demand_share = {zone: 1.0 / len(zones) for zone in zones}
+    else:
+        demand_share = {zone: demand_by_zone.get(zone, 0) / total_demand for zone in zones}
+    supply_share = {zone: supply.get(zone, 0) / total_supply for zone in zones}
+
+    local_fraction = min(1.0, supply_share[current_zone] / demand_share[current_zone])
+    if local_fraction >= 1.0:
+        return {current_zone: 1.0}
+
+    surplus = {zone: supply_share[zone] - demand_share[zone]
+               for zone in supply if zone != current_zone and supply_share[zone] > demand_share[zone]}
+    if not surplus:
+        # Every other zone is short as well, spill by raw capacity
+        surplus = {zone: supply_share[zone] for zone in supply if zone != current_zone}
+    total_surplus = sum(surplus.values())
+    weights = {current_zone: local_fraction}
+    for zone, extra in surplus.items():
+        weights[zone] = (1.0 - local_fraction) * extra / total_surplus
+    return weights
+
+
+# One object, so the identity check in ZoneWeightedPolicy._table holds without a demand source
+_NO_DEMAND = {}
+
+
+class ZoneWeightedPolicy(RoutingPolicy):
+    """Capacity-proportional zone choice, then a random endpoint in the zone.
+
+    `demand_source()` returns the client pods per zone. The zone weights
+    from `zone_weights()` and their alias table are only rebuilt when the
+    backend or client topology changes; discovery snapshots are replaced
+    rather than mutated, so an identity check is enough to detect that.
+
+    Topology hints override the zone weights: they are the EndpointSlice
+    controller's own capacity-proportional allocation, so hinted endpoints
+    are picked uniformly, like kube-proxy does. This is logged once.
+    """
+
+    def __init__(self, demand_source=None):
+        self.demand_source = demand_source
+        self._cached = None  # (backends_by_zone, demand_by_zone, current_zone, weights, table)
+        self.following_hints = False
+
+    def _table(self, backends_by_zone, current_zone):
+        demand_by_zone = self.demand_source() if self.demand_source else _NO_DEMAND
+        cached = self._cached
+        if (cached and cached[0] is backends_by_zone and cached[1] is demand_by_zone
+                and cached[2] == current_zone):
+            return cached[4]
+        demand = {zone: len(ips) for zone, ips in demand_by_zone.items()}
+        weights = zone_weights(backends_by_zone, demand, current_zone)
+        zones = [zone for zone, weight in weights.items() if weight > 0]
+        table = AliasTable(zones, [weights[zone] for zone in zones]) if zones else None
+        self._cached = (backends_by_zone, demand_by_zone, current_zone, weights, table)
+        return table
+
+    def choose(self, backends_by_zone, current_zone, key=None):
+        table = self._table(backends_by_zone, current_zone)
+        if table is None:
+            return None, "unknown"
+        zone = table.sample()
+        return random.choice(backends_by_zone[zone]), zone
+
+    def choose_hinted(self, hinted_backends, key=None):
+        if not self.following_hints:
+            self.following_hints = True
+            print("EndpointSlices carry topology hints; zone-weighted routing follows them "
+                  "instead of its own zone weights")
+        return random.choice(hinted_backends)
+
+    def zone_probabilities(self, backends_by_zone, current_zone):
+        self._table(backends_by_zone, current_zone)
+        weights = {zone: weight for zone, weight in self._cached[3].items() if weight > 0}
+        total = sum(weights.values())
+        return {zone: weight / total for zone, weight in weights.items()}
+
+    def stats(self):
+        cached = self._cached
+        stats = {'following_hints': self.following_hints}
+        if cached:
+            stats['zone_weights'] = cached[3]
+        return stats
+
+
+def rendezvous_scores(key, ips, weights=None):
+    """Weighted rendezvous (highest random weight) score of each endpoint for a key.
+
+    Each (key, endpoint) hash is mapped to h in (0, 1) and scored
+    weight / -ln(h), which makes an endpoint's chance of ranking first
+    proportional to its weight. The hash is stable across processes, unlike
+    hash(), so every client worker ranks a key the same way.
+    """
+    scores = []
+    for ip in ips:
+        digest = hashlib.blake2b(f'{key}|{ip}'.encode(), digest_size=8).digest()
+        score = -1.0 / math.log((int.from_bytes(digest, 'big') + 1) / 18446744073709551617.0)  # 2**64 + 1
+        scores.append(score * weights.get(ip, 1.0) if weights else score)
+    return scores
+
+
+def rendezvous_rank(key, ips, weights=None):
+    """`ips` best first for `key`. Adding or removing an endpoint only moves
+    the keys that rank it first, about 1/n of them."""
+    scores = rendezvous_scores(key, ips, weights)
+    return [ip for _, ip in sorted(zip(scores, ips), reverse=True)]
+
+
+class AffinityPolicy(RoutingPolicy):
+    """Key affinity by weighted rendezvous hashing, with bounded load.
+
+    Requests with the same key go to the same backend, so its per-key cache
+    stays warm. Only the local zone's endpoints are ranked while it has
+    any. An endpoint takes a request only while its in-flight count is
+    below `load_factor` times its weighted share of the zone's in-flight
+    requests (counting the new one); a hot endpoint sheds to the key's
+    next-ranked one, which is where the key moves if it goes away anyway.
+    Requests without a key get a random one. `weight_source()` returns
+    {ip: weight}, 1 for endpoints it leaves out.
+    """
+
+    def __init__(self, load_factor=1.25, weight_source=None):
+        self.load_factor = max(1.0, load_factor)
+        self.weight_source = weight_source
+        self._lock = threading.Lock()
+        self._inflight = {}  # ip -> requests in flight
+        self.shed = 0
+
+    def _pick(self, key, ips):
+        if len(ips) == 1:
+            return ips[0]
+        weights = self.weight_source() if self.weight_source else None
+        scores = rendezvous_scores(key, ips, weights)
+        inflight = self._inflight
+        total = sum(inflight.get(ip, 0) for ip in ips) + 1
+        total_weight = sum(weights.get(ip, 1.0) for ip in ips) if weights else len(ips)
+
+        def below_cap(ip):
+            weight = weights.get(ip, 1.0) if weights else 1.0
+            return inflight.get(ip, 0) < math.ceil(self.load_factor * total * weight / total_weight)
+
+        # The top-ranked endpoint nearly always has room, rank the rest only when it doesn't
+        best = ips[scores.index(max(scores))]
+        if below_cap(best):
+            return best
+        for _, ip in sorted(zip(scores, ips), reverse=True):
+            if below_cap(ip):
+                with self._lock:
+                    self.shed += 1
+                return ip
+        return best
+
+    def choose(self, backends_by_zone, current_zone, key=None):
+        if key is None:
+            key = random.getrandbits(64)
+        local_ips = backends_by_zone.get(current_zone)
+        if local_ips:
+            return self._pick(key, local_ips), current_zone
+        zone_by_ip = {ip: zone for zone, ips in backends_by_zone.items() for ip in ips}
+        if not zone_by_ip:
+            return None, "unknown"
+        ip = self._pick(key, list(zone_by_ip))
+        return ip, zone_by_ip[ip]
+
+    def choose_hinted(self, hinted_backends, key=None):
+        if key is None:
+            key = random.getrandbits(64)
+        zone_by_ip = dict(hinted_backends)
+        ip = self._pick(key, list(zone_by_ip))
+        return ip, zone_by_ip[ip]
+
+    def zone_probabilities(self, backends_by_zone, current_zone):
+        # For keys spread evenly and no endpoint at its load cap
+        if backends_by_zone.get(current_zone):
+            return {current_zone: 1.0}
+        weights = self.weight_source() if self.weight_source else {}
+        by_zone = {zone: sum(weights.get(ip, 1.0) for ip in ips) for zone, ips in backends_by_zone.items() if ips}
+        total = sum(by_zone.values())
+        return {zone: weight / total for zone, weight in by_zone.items()}
+
+    def request_started(self, ip):
+        with self._lock:
+            self._inflight[ip] = self._inflight.get(ip, 0) + 1
+
+    def request_finished(self, ip, latency, success):
+        self.request_cancelled(ip)
+
+    def request_cancelled(self, ip):
+        with self._lock:
+            inflight = self._inflight.get(ip, 0)
+            if inflight > 1:
+                self._inflight[ip] = inflight - 1
+            else:
+                self._inflight.pop(ip, None)
+
+    def retain(self, ips):
+        ips = set(ips)
+        with self._lock:
+            for ip in [ip for ip in self._inflight if ip not in ips]:
+                del self._inflight[ip]
+
+    def stats(self):
+        with self._lock:
+            return {'inflight': dict(self._inflight), 'shed': self.shed}
+
+
+def route(backends_by_zone, current_zone, policy, hinted_backends=(), key=None):
+    """The routing decision for one request, free of discovery and I/O.
+
+    Topology hints win when there are any, otherwise `policy` picks among
+    `backends_by_zone`. Returns (ip, zone); an ip of None means no endpoint
+    or zone is known and the request should go through the Service.
+    """
+    if hinted_backends:
+        return policy.choose_hinted(hinted_backends, key)
+    if not backends_by_zone or current_zone == "unknown":
+        return None, "unknown"
+    return policy.choose(backends_by_zone, current_zone, key)
+
+
+def create_policy(name, **options):
+    """Build the routing policy selected by ROUTING_POLICY"""
+    if name == "least-latency":
+        return LeastLatencyPolicy(
+            cross_zone_penalty=options.get('cross_zone_penalty', 0.02),
+            decay_time=options.get('decay_time', 5.0),
+            parallelism=options.get('parallelism', 32))
+    if name == "zone-weighted":
+        return ZoneWeightedPolicy(options.get('demand_source'))
+    if name == "zone-preference":
+        return ZonePreferencePolicy(options.get('same_zone_preference', 0.8))
+    if name == "affinity":
+        return AffinityPolicy(options.get('load_factor', 1.25), options.get('weight_source'))
+    raise ValueError(f"Unknown routing policy: {name}")
@@ -0,0 +1,308 @@
+# shared.py
+#
+# Shared-memory state for running the client as several worker processes
+# (gunicorn.conf.py): one publisher process runs discovery and writes the
+# endpoint table, the workers map it read-only, and each worker keeps its
+# counters in its own segment that any process can sum.
+import bisect
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+from metrics import LATENCY_BUCKETS, MetricsRegistry
+
+
+class SharedEndpointTable:
+    """A JSON document in a memory-mapped file, published under a seqlock.
+
+    One process writes, any number read. The writer makes the sequence odd,
+    writes the payload and its length and CRC, then makes the sequence even
+    again. A reader copies the payload between two reads of the sequence and
+    keeps the copy only if the sequence was even and unchanged and the CRC
+    matches (Python can't issue memory fences, the CRC catches a payload seen
+    out of order). Readers take no lock and, while the sequence is the one
+    they last decoded, a read is a single 8-byte unpack.
+    """
+
+    HEADER = struct.Struct('<QII')  # sequence, payload length, payload crc32
+
+    def __init__(self, path, size=1 << 20):
+        self.path = path
+        self.size = size
+        self._mm = None
+        self._sequence = 0
+        self._current = (0, None)  # (sequence, decoded document)
+        self._lock = threading.Lock()
+
+    def _open_writer(self):
+        if os.path.exists(self.path) and os.path.getsize(self.path) == self.size:
+            # A restarted publisher carries on in the file the workers already map
+            with open(self.path, 'r+b') as f:
+                self._mm = mmap.mmap(f.fileno(), self.size)
+            sequence = self.HEADER.unpack_from(self._mm, 0)[0]
+            self._sequence = sequence + (sequence & 1)
+            return
+        # Created under a temporary name, so no reader maps a file that is still too short
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w+b') as f:
+            f.truncate(self.size)
+            self._mm = mmap.mmap(f.fileno(), self.size)
+        os.rename(tmp_path, self.path)
+
+    def publish(self, document):
+        """Replace the document (single writer only)"""
+        payload = json.dumps(document, sort_keys=True).encode()
+        if self.HEADER.size + len(payload) > self.size:
+            print(f"Endpoint table of {len(payload)} bytes doesn't fit in {self.path}, not published")
+            return False
+        if self._mm is None:
+            self._open_writer()
+        mm = self._mm
+        struct.pack_into('<Q', mm, 0, self._sequence + 1)
+        mm[self.HEADER.size:self.HEADER.size + len(payload)] = payload
+        struct.pack_into('<II', mm, 8, len(payload), zlib.crc32(payload))
+        self._sequence += 2
+        struct.pack_into('<Q', mm, 0, self._sequence)
+        return True
+
+    def _open_reader(self):
+        try:
+            with open(self.path, 'rb') as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return True
+        except (OSError, ValueError):
+            # Not published yet
+            return False
+
+    def read(self, retries=100):
+        """(sequence, document), or (0, None) before the first publish.
+
+        If the writer stays mid-update for all `retries`, the last good copy
+        is returned.
+        """
+        current = self._current
+        if self._mm is None:
+            with self._lock:
+                if self._mm is None and not self._open_reader():
+                    return current
+        mm = self._mm
+        for _ in range(retries):
+            sequence = struct.unpack_from('<Q', mm, 0)[0]
+            if sequence == current[0]:
+                return current
+            if sequence & 1:
+                time.sleep(0)
+                continue
+            _, length, crc = self.HEADER.unpack_from(mm, 0)
+            payload = mm[self.HEADER.size:self.HEADER.size + length]
+            if struct.unpack_from('<Q', mm, 0)[0] != sequence or zlib.crc32(payload) != crc:
+                continue
+            current = self._current = (sequence, json.loads(payload))
+            return current
+        return current
+
+
+class SharedEndpointView:
+    """One service's endpoints from a SharedEndpointTable.
+
+    Has the interface of the discovery caches (snapshot, hints, listeners),
+    so a worker routes exactly as if it ran the watches itself. Listeners are
+    called from whichever read first sees the new table.
+    """
+
+    def __init__(self, table, key):
+        self.table = table
+        self.key = key
+        self.version = 0
+        self._listeners = []
+        self._cached = (None, {}, {})  # (table sequence, snapshot, hints)
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def wait_for_sync(self, timeout=None):
+        """Wait until the publisher has listed this service at least once"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not ((self.table.read()[1] or {}).get('services') or {}).get(self.key, {}).get('synced'):
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def snapshot(self):
+        """Current zone -> [ip] map (must not be modified by the caller)"""
+        return self._current()[1]
+
+    def hints(self):
+        """Current zone -> [(ip, endpoint zone)] map"""
+        return self._current()[2]
+
+    def add_listener(self, callback):
+        """Call `callback(snapshot)` whenever the set of endpoints changes"""
+        self._listeners.append(callback)
+
+    def _current(self):
+        sequence, document = self.table.read()
+        cached = self._cached
+        if cached[0] == sequence:
+            return cached
+        service = ((document or {}).get('services') or {}).get(self.key, {})
+        snapshot = service.get('endpoints', {})
+        hints = {zone: [tuple(endpoint) for endpoint in endpoints]
+                 for zone, endpoints in service.get('hints', {}).items()}
+        if snapshot == cached[1] and hints == cached[2]:
+            # Another service changed; keep the old objects so identity checks still hold
+            self._cached = (sequence, cached[1], cached[2])
+            return self._cached
+        self._cached = (sequence, snapshot, hints)
+        self.version += 1
+        for callback in self._listeners:
+            try:
+                callback(snapshot)
+            except Exception as e:
+                print(f"Endpoint listener failed: {e}")
+        return self._cached
+
+
+class _SegmentReader:
+    """Read-only mapping of one process's counter segment"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        _, slots, directory_size, _, _ = SharedMetricsRegistry.HEADER.unpack_from(self.mm, 0)
+        offset = SharedMetricsRegistry.DIRECTORY_OFFSET
+        self.directory = (offset, offset + directory_size)
+        self.values = memoryview(self.mm)[offset + directory_size:].cast('d')[:slots]
+        self.keys = []
+        self.parsed = 0
+
+    def read(self):
+        used = struct.unpack_from('<Q', self.mm, SharedMetricsRegistry.USED_OFFSET)[0]
+        if used > self.parsed:
+            start = self.directory[0]
+            for line in self.mm[start + self.parsed:start + used].splitlines():
+                name, labels, index = json.loads(line)
+                self.keys.append((name, tuple(labels)) if index is None else (name, tuple(labels), index))
+            self.parsed = used
+        return zip(self.keys, self.values[:len(self.keys)])
+
+
+class SharedMetricsRegistry(MetricsRegistry):
+    """MetricsRegistry whose counters live in per-process shared memory.
+
+    Each process that records anything gets its own segment file in
+    `directory`: a header, a key directory (one JSON line per key, appended)
+    and a float64 slot per key. A process only writes its own segment, under
+    a lock its request threads (CLIENT_THREADS, 8 by default) share; it is
+    held for a dict lookup and one add, so contention stays short. Reads map
+    every segment in the directory and sum them, so any worker's /metrics
+    covers all of them. Segments of exited workers stay and keep counting,
+    the totals never go backwards when a worker is replaced.
+    """
+
+    HEADER = struct.Struct('<4sIIIQ')  # magic, slots, directory size, pid, directory bytes used
+    USED_OFFSET = 16
+    DIRECTORY_OFFSET = 32
+    MAGIC = b'TARM'
+
+    def __init__(self, directory, slots=4096, directory_size=256 * 1024, buckets=LATENCY_BUCKETS, name='metrics'):
+        super().__init__(buckets)
+        self.directory = directory
+        # Segment files are <name>-<pid>.shm, registries sharing a directory need distinct names
+        self.name = name
+        self.slots = slots
+        self.directory_size = directory_size
+        self.dropped = 0
+        self._write_lock = threading.Lock()
+        self._pid = None
+        self._mm = None
+        self._values = None
+        self._slot_of = {}
+        self._directory_used = 0
+        self._readers = {}  # file name -> _SegmentReader
+
+    def _create_segment(self):
+        # Also runs again in a child forked after the parent recorded something
+        self._pid = os.getpid()
+        path = os.path.join(self.directory, f'{self.name}-{self._pid}.shm')
+        size = self.DIRECTORY_OFFSET + self.directory_size + self.slots * 8
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w+b') as f:
+            f.truncate(size)
+            self._mm = mmap.mmap(f.fileno(), size)
+        self.HEADER.pack_into(self._mm, 0, self.MAGIC, self.slots, self.directory_size, self._pid, 0)
+        self._values = memoryview(self._mm)[self.DIRECTORY_OFFSET + self.directory_size:].cast('d')
+        self._slot_of = {}
+        self._directory_used = 0
+        os.rename(tmp_path, path)
+
+    def _allocate(self, key):
+        if len(key) == 2:
+            entry = [key[0], list(key[1]), None]
+        else:
+            entry = [key[0], list(key[1]), key[2]]
+        line = (json.dumps(entry) + '\n').encode()
+        used = self._directory_used
+        if len(self._slot_of) >= self.slots or used + len(line) > self.directory_size:
+            if not self.dropped:
+                print(f"Shared metrics segment full ({self.slots} slots), dropping new series")
+            return None
+        start = self.DIRECTORY_OFFSET + used
+        self._mm[start:start + len(line)] = line
+        # The slot becomes visible to readers only once its key is complete
+        self._directory_used = used + len(line)
+        struct.pack_into('<Q', self._mm, self.USED_OFFSET, self._directory_used)
+        slot = self._slot_of[key] = len(self._slot_of)
+        return slot
+
+    def _add(self, key, value):
+        with self._write_lock:
+            if self._pid != os.getpid():
+                self._create_segment()
+            slot = self._slot_of.get(key)
+            if slot is None:
+                slot = self._allocate(key)
+                if slot is None:
+                    self.dropped += 1
+                    return
+            self._values[slot] += value
+
+    def inc(self, name, labels=(), value=1):
+        self._add((name, labels), value)
+
+    def observe(self, name, labels, value):
+        self._add((name, labels, bisect.bisect_left(self.buckets, value)), 1)
+        self._add((name, labels, -1), value)
+
+    def segments(self):
+        """File names of every process's segment in the directory"""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(name for name in names if name.startswith(f'{self.name}-') and name.endswith('.shm'))
+
+    def merged(self):
+        merged = {}
+        with self._lock:
+            for name in self.segments():
+                reader = self._readers.get(name)
+                if reader is None:
+                    try:
+                        reader = self._readers[name] = _SegmentReader(os.path.join(self.directory, name))
+                    except (OSError, ValueError, struct.error):
+                        continue
+                for key, value in reader.read():
+                    # Counts are whole numbers stored as float64, only the sums aren't
+                    if len(key) == 2 or key[2] >= 0:
+                        value = int(value)
+                    merged[key] = merged.get(key, 0) + value
+        return merged
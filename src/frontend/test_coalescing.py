@@ -0,0 +1,110 @@
+# test_coalescing.py
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pytest
+
+from coalescing import AsyncCoalescer, BatchIncomplete, BatchItemError, Coalescer, _settle, item_result
+from pools import AbortHandle, Aborted
+
+
+def echo_batches(sent, drop=()):
+    """send_batch(ip, items) recording each batch, answering items in
+    reverse and leaving out the indexes in `drop`"""
+    def send_batch(ip, items):
+        sent.append((ip, list(items)))
+        for index in reversed(range(len(items))):
+            if index not in drop:
+                yield item_result({'index': index, 'item': items[index]})
+    return send_batch
+
+
+def submit_all(coalescer, ip, items):
+    with ThreadPoolExecutor(max_workers=len(items)) as pool:
+        return list(pool.map(lambda item: coalescer.submit(ip, item), items))
+
+
+def test_concurrent_calls_share_one_batch():
+    sent = []
+    coalescer = Coalescer(echo_batches(sent), window=0.2)
+    results = submit_all(coalescer, '10.0.0.1', ['a', 'b', 'c'])
+    assert [result['item'] for result in results] == ['a', 'b', 'c']
+    assert len(sent) == 1 and sorted(sent[0][1]) == ['a', 'b', 'c']
+
+
+def test_a_full_batch_goes_out_without_waiting_for_the_window():
+    sent = []
+    coalescer = Coalescer(echo_batches(sent), window=30, max_size=2)
+    results = submit_all(coalescer, '10.0.0.1', ['a', 'b'])
+    assert [result['item'] for result in results] == ['a', 'b']
+    assert len(sent) == 1 and sorted(sent[0][1]) == ['a', 'b']
+
+
+def test_batches_are_per_endpoint():
+    sent = []
+    coalescer = Coalescer(echo_batches(sent), window=0)
+    assert coalescer.submit('10.0.0.1', 'a')['item'] == 'a'
+    assert coalescer.submit('10.0.0.2', 'b')['item'] == 'b'
+    assert sent == [('10.0.0.1', ['a']), ('10.0.0.2', ['b'])]
+
+
+def test_error_lines_and_missing_lines_fail_only_their_items():
+    def send_batch(ip, items):
+        yield item_result({'index': 0, 'error': 'overloaded'})
+    coalescer = Coalescer(send_batch, window=0)
+    with pytest.raises(BatchItemError, match="overloaded"):
+        coalescer.submit('10.0.0.1', 'a')
+    coalescer = Coalescer(echo_batches([], drop={0}), window=0)
+    with pytest.raises(BatchIncomplete):
+        coalescer.submit('10.0.0.1', 'a')
+
+
+def test_aborting_gives_up_on_the_answer_only():
+    sent, release = [], threading.Event()
+
+    def send_batch(ip, items):
+        release.wait(5)
+        yield from echo_batches(sent)(ip, items)
+    coalescer = Coalescer(send_batch, window=0)
+    abort = AbortHandle()
+    threading.Timer(0.05, abort.abort).start()
+    with pytest.raises(Aborted):
+        coalescer.submit('10.0.0.1', 'a', abort)
+    release.set()
+    # The batch still goes out and its late answer is dropped
+    coalescer._executor.shutdown(wait=True)
+    assert sent == [('10.0.0.1', ['a'])]
+    aborted = AbortHandle()
+    aborted.abort()
+    with pytest.raises(Aborted):
+        coalescer.submit('10.0.0.1', 'b', aborted)
+
+
+def test_settling_a_settled_future_is_a_no_op():
+    future = Future()
+    _settle(future, Aborted())
+    _settle(future, {'index': 0})
+    with pytest.raises(Aborted):
+        future.result()
+    # An abort that loses the race to the answer
+    future = Future()
+    future.set_result('answer')
+    abort = AbortHandle()
+    abort.bind(lambda: future.set_exception(Aborted()))
+    abort.abort()
+    assert future.result() == 'answer'
+
+
+def test_async_coalescer_batches_on_the_loop():
+    sent = []
+
+    async def send_batch(ip, items):
+        for result in echo_batches(sent)(ip, items):
+            yield result
+
+    async def main():
+        coalescer = AsyncCoalescer(send_batch, window=0.01)
+        return await asyncio.gather(*(coalescer.submit('10.0.0.1', item) for item in 'abc'))
+    assert [result['item'] for result in asyncio.run(main())] == ['a', 'b', 'c']
+    assert sent == [('10.0.0.1', ['a', 'b', 'c'])]
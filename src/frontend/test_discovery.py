@@ -0,0 +1,150 @@
+# test_discovery.py
+from types import SimpleNamespace as NS
+
+from discovery import ZONE_LABEL, EndpointSliceCache, PodEndpointCache
+
+
+class FakeKube:
+    def list_node(self, **kwargs):
+        raise AssertionError("informers are not started in these tests")
+
+    list_namespaced_pod = list_namespaced_endpoint_slice = list_node
+
+
+def node(name, zone):
+    return NS(metadata=NS(name=name, labels={ZONE_LABEL: zone}))
+
+
+def pod(name, node_name, ip, ready=True, deleting=False):
+    return NS(metadata=NS(name=name, deletion_timestamp="now" if deleting else None),
+              spec=NS(node_name=node_name),
+              status=NS(pod_ip=ip, conditions=[NS(type="Ready", status="True" if ready else "False")]))
+
+
+def endpoint(ip, zone, ready=True, for_zones=()):
+    hints = NS(for_zones=[NS(name=z) for z in for_zones]) if for_zones else None
+    return NS(addresses=[ip], zone=zone, conditions=NS(ready=ready), hints=hints)
+
+
+def endpoint_slice(name, *endpoints):
+    return NS(metadata=NS(name=name), endpoints=list(endpoints))
+
+
+def pod_cache():
+    cache = PodEndpointCache(FakeKube(), "backend")
+    cache._replace_nodes([node("n1", "zone-a"), node("n2", "zone-b")])
+    cache._replace_pods([pod("p1", "n1", "10.0.0.2"), pod("p2", "n1", "10.0.0.1"), pod("p3", "n2", "10.0.1.1")])
+    return cache
+
+
+def test_pod_cache_indexes_ready_pods_by_node_zone():
+    cache = pod_cache()
+    assert cache.snapshot() == {'zone-a': ['10.0.0.1', '10.0.0.2'], 'zone-b': ['10.0.1.1']}
+    assert cache.hints() == {}
+
+
+def test_pod_cache_skips_pods_that_cannot_serve():
+    cache = pod_cache()
+    cache._on_pod_event("MODIFIED", pod("p1", "n1", "10.0.0.2", ready=False))
+    cache._on_pod_event("MODIFIED", pod("p3", "n2", "10.0.1.1", deleting=True))
+    cache._on_pod_event("ADDED", pod("p4", None, None))
+    assert cache.snapshot() == {'zone-a': ['10.0.0.1']}
+
+
+def test_pod_cache_swaps_in_a_new_snapshot_and_notifies():
+    cache = pod_cache()
+    seen = []
+    cache.add_listener(seen.append)
+    before, version = cache.snapshot(), cache.version
+    cache._on_pod_event("ADDED", pod("p4", "n2", "10.0.1.2"))
+    assert before == {'zone-a': ['10.0.0.1', '10.0.0.2'], 'zone-b': ['10.0.1.1']}
+    assert cache.snapshot()['zone-b'] == ['10.0.1.1', '10.0.1.2']
+    assert cache.version == version + 1
+    assert seen == [cache.snapshot()]
+    cache._on_pod_event("DELETED", pod("p4", "n2", "10.0.1.2"))
+    assert cache.snapshot() == before
+    assert len(seen) == 2
+
+
+def test_pod_cache_ignores_events_that_change_nothing():
+    cache = pod_cache()
+    snapshot, version = cache.snapshot(), cache.version
+    cache._on_pod_event("MODIFIED", pod("p1", "n1", "10.0.0.2"))
+    cache._on_pod_event("DELETED", pod("p9", "n1", "10.0.0.9"))
+    # Node heartbeats
+    cache._on_node_event("MODIFIED", node("n1", "zone-a"))
+    assert cache.snapshot() is snapshot and cache.version == version
+
+
+def test_pod_cache_follows_node_zone_changes():
+    cache = pod_cache()
+    cache._on_node_event("MODIFIED", node("n2", "zone-c"))
+    assert cache.snapshot()['zone-c'] == ['10.0.1.1']
+    cache._on_node_event("DELETED", node("n2", "zone-c"))
+    assert cache.snapshot()['unknown'] == ['10.0.1.1']
+
+
+def test_pod_cache_survives_a_failing_listener():
+    cache = pod_cache()
+    seen = []
+    cache.add_listener(lambda snapshot: 1 / 0)
+    cache.add_listener(seen.append)
+    cache._on_pod_event("ADDED", pod("p4", "n2", "10.0.1.2"))
+    assert len(seen) == 1
+
+
+def slice_cache():
+    cache = EndpointSliceCache(FakeKube(), "backend-service")
+    cache._replace_slices([
+        endpoint_slice("s1", endpoint("10.0.0.2", "zone-a", for_zones=["zone-a"]),
+                       endpoint("10.0.1.1", "zone-b", for_zones=["zone-b", "zone-c"])),
+        endpoint_slice("s2", endpoint("10.0.0.1", "zone-a", for_zones=["zone-a"]),
+                       endpoint("10.0.2.1", "zone-c", ready=False)),
+    ])
+    return cache
+
+
+def test_slice_rebuild_indexes_ready_endpoints_and_hints():
+    cache = slice_cache()
+    assert cache.snapshot() == {'zone-a': ['10.0.0.1', '10.0.0.2'], 'zone-b': ['10.0.1.1']}
+    assert cache.hints() == {'zone-a': [('10.0.0.1', 'zone-a'), ('10.0.0.2', 'zone-a')],
+                             'zone-b': [('10.0.1.1', 'zone-b')],
+                             'zone-c': [('10.0.1.1', 'zone-b')]}
+
+
+def test_slice_rebuild_treats_a_missing_ready_condition_as_ready():
+    cache = EndpointSliceCache(FakeKube(), "backend-service")
+    unknown = NS(addresses=["10.0.3.1"], zone=None, conditions=None, hints=None)
+    cache._replace_slices([endpoint_slice("s1", unknown, NS(addresses=[], zone="zone-a", conditions=None, hints=None))])
+    assert cache.snapshot() == {'unknown': ['10.0.3.1']}
+
+
+def test_slice_events_replace_and_remove_slices():
+    cache = slice_cache()
+    seen = []
+    cache.add_listener(seen.append)
+    version = cache.version
+    cache._on_slice_event("MODIFIED", endpoint_slice("s2", endpoint("10.0.2.1", "zone-c", for_zones=["zone-c"])))
+    assert cache.snapshot()['zone-c'] == ['10.0.2.1']
+    assert cache.hints()['zone-c'] == [('10.0.1.1', 'zone-b'), ('10.0.2.1', 'zone-c')]
+    cache._on_slice_event("DELETED", endpoint_slice("s1"))
+    assert cache.snapshot() == {'zone-c': ['10.0.2.1']}
+    assert cache.version == version + 2 and len(seen) == 2
+
+
+def test_slice_events_that_change_nothing_keep_the_snapshot():
+    cache = slice_cache()
+    snapshot, hints, version = cache.snapshot(), cache.hints(), cache.version
+    cache._on_slice_event("MODIFIED", endpoint_slice("s2", endpoint("10.0.0.1", "zone-a", for_zones=["zone-a"]),
+                                                     endpoint("10.0.2.1", "zone-c", ready=False)))
+    cache._on_slice_event("DELETED", endpoint_slice("s9"))
+    assert cache.snapshot() is snapshot and cache.hints() is hints and cache.version == version
+
+
+def test_slice_rebuild_notices_a_hints_only_change():
+    cache = slice_cache()
+    version = cache.version
+    cache._on_slice_event("MODIFIED", endpoint_slice("s2", endpoint("10.0.0.1", "zone-a", for_zones=["zone-b"]),
+                                                     endpoint("10.0.2.1", "zone-c", ready=False)))
+    assert cache.version == version + 1
+    assert cache.hints()['zone-b'] == [('10.0.0.1', 'zone-a'), ('10.0.1.1', 'zone-b')]
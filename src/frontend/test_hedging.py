@@ -0,0 +1,137 @@
+# test_hedging.py
+import threading
+
+import pytest
+
+from hedging import HedgeBudget, Hedger, LatencyHistogram, _Race
+from pools import Aborted
+
+
+def slow_call(answers):
+    """call(target, abort): sleeps answers[target] seconds unless aborted,
+    raises when the answer is an exception"""
+    aborted = []
+
+    def call(target, abort):
+        answer = answers[target]
+        if isinstance(answer, Exception):
+            raise answer
+        done = threading.Event()
+        if abort is not None and not abort.bind(done.set):
+            raise Aborted()
+        if done.wait(answer):
+            aborted.append(target)
+            raise Aborted()
+        return f"answer from {target}"
+    return call, aborted
+
+
+def warmed_hedger(latency=0.02, **kwargs):
+    hedger = Hedger(min_samples=10, **kwargs)
+    for _ in range(10):
+        hedger.histogram.record(latency)
+    return hedger
+
+
+def test_budget_starts_with_a_burst_then_refills_per_request():
+    budget = HedgeBudget(percent=10, burst=2)
+    assert budget.try_acquire() and budget.try_acquire()
+    assert not budget.try_acquire()
+    for _ in range(5):
+        budget.on_request()
+    assert not budget.try_acquire()
+    # Ten 0.1 refills add up to a hair under one token
+    for _ in range(6):
+        budget.on_request()
+    assert budget.try_acquire()
+
+
+def test_budget_never_holds_more_than_its_burst():
+    budget = HedgeBudget(percent=50, burst=3)
+    for _ in range(100):
+        budget.on_request()
+    assert sum(budget.try_acquire() for _ in range(10)) == 3
+
+
+def test_histogram_percentile_is_a_bucket_bound():
+    histogram = LatencyHistogram()
+    assert histogram.percentile(95) is None
+    for latency in [0.01] * 95 + [0.5] * 5:
+        histogram.record(latency)
+    assert 0.01 <= histogram.percentile(95) < 0.01 * 1.2
+    assert 0.5 <= histogram.percentile(99) < 0.5 * 1.2
+
+
+def test_no_hedge_delay_until_enough_samples():
+    hedger = Hedger(min_samples=10)
+    for _ in range(9):
+        hedger.histogram.record(0.02)
+    assert hedger.delay() is None
+    hedger.histogram.record(0.02)
+    assert 0.02 <= hedger.delay() < 0.02 * 1.2
+
+
+def test_hedge_delay_has_a_floor():
+    assert warmed_hedger(latency=0.001, min_delay=0.005).delay() == 0.005
+
+
+def test_fast_primary_is_not_hedged():
+    hedger = warmed_hedger()
+    call, aborted = slow_call({'a': 0, 'b': 0})
+    assert hedger.run(call, 'a', lambda target: 'b') == ("answer from a", 'a', False, False)
+    assert aborted == []
+
+
+def test_cold_hedger_runs_the_primary_alone():
+    hedger = Hedger(min_samples=10)
+    call, _ = slow_call({'a': 0.05})
+    assert hedger.run(call, 'a', lambda target: pytest.fail("hedged")) == ("answer from a", 'a', False, False)
+
+
+def test_slow_primary_loses_to_the_hedge_and_is_aborted():
+    hedger = warmed_hedger()
+    call, aborted = slow_call({'a': 5, 'b': 0})
+    assert hedger.run(call, 'a', lambda target: 'b') == ("answer from b", 'b', True, True)
+    assert aborted == ['a']
+
+
+def test_hedge_wins_when_the_primary_fails():
+    hedger = warmed_hedger()
+    call, _ = slow_call({'b': 0.1})
+
+    def failing_primary(target, abort):
+        if target == 'a':
+            # Fails after the hedge went out, before the hedge answers
+            threading.Event().wait(0.05)
+            raise ConnectionError("reset")
+        return call(target, abort)
+    assert hedger.run(failing_primary, 'a', lambda target: 'b') == ("answer from b", 'b', True, True)
+
+
+def test_primary_error_is_raised_when_both_fail():
+    hedger = warmed_hedger()
+    call, _ = slow_call({'a': ConnectionError("primary"), 'b': ConnectionError("hedge")})
+    with pytest.raises(ConnectionError, match="primary"):
+        hedger.run(call, 'a', lambda target: 'b')
+
+
+def test_no_hedge_without_budget_or_alternate():
+    hedger = warmed_hedger(budget_percent=0)
+    hedger.budget._tokens = 0
+    call, _ = slow_call({'a': 0.1, 'b': 0})
+    assert hedger.run(call, 'a', lambda target: 'b') == ("answer from a", 'a', False, False)
+    hedger = warmed_hedger()
+    assert hedger.run(call, 'a', lambda target: None) == ("answer from a", 'a', False, False)
+
+
+def test_a_hedge_that_does_not_go_out_keeps_its_token():
+    hedger = warmed_hedger()
+    hedger.budget._tokens = 1.0
+    call, _ = slow_call({'a': 0.1})
+    assert hedger.run(call, 'a', lambda target: None) == ("answer from a", 'a', False, False)
+    assert hedger.budget._tokens == pytest.approx(1.1)
+    # Nor does a hedge whose primary finished before it started
+    race = _Race()
+    race.primary_finished = True
+    hedger._hedge(race, call, 'a', lambda target: 'b')
+    assert race.alternate is None and hedger.budget._tokens == pytest.approx(1.1)
@@ -0,0 +1,59 @@
+# test_metrics.py
+import threading
+
+import pytest
+
+from metrics import MetricsRegistry, TextExposition
+
+
+def record_on_threads(registry, threads=8, per_thread=1000):
+    def record():
+        for _ in range(per_thread):
+            registry.inc('requests', ('zone-a', 'zone-b'))
+            registry.observe('latency', ('zone-a', 'zone-b'), 0.02)
+    workers = [threading.Thread(target=record) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+def test_counts_from_every_thread_add_up():
+    registry = MetricsRegistry(buckets=(0.01, 0.05))
+    record_on_threads(registry)
+    counters, histograms = registry.collect()
+    assert counters == {('requests', ('zone-a', 'zone-b')): 8000}
+    histogram = histograms[('latency', ('zone-a', 'zone-b'))]
+    assert histogram['counts'] == [0, 8000, 0]
+    assert histogram['count'] == 8000
+    assert histogram['sum'] == pytest.approx(160)
+
+
+def test_shards_of_exited_threads_are_folded_in():
+    registry = MetricsRegistry(buckets=(0.01, 0.05))
+    record_on_threads(registry, threads=4, per_thread=10)
+    with registry._lock:
+        registry._prune()
+    assert registry._shards == {}
+    registry.inc('requests', ('zone-a', 'zone-b'))
+    counters, histograms = registry.collect()
+    assert counters[('requests', ('zone-a', 'zone-b'))] == 41
+    assert histograms[('latency', ('zone-a', 'zone-b'))]['counts'] == [0, 40, 0]
+
+
+def test_exposition_renders_cumulative_buckets():
+    registry = MetricsRegistry(buckets=(0.01, 0.05))
+    registry.inc('requests', ('zone-a', 'zone-b'), 3)
+    registry.observe('latency', ('zone-a', 'zone-b'), 0.005)
+    registry.observe('latency', ('zone-a', 'zone-b'), 0.02)
+    exposition = TextExposition(registry, {
+        'requests': ('requests_total', 'counter', 'Requests', ('source', 'target')),
+        'latency': ('latency_seconds', 'histogram', 'Latency', ('source', 'target'))})
+    text = exposition.render(now=0)
+    assert 'requests_total{source="zone-a",target="zone-b"} 3\n' in text
+    assert 'latency_seconds_bucket{source="zone-a",target="zone-b",le="0.05"} 2\n' in text
+    assert 'latency_seconds_bucket{source="zone-a",target="zone-b",le="+Inf"} 2\n' in text
+    assert 'latency_seconds_count{source="zone-a",target="zone-b"} 2\n' in text
+    # Within min_interval the text is reused
+    registry.inc('requests', ('zone-a', 'zone-b'))
+    assert exposition.render(now=0.5) == text
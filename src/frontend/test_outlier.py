@@ -0,0 +1,133 @@
+# test_outlier.py
+import pytest
+
+import outlier
+from outlier import OutlierDetector
+
+BACKENDS = {'zone-a': ['10.0.0.1', '10.0.0.2', '10.0.0.3', '10.0.0.4'], 'zone-b': ['10.0.1.1']}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(outlier.time, 'monotonic', clock)
+    return clock
+
+
+def fail(detector, ip, times, outcome="error"):
+    for _ in range(times):
+        detector.request_started(ip)
+        detector.request_finished(ip, 0.01, outcome)
+
+
+def test_consecutive_errors_eject_an_endpoint(clock):
+    detector = OutlierDetector(consecutive_errors=3)
+    detector.filter(BACKENDS)
+    fail(detector, '10.0.0.1', 2)
+    assert detector.available('10.0.0.1')
+    fail(detector, '10.0.0.1', 1)
+    assert detector.filter(BACKENDS)['zone-a'] == ['10.0.0.2', '10.0.0.3', '10.0.0.4']
+
+
+def test_a_success_resets_the_error_streak(clock):
+    detector = OutlierDetector(consecutive_errors=3)
+    fail(detector, '10.0.0.1', 2)
+    detector.request_finished('10.0.0.1', 0.01, "success")
+    fail(detector, '10.0.0.1', 2)
+    assert detector.available('10.0.0.1')
+
+
+def test_timeouts_eject_sooner(clock):
+    detector = OutlierDetector(consecutive_errors=5, consecutive_timeouts=2)
+    fail(detector, '10.0.0.1', 2, "timeout")
+    assert not detector.available('10.0.0.1')
+
+
+def test_expired_ejection_lets_one_probe_through(clock):
+    detector = OutlierDetector(consecutive_errors=1, base_ejection_time=10)
+    detector.filter(BACKENDS)
+    fail(detector, '10.0.0.1', 1)
+    clock.now += 10
+    assert '10.0.0.1' in detector.filter(BACKENDS)['zone-a']
+    detector.request_started('10.0.0.1')
+    # Only one probe at a time
+    assert '10.0.0.1' not in detector.filter(BACKENDS)['zone-a']
+    detector.request_finished('10.0.0.1', 0.01, "success")
+    assert '10.0.0.1' in detector.filter(BACKENDS)['zone-a']
+    assert detector.stats() == {'10.0.0.1': {'ejected_for_s': 0.0, 'ejections': 1, 'half_open': False}}
+
+
+def test_a_failed_probe_ejects_again_for_twice_as_long(clock):
+    detector = OutlierDetector(consecutive_errors=3, base_ejection_time=10)
+    detector.filter(BACKENDS)
+    fail(detector, '10.0.0.1', 3)
+    clock.now += 10
+    detector.filter(BACKENDS)
+    fail(detector, '10.0.0.1', 1)
+    assert detector.stats()['10.0.0.1']['ejected_for_s'] == pytest.approx(20)
+
+
+def test_no_more_than_the_max_percent_of_a_zone_is_ejected(clock):
+    detector = OutlierDetector(consecutive_errors=1, max_ejection_percent=50)
+    detector.filter(BACKENDS)
+    for ip in BACKENDS['zone-a']:
+        fail(detector, ip, 1)
+    assert len(detector.filter(BACKENDS)['zone-a']) == 2
+    # A zone of one may still lose its only endpoint
+    fail(detector, '10.0.1.1', 1)
+    assert 'zone-b' not in detector.filter(BACKENDS)
+
+
+def test_everything_ejected_falls_back_to_the_full_set(clock):
+    detector = OutlierDetector(consecutive_errors=1)
+    backends = {'zone-a': ['10.0.0.1']}
+    detector.filter(backends)
+    fail(detector, '10.0.0.1', 1)
+    assert detector.filter(backends) is backends
+
+
+def test_slow_endpoints_are_ejected_by_the_latency_sweep(clock):
+    detector = OutlierDetector(latency_factor=3.0, min_outlier_latency=0.05, interval=5.0)
+    detector.filter(BACKENDS)
+    for ip in BACKENDS['zone-a']:
+        detector.request_finished(ip, 0.5 if ip == '10.0.0.4' else 0.02, "success")
+    clock.now += 5
+    detector.request_finished('10.0.0.1', 0.02, "success")
+    assert not detector.available('10.0.0.4')
+    assert all(detector.available(ip) for ip in BACKENDS['zone-a'][:3])
+
+
+def test_filter_result_is_reused_until_something_changes(clock):
+    detector = OutlierDetector(consecutive_errors=1)
+    first = detector.filter(BACKENDS)
+    assert detector.filter(BACKENDS) is first
+    fail(detector, '10.0.0.1', 1)
+    assert detector.filter(BACKENDS) is not first
+
+
+def test_weights_halve_per_unforgiven_ejection(clock):
+    detector = OutlierDetector(consecutive_errors=1, base_ejection_time=10, max_ejection_time=300)
+    detector.filter(BACKENDS)
+    assert detector.weights() == {}
+    fail(detector, '10.0.0.1', 1)
+    clock.now += 10
+    detector.filter(BACKENDS)
+    fail(detector, '10.0.0.1', 1)
+    assert detector.weights() == {'10.0.0.1': 0.25}
+    # Cached until something changes
+    assert detector.weights() is detector.weights()
+    # A healthy stretch longer than max_ejection_time forgives one ejection
+    clock.now += 20
+    detector.filter(BACKENDS)
+    detector.request_finished('10.0.0.1', 0.01, "success")
+    clock.now += 301
+    detector.request_finished('10.0.0.1', 0.01, "success")
+    assert detector.weights() == {'10.0.0.1': 0.5}
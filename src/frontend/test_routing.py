@@ -0,0 +1,203 @@
+# test_routing.py
+import random
+from collections import Counter
+
+import pytest
+
+from routing import (AffinityPolicy, LeastLatencyPolicy, ZonePreferencePolicy, ZoneWeightedPolicy,
+                     create_policy, rendezvous_rank, route, zone_weights)
+
+BACKENDS = {'zone-a': ['10.0.0.1', '10.0.0.2'], 'zone-b': ['10.0.1.1'], 'zone-c': ['10.0.2.1']}
+
+
+def zones_picked(policy, backends_by_zone, current_zone, n=2000):
+    return Counter(policy.choose(backends_by_zone, current_zone)[1] for _ in range(n))
+
+
+def test_route_without_endpoints_or_zone_goes_through_the_service():
+    policy = ZonePreferencePolicy()
+    assert route({}, 'zone-a', policy) == (None, "unknown")
+    assert route(BACKENDS, 'unknown', policy) == (None, "unknown")
+
+
+def test_route_follows_hints_over_the_policy():
+    policy = ZonePreferencePolicy(same_zone_preference=1.0)
+    hinted = [('10.0.1.1', 'zone-b')]
+    assert route(BACKENDS, 'zone-a', policy, hinted) == ('10.0.1.1', 'zone-b')
+    # Hints apply even before the zone is known
+    assert route(BACKENDS, 'unknown', policy, hinted) == ('10.0.1.1', 'zone-b')
+
+
+def test_zone_preference_keeps_its_share_local():
+    random.seed(1)
+    picked = zones_picked(ZonePreferencePolicy(0.8), BACKENDS, 'zone-a')
+    assert 0.75 < picked['zone-a'] / 2000 < 0.85
+    assert picked['zone-b'] and picked['zone-c']
+
+
+def test_zone_preference_falls_back_to_any_zone():
+    policy = ZonePreferencePolicy(1.0)
+    assert policy.choose({'zone-b': ['10.0.1.1']}, 'zone-a') == ('10.0.1.1', 'zone-b')
+    assert policy.choose({'zone-a': ['10.0.0.1']}, 'zone-a') == ('10.0.0.1', 'zone-a')
+    assert policy.choose({}, 'zone-a') == (None, "unknown")
+
+
+def test_zone_preference_probabilities():
+    probabilities = ZonePreferencePolicy(0.8).zone_probabilities(BACKENDS, 'zone-a')
+    assert probabilities == pytest.approx({'zone-a': 0.8, 'zone-b': 0.1, 'zone-c': 0.1})
+    assert ZonePreferencePolicy(0.8).zone_probabilities({'zone-b': ['x']}, 'zone-a') == {'zone-b': 1.0}
+
+
+def test_least_latency_stays_local_within_the_penalty():
+    policy = LeastLatencyPolicy(cross_zone_penalty=0.02)
+    for _ in range(50):
+        assert policy.choose(BACKENDS, 'zone-a')[1] == 'zone-a'
+
+
+def test_least_latency_spills_away_from_a_slow_zone():
+    random.seed(2)
+    policy = LeastLatencyPolicy(cross_zone_penalty=0.02)
+    for ip in BACKENDS['zone-a']:
+        # A sample after a long gap replaces the initial estimate
+        policy._get_stats(ip).updated -= 100
+        policy.request_started(ip)
+        policy.request_finished(ip, 1.0, True)
+    picked = zones_picked(policy, BACKENDS, 'zone-a', 200)
+    assert picked['zone-a'] == 0
+
+
+def test_least_latency_stays_local_with_requests_in_flight():
+    random.seed(4)
+    policy = LeastLatencyPolicy(cross_zone_penalty=0.02, parallelism=32)
+    # Concurrent requests spread over the local endpoints, none finished yet
+    for _ in range(8):
+        ip, zone = policy.choose(BACKENDS, 'zone-a')
+        assert zone == 'zone-a'
+        policy.request_started(ip)
+    assert zones_picked(policy, BACKENDS, 'zone-a', 200) == {'zone-a': 200}
+
+
+def test_least_latency_idle_estimate_fades_to_the_zone_average():
+    policy = LeastLatencyPolicy(initial_latency=0.05)
+    for ip, latency in (('10.0.1.1', 0.2), ('10.0.1.2', 0.01)):
+        policy._get_stats(ip, 'zone-b').updated -= 100
+        policy.request_started(ip)
+        policy.request_finished(ip, latency, True)
+    # Long idle, the fast endpoint neither looks free nor keeps its old estimate
+    policy._get_stats('10.0.1.2').updated -= 1000
+    assert policy.estimate('10.0.1.2') == pytest.approx(policy._zones['zone-b'].ewma)
+    assert policy.estimate('10.0.1.2') > 0.01
+
+
+def test_least_latency_counts_failures_as_slow():
+    policy = LeastLatencyPolicy(initial_latency=0.05)
+    policy.request_started('10.0.0.1')
+    policy.request_finished('10.0.0.1', 0.001, False)
+    assert policy.cost('10.0.0.1') > policy.cost('10.0.0.2')
+
+
+def test_least_latency_hinted_prefers_the_cheaper_endpoint():
+    policy = LeastLatencyPolicy()
+    hinted = [('10.0.0.1', 'zone-a'), ('10.0.1.1', 'zone-b')]
+    policy._get_stats('10.0.0.1').updated -= 100
+    policy.request_started('10.0.0.1')
+    policy.request_finished('10.0.0.1', 2.0, True)
+    # With two hinted endpoints both are always compared
+    for _ in range(20):
+        assert policy.choose_hinted(hinted) == ('10.0.1.1', 'zone-b')
+    assert policy.choose_hinted(hinted[:1]) == ('10.0.0.1', 'zone-a')
+
+
+def test_least_latency_retain_forgets_gone_endpoints():
+    policy = LeastLatencyPolicy()
+    policy.request_started('10.0.0.1')
+    policy.request_started('10.0.9.9')
+    policy.retain(['10.0.0.1'])
+    assert set(policy.stats()) == {'10.0.0.1'}
+
+
+def test_zone_weights_keep_traffic_local_with_enough_capacity():
+    assert zone_weights(BACKENDS, {'zone-a': 1, 'zone-b': 1, 'zone-c': 1}, 'zone-a') == {'zone-a': 1.0}
+
+
+def test_zone_weights_spill_a_short_zone_to_the_spare_capacity():
+    backends = {'zone-a': ['a1'], 'zone-b': ['b1', 'b2', 'b3'], 'zone-c': ['c1', 'c2']}
+    weights = zone_weights(backends, {'zone-a': 2, 'zone-b': 1, 'zone-c': 1}, 'zone-a')
+    # zone-a has 1/6 of the backends for 1/2 of the demand
+    assert weights['zone-a'] == pytest.approx(1 / 3)
+    assert weights['zone-b'] == pytest.approx(2 / 3 * 0.25 / (0.25 + 1 / 12))
+    assert sum(weights.values()) == pytest.approx(1.0)
+
+
+def test_zone_weights_without_local_backends_spread_by_capacity():
+    assert zone_weights({'zone-b': ['b1', 'b2'], 'zone-c': ['c1']}, {}, 'zone-a') == {'zone-b': 2, 'zone-c': 1}
+
+
+def test_zone_weighted_choose_matches_its_probabilities():
+    random.seed(3)
+    backends = {'zone-a': ['a1'], 'zone-b': ['b1', 'b2', 'b3']}
+    demand = {'zone-a': ['c1', 'c2'], 'zone-b': ['c3', 'c4']}
+    policy = ZoneWeightedPolicy(lambda: demand)
+    probabilities = policy.zone_probabilities(backends, 'zone-a')
+    assert probabilities == pytest.approx({'zone-a': 0.5, 'zone-b': 0.5})
+    picked = zones_picked(policy, backends, 'zone-a')
+    assert 0.45 < picked['zone-a'] / 2000 < 0.55
+    assert policy.choose({}, 'zone-a') == (None, "unknown")
+
+
+def test_zone_weighted_reuses_its_table_for_the_same_snapshot():
+    policy = ZoneWeightedPolicy()
+    table = policy._table(BACKENDS, 'zone-a')
+    assert policy._table(BACKENDS, 'zone-a') is table
+    assert policy._table(dict(BACKENDS), 'zone-a') is not table
+
+
+def test_zone_weighted_hinted_follows_the_hints():
+    policy = ZoneWeightedPolicy()
+    assert policy.choose_hinted([('10.0.1.1', 'zone-b')]) == ('10.0.1.1', 'zone-b')
+    assert policy.stats()['following_hints']
+
+
+def test_rendezvous_rank_only_moves_keys_of_a_removed_endpoint():
+    ips = [f'10.0.0.{i}' for i in range(5)]
+    before = {key: rendezvous_rank(key, ips)[0] for key in range(1000)}
+    after = {key: rendezvous_rank(key, ips[:-1])[0] for key in range(1000)}
+    moved = [key for key in before if before[key] != after[key]]
+    assert all(before[key] == ips[-1] for key in moved)
+    assert 100 < len(moved) < 300
+
+
+def test_affinity_sends_a_key_to_the_same_local_endpoint():
+    policy = AffinityPolicy()
+    first = policy.choose(BACKENDS, 'zone-a', 'user-42')
+    assert first[1] == 'zone-a'
+    assert all(policy.choose(BACKENDS, 'zone-a', 'user-42') == first for _ in range(10))
+    assert policy.choose_hinted([('10.0.1.1', 'zone-b')], 'user-42') == ('10.0.1.1', 'zone-b')
+
+
+def test_affinity_sheds_from_an_endpoint_over_its_load_cap():
+    policy = AffinityPolicy(load_factor=1.0)
+    ips = BACKENDS['zone-a']
+    ip, _ = policy.choose(BACKENDS, 'zone-a', 'hot')
+    policy.request_started(ip)
+    other = [i for i in ips if i != ip][0]
+    assert policy.choose(BACKENDS, 'zone-a', 'hot') == (other, 'zone-a')
+    assert policy.stats()['shed'] == 1
+    policy.request_finished(ip, 0.01, True)
+    assert policy.choose(BACKENDS, 'zone-a', 'hot') == (ip, 'zone-a')
+
+
+def test_affinity_weights_scale_an_endpoints_share_of_keys():
+    ips = BACKENDS['zone-a']
+    policy = AffinityPolicy(weight_source=lambda: {ips[0]: 0.25})
+    picked = Counter(policy.choose(BACKENDS, 'zone-a', key)[0] for key in range(2000))
+    assert 0.15 < picked[ips[0]] / 2000 < 0.25
+
+
+def test_create_policy():
+    assert isinstance(create_policy("least-latency"), LeastLatencyPolicy)
+    assert isinstance(create_policy("zone-weighted"), ZoneWeightedPolicy)
+    assert create_policy("zone-preference", same_zone_preference=0.5).same_zone_preference == 0.5
+    assert create_policy("affinity", load_factor=2.0).load_factor == 2.0
+    with pytest.raises(ValueError):
+        create_policy("round-robin")
@@ -0,0 +1,101 @@
+# test_shared.py
+import os
+import struct
+
+import pytest
+
+from shared import SharedEndpointTable, SharedEndpointView, SharedMetricsRegistry
+
+DOCUMENT = {'zone': 'zone-a', 'services': {
+    'default/backend-service': {'endpoints': {'zone-a': ['10.0.0.1']}, 'hints': {'zone-a': [['10.0.0.1', 'zone-a']]},
+                                'synced': True},
+    'default/client-service': {'endpoints': {'zone-a': ['10.0.2.1']}, 'hints': {}, 'synced': False}}}
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'endpoints.shm')
+
+
+def test_readers_see_what_the_writer_published(path):
+    writer, reader = SharedEndpointTable(path, size=4096), SharedEndpointTable(path, size=4096)
+    assert reader.read() == (0, None)
+    writer.publish(DOCUMENT)
+    sequence, document = reader.read()
+    assert sequence == 2 and document == DOCUMENT
+    # Unchanged sequence: the same decoded object, no copy or parse
+    assert reader.read()[1] is document
+    writer.publish({'zone': 'zone-b'})
+    assert reader.read() == (4, {'zone': 'zone-b'})
+
+
+def test_a_write_in_progress_or_a_torn_payload_keeps_the_last_good_copy(path):
+    writer, reader = SharedEndpointTable(path, size=4096), SharedEndpointTable(path, size=4096)
+    writer.publish({'zone': 'zone-a'})
+    good = reader.read()
+    # Writer stuck mid-update: odd sequence
+    struct.pack_into('<Q', writer._mm, 0, 3)
+    assert reader.read(retries=3) is good
+    # Even sequence, but the payload doesn't match its CRC
+    struct.pack_into('<Q', writer._mm, 0, 4)
+    writer._mm[SharedEndpointTable.HEADER.size] = ord('[')
+    assert reader.read(retries=3) is good
+
+
+def test_a_restarted_publisher_carries_on_the_sequence(path):
+    SharedEndpointTable(path, size=4096).publish({'zone': 'zone-a'})
+    reader = SharedEndpointTable(path, size=4096)
+    reader.read()
+    SharedEndpointTable(path, size=4096).publish({'zone': 'zone-b'})
+    assert reader.read() == (4, {'zone': 'zone-b'})
+
+
+def test_a_document_too_large_is_not_published(path):
+    writer = SharedEndpointTable(path, size=64)
+    assert not writer.publish({'zone': 'x' * 100})
+    assert SharedEndpointTable(path, size=64).read() == (0, None)
+
+
+def test_endpoint_view_serves_one_service_like_a_discovery_cache(path):
+    writer = SharedEndpointTable(path, size=4096)
+    writer.publish(DOCUMENT)
+    view = SharedEndpointView(SharedEndpointTable(path, size=4096), 'default/backend-service')
+    changes = []
+    view.add_listener(changes.append)
+    snapshot = view.snapshot()
+    assert snapshot == {'zone-a': ['10.0.0.1']}
+    assert view.hints() == {'zone-a': [('10.0.0.1', 'zone-a')]}
+    assert view.wait_for_sync(0)
+    assert not SharedEndpointView(view.table, 'default/client-service').wait_for_sync(0)
+    # Another service changing keeps this one's snapshot object
+    writer.publish(dict(DOCUMENT, zone='zone-b'))
+    assert view.snapshot() is snapshot
+    assert changes == [snapshot] and view.version == 1
+
+
+def test_counters_from_every_process_are_summed(tmp_path):
+    directory = str(tmp_path)
+    registry = SharedMetricsRegistry(directory, buckets=(0.01, 0.05))
+    registry.inc('requests', ('zone-a', 'zone-b'), 2)
+    pid = os.fork()
+    if pid == 0:
+        # A worker: records into its own segment, then exits
+        try:
+            registry.inc('requests', ('zone-a', 'zone-b'), 3)
+            registry.observe('latency', ('zone-a', 'zone-b'), 0.02)
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+    assert len(registry.segments()) == 2
+    counters, histograms = SharedMetricsRegistry(directory, buckets=(0.01, 0.05)).collect()
+    assert counters == {('requests', ('zone-a', 'zone-b')): 5}
+    assert histograms[('latency', ('zone-a', 'zone-b'))] == {'counts': [0, 1, 0], 'count': 1, 'sum': 0.02}
+
+
+def test_new_series_beyond_the_segment_are_dropped(tmp_path):
+    registry = SharedMetricsRegistry(str(tmp_path), slots=2)
+    for zone in ('zone-a', 'zone-b', 'zone-c'):
+        registry.inc('requests', (zone,))
+    registry.inc('requests', ('zone-a',))
+    assert registry.dropped == 1
+    assert registry.collect()[0] == {('requests', ('zone-a',)): 2, ('requests', ('zone-b',)): 1}
@@ -0,0 +1,52 @@
+# transfer.py
+#
+# Bytes a backend call puts on the wire, for the per zone pair traffic
+# matrix. Counts the HTTP/1.1 start line, headers, blank line and body of
+# each message; TCP/IP framing is left out.
+
+
+def message_size(start_line, headers, body_length):
+    """Size of an HTTP/1.1 message with `headers` as (name, value) pairs"""
+    return (len(start_line) + 2
+            + sum(len(name) + len(value) + 4 for name, value in headers)
+            + 2 + body_length)
+
+
+def body_length(headers, body):
+    # Content-Length is what crossed the wire, `body` may have been decompressed
+    length = headers.get('Content-Length')
+    if length is not None and str(length).isdigit():
+        return int(length)
+    return len(body or b'')
+
+
+def requests_sizes(response, body_read=None):
+    """(request bytes, response bytes) of a completed requests.Response. A
+    streamed response passes the body bytes it read as `body_read`."""
+    prepared = response.request
+    request_headers = list(prepared.headers.items())
+    if 'Host' not in prepared.headers:
+        # urllib3 adds it when sending
+        request_headers.append(('Host', response.url.split('/')[2]))
+    sent = message_size(f'{prepared.method} {prepared.path_url} HTTP/1.1', request_headers,
+                        body_length(prepared.headers, prepared.body))
+    status_line = f'HTTP/1.1 {response.status_code} {response.reason or ""}'
+    if body_read is None:
+        body_read = body_length(response.headers, response.content)
+    received = message_size(status_line, response.headers.items(), body_read)
+    return sent, received
+
+
+def aiohttp_sizes(response, body, request_body=b'', body_read=None):
+    """(request bytes, response bytes) of an aiohttp response whose body was
+    read. aiohttp doesn't keep the request body, so a POST passes it, and a
+    streamed response passes the body bytes it read as `body_read`."""
+    info = response.request_info
+    sent = message_size(f'{info.method} {info.url.raw_path_qs} HTTP/1.1', info.headers.items(),
+                        len(request_body))
+    status_line = f'HTTP/1.1 {response.status} {response.reason or ""}'
+    if body_read is None:
+        body_read = body_length(response.headers, body)
+    received = message_size(status_line, [(name.decode(), value.decode()) for name, value in response.raw_headers],
+                            body_read)
+    return sent, received
@@ -0,0 +1,325 @@
+# fake_kube.py
+#
+# In-memory stand-in for the parts of the Kubernetes API the services use:
+# nodes, pods and discovery.k8s.io/v1 EndpointSlices, with list, get and
+# watch (resourceVersion, timeoutSeconds, bookmarks, 410 Gone). Plain HTTP,
+# no auth. Point a service at it with KUBE_API_URL.
+#
+# Requests may start with /caller/<name>; the prefix is stripped and the call
+# counted for <name>, so each service process gets its own call counts:
+#
+#   KUBE_API_URL=http://127.0.0.1:6443/caller/client-1
+#
+# GET /_stats returns those counts. Standalone use:
+#
+#   python fake_kube.py --config topology.json
+import argparse
+import collections
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+ZONE_LABEL = "topology.kubernetes.io/zone"
+SERVICE_NAME_LABEL = "kubernetes.io/service-name"
+
+
+def matches(labels, selector):
+    """Equality-based label selector, e.g. "app=backend-service,tier=x" """
+    for term in filter(None, (selector or "").split(",")):
+        key, _, value = term.partition("=")
+        if (labels or {}).get(key.strip()) != value.strip().lstrip("="):
+            return False
+    return True
+
+
+class FakeCluster:
+    """Objects, their resourceVersions and the event log that watches replay.
+
+    Each change bumps the global resourceVersion and is appended to a
+    bounded event log; a watch from a version older than the log gets
+    410 Gone, like a real API server after compaction. One EndpointSlice
+    per app is derived from that app's pods (the Service name equals the
+    app label, as in the manifests), optionally with same-zone hints.
+    """
+
+    def __init__(self, namespace="default", history=10000, hints=False):
+        self.namespace = namespace
+        self.hints = hints
+        self._lock = threading.Condition()
+        self._version = 1
+        self._objects = {'nodes': {}, 'pods': {}, 'endpointslices': {}}
+        self._events = collections.deque(maxlen=history)
+        self.calls = collections.Counter()  # (caller, kind, verb) -> count
+
+    # -- mutations -----------------------------------------------------------
+
+    def _bump(self, kind, event_type, obj):
+        # Called with the lock held
+        self._version += 1
+        obj['metadata']['resourceVersion'] = str(self._version)
+        self._events.append((self._version, kind, event_type, json.dumps(obj)))
+        self._lock.notify_all()
+
+    def add_node(self, name, zone):
+        with self._lock:
+            node = {
+                'kind': 'Node', 'apiVersion': 'v1',
+                'metadata': {'name': name, 'uid': f'node-{name}', 'labels': {ZONE_LABEL: zone}},
+                'status': {'conditions': [{'type': 'Ready', 'status': 'True'}]},
+            }
+            existed = name in self._objects['nodes']
+            self._objects['nodes'][name] = node
+            self._bump('nodes', 'MODIFIED' if existed else 'ADDED', node)
+
+    def add_pod(self, name, app, node, ip, ready=False):
+        with self._lock:
+            pod = {
+                'kind': 'Pod', 'apiVersion': 'v1',
+                'metadata': {'name': name, 'namespace': self.namespace, 'uid': f'pod-{name}',
+                             'labels': {'app': app}},
+                'spec': {'nodeName': node, 'containers': [{'name': app, 'image': f'{app}:latest'}]},
+                'status': {'phase': 'Running', 'podIP': ip,
+                           'conditions': [{'type': 'Ready', 'status': 'True' if ready else 'False'}]},
+            }
+            existed = name in self._objects['pods']
+            self._objects['pods'][name] = pod
+            self._bump('pods', 'MODIFIED' if existed else 'ADDED', pod)
+            self._sync_slice(app)
+
+    def set_ready(self, name, ready=True):
+        with self._lock:
+            pod = self._objects['pods'][name]
+            pod['status']['conditions'] = [{'type': 'Ready', 'status': 'True' if ready else 'False'}]
+            self._bump('pods', 'MODIFIED', pod)
+            self._sync_slice(pod['metadata']['labels']['app'])
+
+    def delete_pod(self, name):
+        with self._lock:
+            pod = self._objects['pods'].pop(name, None)
+            if pod is None:
+                return
+            self._bump('pods', 'DELETED', pod)
+            self._sync_slice(pod['metadata']['labels']['app'])
+
+    def _sync_slice(self, app):
+        # Called with the lock held: rebuild the app's EndpointSlice from its pods
+        zone_of = {name: node['metadata']['labels'].get(ZONE_LABEL)
+                   for name, node in self._objects['nodes'].items()}
+        endpoints = []
+        for pod in self._objects['pods'].values():
+            if pod['metadata']['labels'].get('app') != app or not pod['status'].get('podIP'):
+                continue
+            zone = zone_of.get(pod['spec']['nodeName'])
+            ready = any(c['type'] == 'Ready' and c['status'] == 'True' for c in pod['status']['conditions'])
+            endpoint = {'addresses': [pod['status']['podIP']], 'conditions': {'ready': ready},
+                        'nodeName': pod['spec']['nodeName'], 'zone': zone,
+                        'targetRef': {'kind': 'Pod', 'name': pod['metadata']['name'],
+                                      'namespace': self.namespace}}
+            if self.hints and zone:
+                endpoint['hints'] = {'forZones': [{'name': zone}]}
+            endpoints.append(endpoint)
+        endpoints.sort(key=lambda e: e['addresses'][0])
+        name = f'{app}-slice'
+        endpoint_slice = {
+            'kind': 'EndpointSlice', 'apiVersion': 'discovery.k8s.io/v1',
+            'metadata': {'name': name, 'namespace': self.namespace, 'uid': f'slice-{app}',
+                         'labels': {SERVICE_NAME_LABEL: app}},
+            'addressType': 'IPv4',
+            'endpoints': endpoints,
+            'ports': [{'name': 'http', 'port': 8080, 'protocol': 'TCP'}],
+        }
+        existed = name in self._objects['endpointslices']
+        self._objects['endpointslices'][name] = endpoint_slice
+        self._bump('endpointslices', 'MODIFIED' if existed else 'ADDED', endpoint_slice)
+
+    # -- reads ---------------------------------------------------------------
+
+    def count(self, caller, kind, verb):
+        with self._lock:
+            self.calls[(caller, kind, verb)] += 1
+
+    def stats(self):
+        """{caller: {"<kind> <verb>": count}}"""
+        with self._lock:
+            result = {}
+            for (caller, kind, verb), count in sorted(self.calls.items()):
+                result.setdefault(caller, {})[f'{kind} {verb}'] = count
+            return result
+
+    def get(self, kind, name):
+        with self._lock:
+            obj = self._objects[kind].get(name)
+            return json.loads(json.dumps(obj)) if obj else None
+
+    def list(self, kind, selector):
+        with self._lock:
+            items = [obj for obj in self._objects[kind].values() if matches(obj['metadata'].get('labels'), selector)]
+            return json.loads(json.dumps(items)), str(self._version)
+
+    def watch(self, kind, selector, since, deadline, bookmarks, bookmark_interval=5.0):
+        """Yield the watch events of `kind` after version `since`, until `deadline`"""
+        with self._lock:
+            compacted = len(self._events) == self._events.maxlen and since < self._events[0][0] - 1
+        if compacted:
+            yield {'type': 'ERROR', 'object': {
+                'kind': 'Status', 'apiVersion': 'v1', 'status': 'Failure', 'code': 410,
+                'reason': 'Expired', 'message': f'too old resource version: {since}'}}
+            return
+        next_bookmark = time.monotonic() + bookmark_interval
+        while True:
+            bookmark = False
+            with self._lock:
+                # Newest events are on the right, only walk back over the new ones
+                pending = []
+                for version, event_kind, event_type, data in reversed(self._events):
+                    if version <= since:
+                        break
+                    if event_kind == kind:
+                        pending.append((version, event_type, data))
+                pending.reverse()
+                if not pending:
+                    now = time.monotonic()
+                    if now >= deadline:
+                        return
+                    if bookmarks and now >= next_bookmark:
+                        # Nothing of this kind happened up to the current version
+                        since = self._version
+                        bookmark = True
+                    else:
+                        self._lock.wait(min(deadline, next_bookmark) - now)
+                        continue
+            if bookmark:
+                next_bookmark = time.monotonic() + bookmark_interval
+                yield {'type': 'BOOKMARK', 'object': {'kind': 'Bookmark',
+                                                      'metadata': {'resourceVersion': str(since)}}}
+                continue
+            for version, event_type, data in pending:
+                since = version
+                obj = json.loads(data)
+                if matches(obj['metadata'].get('labels'), selector):
+                    yield {'type': event_type, 'object': obj}
+
+
+LIST_KINDS = {'nodes': 'NodeList', 'pods': 'PodList', 'endpointslices': 'EndpointSliceList'}
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Routes the handful of API paths the services call"""
+
+    cluster = None  # set by serve()
+    # Chunked responses, so clients see watch events as they are written
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _not_found(self, message):
+        self._json(404, {'kind': 'Status', 'apiVersion': 'v1', 'status': 'Failure',
+                         'reason': 'NotFound', 'code': 404, 'message': message})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = [p for p in url.path.split('/') if p]
+        caller = 'unknown'
+        if len(parts) >= 2 and parts[0] == 'caller':
+            caller, parts = parts[1], parts[2:]
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+
+        if parts == ['_stats']:
+            return self._json(200, self.cluster.stats())
+
+        # /api/v1/nodes[/<name>], /api/v1/namespaces/<ns>/pods,
+        # /apis/discovery.k8s.io/v1/namespaces/<ns>/endpointslices
+        if parts[:2] == ['api', 'v1'] and len(parts) in (3, 4) and parts[2] == 'nodes':
+            kind, name = 'nodes', parts[3] if len(parts) == 4 else None
+        elif parts[:3] == ['api', 'v1', 'namespaces'] and len(parts) == 5 and parts[4] == 'pods':
+            kind, name = 'pods', None
+        elif (parts[:4] == ['apis', 'discovery.k8s.io', 'v1', 'namespaces'] and len(parts) == 6
+              and parts[5] == 'endpointslices'):
+            kind, name = 'endpointslices', None
+        else:
+            return self._not_found(f'unsupported path {url.path}')
+
+        if name:
+            self.cluster.count(caller, kind, 'get')
+            obj = self.cluster.get(kind, name)
+            return self._json(200, obj) if obj else self._not_found(f'{kind} "{name}" not found')
+
+        selector = query.get('labelSelector')
+        if query.get('watch', '').lower() in ('true', '1'):
+            self.cluster.count(caller, kind, 'watch')
+            return self._watch(kind, selector, query)
+        self.cluster.count(caller, kind, 'list')
+        items, version = self.cluster.list(kind, selector)
+        api_version = 'discovery.k8s.io/v1' if kind == 'endpointslices' else 'v1'
+        self._json(200, {'kind': LIST_KINDS[kind], 'apiVersion': api_version,
+                         'metadata': {'resourceVersion': version}, 'items': items})
+
+    def _watch(self, kind, selector, query):
+        since = int(query.get('resourceVersion') or 0)
+        deadline = time.monotonic() + float(query.get('timeoutSeconds') or 1800)
+        bookmarks = query.get('allowWatchBookmarks', '').lower() in ('true', '1')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            for event in self.cluster.watch(kind, selector, since, deadline, bookmarks):
+                line = json.dumps(event).encode() + b'\n'
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(line), line))
+                self.wfile.flush()
+            self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+
+def serve(cluster, host="127.0.0.1", port=6443):
+    """Start the API stand-in on a background thread and return the server"""
+    handler = type('BoundHandler', (Handler,), {'cluster': cluster})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-kube", daemon=True).start()
+    return server
+
+
+def load_config(cluster, config):
+    """{"nodes": {name: zone}, "pods": [{"name", "app", "node", "ip", "ready"}]}"""
+    for name, zone in config.get('nodes', {}).items():
+        cluster.add_node(name, zone)
+    for pod in config.get('pods', []):
+        cluster.add_pod(pod['name'], pod['app'], pod['node'], pod['ip'], pod.get('ready', True))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Kubernetes API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6443)
+    parser.add_argument('--config', help="JSON file with nodes and pods")
+    parser.add_argument('--hints', action='store_true', help="publish same-zone topology hints")
+    args = parser.parse_args()
+
+    cluster = FakeCluster(hints=args.hints)
+    if args.config:
+        with open(args.config) as f:
+            load_config(cluster, json.load(f))
+    server = serve(cluster, args.host, args.port)
+    print(f"Fake Kubernetes API listening on http://{args.host}:{args.port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,318 @@
+# harness.py
+#
+# Local end-to-end benchmark. Starts a fake Kubernetes API, N backends,
+# M clients and the dashboard as local processes (each on its own loopback
+# address, all on port 8080), drives load through the clients and records
+# throughput, latency percentiles, locality, API server calls and CPU time
+# per service.
+#
+#   python harness.py --backends 3 --clients 3 --rps 200 --duration 20 --output before.json
+#   python harness.py --backends 3 --clients 3 --rps 200 --duration 20 --output after.json \
+#       --env ROUTING_POLICY=least-latency
+#   python harness.py --compare before.json after.json
+#
+# Linux routes all of 127.0.0.0/8 to the loopback interface; on macOS add
+# the addresses first (sudo ifconfig lo0 alias 127.0.1.1 up, and so on).
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+from fake_kube import FakeCluster, serve
+
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(SRC, 'dashboard'))
+from loadgen import LoadJob, percentile  # noqa: E402
+
+ZONE_NAMES = ('EU-FRANKFURT-1-AD-1', 'EU-FRANKFURT-1-AD-2', 'EU-FRANKFURT-1-AD-3')
+DASHBOARD_IP = '127.0.3.1'
+
+
+class Service:
+    """One service process playing the part of a pod"""
+
+    def __init__(self, name, app, script, ip, node, health_path, command=None, env=None):
+        self.name = name
+        self.app = app
+        self.kind = name.rsplit('-', 1)[0]
+        self.script = script
+        self.command = command or [sys.executable, os.path.basename(script)]
+        self.env = env or {}
+        self.ip = ip
+        self.node = node
+        self.health_path = health_path
+        self.process = None
+        self.started = None
+
+    def start(self, api_url, env, log_dir):
+        service_env = dict(os.environ, POD_NAME=self.name, POD_NAMESPACE='default', NODE_NAME=self.node,
+                           POD_IP=self.ip, BIND_ADDRESS=self.ip, PYTHONUNBUFFERED='1',
+                           # The caller prefix lets the fake API count calls per pod
+                           KUBE_API_URL=f'{api_url}/caller/{self.name}', **dict(env, **self.env))
+        log = open(os.path.join(log_dir, f'{self.name}.log'), 'w')
+        self.started = time.monotonic()
+        self.process = subprocess.Popen(self.command, cwd=os.path.dirname(self.script), env=service_env,
+                                        stdout=log, stderr=subprocess.STDOUT)
+
+    def healthy(self):
+        if self.process.poll() is not None:
+            raise RuntimeError(f'{self.name} exited with code {self.process.returncode}')
+        try:
+            return requests.get(f'http://{self.ip}:8080{self.health_path}', timeout=1).status_code == 200
+        except requests.RequestException:
+            return False
+
+    def cpu_seconds(self):
+        """User + system CPU time of the process and its children so far, None where /proc is missing"""
+        try:
+            return sum(self._process_cpu(pid) for pid in self._process_tree(self.process.pid))
+        except (OSError, IndexError, ValueError):
+            return None
+
+    @staticmethod
+    def _process_cpu(pid):
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+    @staticmethod
+    def _process_tree(pid):
+        # Multi-worker clients fork workers and a publisher under the master
+        pids = [pid]
+        for pid in pids:
+            try:
+                with open(f'/proc/{pid}/task/{pid}/children') as f:
+                    pids.extend(int(child) for child in f.read().split())
+            except OSError:
+                pass
+        return pids
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+def build_services(args):
+    zones = ZONE_NAMES[:args.zones] if args.zones <= len(ZONE_NAMES) else \
+        [f'zone-{i + 1}' for i in range(args.zones)]
+    nodes = {f'node-{i + 1}': zone for i, zone in enumerate(zones)}
+    node_names = list(nodes)
+    backend_script = os.path.join(SRC, 'backend', 'async_backend.py' if args.async_backend else 'backend.py')
+    client_script = os.path.join(SRC, 'frontend', 'async_client.py' if args.async_client else 'client.py')
+    client_command = client_env = None
+    if args.client_workers:
+        # gunicorn with a discovery publisher and shared-memory state per pod
+        client_command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'client:app']
+        client_env = {'CLIENT_WORKERS': str(args.client_workers)}
+    services = []
+    # Pods are spread over the zones round-robin, like the topology spread constraints
+    for i in range(args.backends):
+        services.append(Service(f'backend-{i + 1}', 'backend-service', backend_script,
+                                f'127.0.2.{i + 1}', node_names[i % len(node_names)], '/ready'))
+    for i in range(args.clients):
+        env = client_env and dict(client_env, SHARED_STATE_DIR=os.path.join(
+            tempfile.gettempdir(), f'harness-client-{i + 1}-{os.getpid()}'))
+        services.append(Service(f'client-{i + 1}', 'client-service', client_script,
+                                f'127.0.1.{i + 1}', node_names[i % len(node_names)], '/ready',
+                                client_command, env))
+    services.append(Service('dashboard-1', 'zone-dashboard', os.path.join(SRC, 'dashboard', 'dashboard.py'),
+                            DASHBOARD_IP, node_names[0], '/ready'))
+    return nodes, services
+
+
+def api_calls_by_kind(stats, before=None):
+    """Sum per-pod API call counts into per-service ones, optionally minus `before`"""
+    totals = {}
+    for caller, calls in stats.items():
+        kind = caller.rsplit('-', 1)[0]
+        for call, count in calls.items():
+            count -= (before or {}).get(caller, {}).get(call, 0)
+            if count:
+                totals.setdefault(kind, {})
+                totals[kind][call] = totals[kind].get(call, 0) + count
+    return totals
+
+
+def run(args):
+    nodes, services = build_services(args)
+    log_dir = args.log_dir or tempfile.mkdtemp(prefix='harness-')
+    os.makedirs(log_dir, exist_ok=True)
+    env = dict(item.split('=', 1) for item in args.env)
+    if args.push:
+        env.setdefault('METRICS_SOURCE', 'push')
+        env.setdefault('METRICS_PUSH_URL', f'http://{DASHBOARD_IP}:8080/ingest')
+
+    cluster = FakeCluster(hints=args.hints)
+    server = serve(cluster, '127.0.0.1', args.api_port)
+    api_url = f'http://127.0.0.1:{args.api_port}'
+    for name, zone in nodes.items():
+        cluster.add_node(name, zone)
+    print(f'Logs in {log_dir}')
+
+    try:
+        # Backends first so clients find them when they start watching.
+        # Pods only turn Ready once their /ready answers 200, like a readiness probe.
+        for service in services:
+            cluster.add_pod(service.name, service.app, service.node, service.ip, ready=False)
+            service.start(api_url, env, log_dir)
+        ready_seconds = wait_ready(cluster, services)
+        targets = [s.ip for s in services if s.kind == 'client']
+
+        if args.warmup > 0:
+            print(f'Warming up for {args.warmup}s')
+            warmup = LoadJob('warmup', targets, rps=args.rps, concurrency=args.concurrency,
+                             duration=args.warmup, keys=args.keys)
+            warmup.start()
+            warmup.wait()
+
+        api_before = cluster.stats()
+        cpu_before = {s.name: s.cpu_seconds() for s in services}
+        print(f'Running load for {args.duration}s')
+        job = LoadJob('run', targets, rps=args.rps, concurrency=args.concurrency, duration=args.duration,
+                      keys=args.keys)
+        job.start()
+        job.wait()
+        api_after = cluster.stats()
+        cpu_by_kind = {}
+        for service in services:
+            before, after = cpu_before[service.name], service.cpu_seconds()
+            if before is not None and after is not None:
+                cpu_by_kind[service.kind] = cpu_by_kind.get(service.kind, 0.0) + after - before
+    finally:
+        for service in services:
+            service.stop()
+            if 'SHARED_STATE_DIR' in service.env:
+                shutil.rmtree(service.env['SHARED_STATE_DIR'], ignore_errors=True)
+        server.shutdown()
+
+    summary = job.summary()
+    latencies = sorted(latency for stats in job.by_zone.values() for latency in stats.latencies)
+    same_zone = sum(stats.same_zone for stats in job.by_zone.values())
+    return {
+        'label': args.label,
+        'config': {k: v for k, v in vars(args).items() if k not in ('compare', 'output', 'label', 'log_dir')},
+        'throughput_rps': summary['throughput_rps'],
+        'requests': summary['completed'],
+        'errors': summary['errors'],
+        'dropped': summary['dropped'],
+        'locality': same_zone / summary['completed'] if summary['completed'] else None,
+        'latency_ms': {name: None if value is None else value * 1000
+                       for name, value in (('p50', percentile(latencies, 50)), ('p90', percentile(latencies, 90)),
+                                           ('p99', percentile(latencies, 99)))},
+        'by_client_zone': summary['by_client_zone'],
+        # API server calls made while the load ran, and over the whole run
+        'api_calls': api_calls_by_kind(api_after, api_before),
+        'api_calls_total': api_calls_by_kind(api_after),
+        'cpu_seconds': cpu_by_kind,
+        # Slowest pod of each service from process start to ready
+        'ready_seconds': ready_seconds,
+        'log_dir': log_dir,
+    }
+
+
+def wait_ready(cluster, services, timeout=30.0):
+    """Poll every service until it is ready, marking its pod Ready as it gets
+    there; returns the slowest start-to-ready time per service kind"""
+    ready_seconds = {}
+    pending = list(services)
+    deadline = time.monotonic() + timeout
+    while pending:
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"{', '.join(s.name for s in pending)} not ready after {timeout}s")
+        for service in list(pending):
+            if service.healthy():
+                elapsed = time.monotonic() - service.started
+                ready_seconds[service.kind] = max(ready_seconds.get(service.kind, 0.0), elapsed)
+                cluster.set_ready(service.name)
+                pending.remove(service)
+        time.sleep(0.05)
+    return ready_seconds
+
+
+def flatten(result):
+    """The comparable numbers of a result, as name -> value"""
+    values = {
+        'throughput_rps': result['throughput_rps'],
+        'errors': result['errors'],
+        'locality': result['locality'],
+    }
+    for name, value in result['latency_ms'].items():
+        values[f'latency {name} ms'] = value
+    for kind, calls in sorted(result['api_calls'].items()):
+        values[f'api calls {kind}'] = sum(calls.values())
+    for kind, seconds in sorted(result['cpu_seconds'].items()):
+        values[f'cpu s {kind}'] = seconds
+    # Results from before ready_seconds existed have none
+    for kind, seconds in sorted(result.get('ready_seconds', {}).items()):
+        values[f'ready s {kind}'] = seconds
+    return values
+
+
+def compare(before_path, after_path):
+    with open(before_path) as f:
+        before = flatten(json.load(f))
+    with open(after_path) as f:
+        after = flatten(json.load(f))
+    print(f"{'metric':<24} {'before':>12} {'after':>12} {'change':>9}")
+    for name in list(before) + [n for n in after if n not in before]:
+        a, b = before.get(name), after.get(name)
+        change = ''
+        if a and b is not None:
+            change = f'{(b - a) / a * 100:+.1f}%'
+        fmt = lambda v: '-' if v is None else f'{v:.3f}' if isinstance(v, float) else str(v)
+        print(f'{name:<24} {fmt(a):>12} {fmt(b):>12} {change:>9}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the services locally against a fake Kubernetes API")
+    parser.add_argument('--backends', type=int, default=3)
+    parser.add_argument('--clients', type=int, default=3)
+    parser.add_argument('--zones', type=int, default=3)
+    parser.add_argument('--rps', type=float, default=100.0, help="open-loop request rate, 0 for closed loop")
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--duration', type=float, default=20.0)
+    parser.add_argument('--warmup', type=float, default=3.0)
+    parser.add_argument('--async-backend', action='store_true', help="run async_backend.py")
+    parser.add_argument('--async-client', action='store_true', help="run async_client.py")
+    parser.add_argument('--client-workers', type=int, default=0,
+                        help="run each client under gunicorn with this many workers")
+    parser.add_argument('--push', action='store_true', help="clients push metrics to the dashboard")
+    parser.add_argument('--hints', action='store_true', help="publish same-zone topology hints")
+    parser.add_argument('--keys', type=int, help="spread requests over this many affinity keys")
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help="extra environment for every service, e.g. ROUTING_POLICY=least-latency")
+    parser.add_argument('--api-port', type=int, default=6443)
+    parser.add_argument('--log-dir')
+    parser.add_argument('--label', default='')
+    parser.add_argument('--output', help="write the results as JSON")
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help="compare two result files")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    if args.backends > 254 or args.clients > 254:
+        parser.error('at most 254 backends and 254 clients')
+    if args.client_workers and args.async_client:
+        parser.error('--client-workers runs the Flask client')
+    args.rps = args.rps or None
+
+    result = run(args)
+    print(json.dumps({k: v for k, v in result.items() if k != 'by_client_zone'}, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,485 @@
+# simulate.py
+#
+# Offline routing simulator. Replays millions of routing decisions against a
+# modelled topology (zones, client and backend pods, backend latency and
+# failure rates, cross-zone latency) without a cluster, and reports locality,
+# per-backend load skew, latency percentiles and cross-zone bytes.
+#
+#   python simulate.py --policy all --scenario all
+#   python simulate.py --policy zone-preference --scenario zone-down --min-locality 0 --json
+#
+# Decisions come from the client's routing code (src/frontend/routing.py):
+# stateless policies are sampled in bulk from their zone_probabilities(), and
+# least-latency is replayed request by request with one state per client pod
+# (see simulate_least_latency).
+import argparse
+import heapq
+import json
+import math
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'frontend'))
+from routing import create_policy, route  # noqa: E402
+
+POLICIES = ('zone-preference', 'zone-weighted', 'least-latency', 'affinity')
+ZONES = ('EU-FRANKFURT-1-AD-1', 'EU-FRANKFURT-1-AD-2', 'EU-FRANKFURT-1-AD-3')
+
+# Latency histogram used for the percentiles: 0.1ms to 100s, log-spaced
+LATENCY_EDGES = np.logspace(-4, 2, 601)
+
+
+def backends(count, latency_ms=50.0, sigma=0.5, failure_rate=0.0):
+    return [{'latency_ms': latency_ms, 'sigma': sigma, 'failure_rate': failure_rate} for _ in range(count)]
+
+
+SCENARIOS = {
+    # Pods spread evenly, as the topologySpreadConstraints intend
+    'balanced': {
+        'clients': dict(zip(ZONES, (1, 1, 1))),
+        'backends': dict(zip(ZONES, (backends(2), backends(2), backends(2)))),
+    },
+    # Most backend capacity in one zone
+    'skewed': {
+        'clients': dict(zip(ZONES, (1, 1, 1))),
+        'backends': dict(zip(ZONES, (backends(4), backends(1), backends(1)))),
+    },
+    # A zone lost all of its backends
+    'zone-down': {
+        'clients': dict(zip(ZONES, (1, 1, 1))),
+        'backends': dict(zip(ZONES, (backends(2), backends(2), []))),
+    },
+    # One backend is five times slower than its peers
+    'slow-backend': {
+        'clients': dict(zip(ZONES, (1, 1, 1))),
+        'backends': dict(zip(ZONES, (backends(1) + backends(1, latency_ms=250), backends(2), backends(2)))),
+    },
+    # One backend fails a fifth of its requests
+    'flaky-backend': {
+        'clients': dict(zip(ZONES, (1, 1, 1))),
+        'backends': dict(zip(ZONES, (backends(1) + backends(1, failure_rate=0.2), backends(2), backends(2)))),
+    },
+}
+
+
+class Scenario:
+    """A topology flattened into per-backend arrays, backends grouped by zone"""
+
+    def __init__(self, spec, name="custom"):
+        self.name = name
+        self.zones = list(spec.get('zones') or sorted(set(spec['clients']) | set(spec['backends'])))
+        self.cross_zone_latency = spec.get('cross_zone_ms', 1.0) / 1000
+        self.failure_latency = spec.get('failure_latency_ms', 5.0) / 1000
+        self.bytes_per_request = spec.get('bytes_per_request', 10 * 1024)
+        self.rps = spec.get('rps', 1000.0)
+
+        clients = np.array([spec['clients'].get(zone, 0) for zone in self.zones], dtype=float)
+        self.client_share = clients / clients.sum()
+        # Fake pod IPs, so the real policies see the same shapes as in a cluster
+        self.clients_by_zone = {zone: [f"10.1.{z}.{i}" for i in range(int(clients[z]))]
+                                for z, zone in enumerate(self.zones)}
+
+        self.backends_by_zone = {}
+        self.ips = []
+        zone_index, median, sigma, failure_rate = [], [], [], []
+        self.start = np.zeros(len(self.zones), dtype=np.int64)
+        self.count = np.zeros(len(self.zones), dtype=np.int64)
+        for z, zone in enumerate(self.zones):
+            specs = spec['backends'].get(zone, [])
+            if isinstance(specs, int):
+                specs = backends(specs)
+            self.start[z] = len(self.ips)
+            self.count[z] = len(specs)
+            self.backends_by_zone[zone] = [f"10.0.{z}.{i}" for i in range(len(specs))]
+            self.ips.extend(self.backends_by_zone[zone])
+            for backend in specs:
+                zone_index.append(z)
+                median.append(backend.get('latency_ms', 50.0) / 1000)
+                sigma.append(backend.get('sigma', 0.5))
+                failure_rate.append(backend.get('failure_rate', 0.0))
+        if not self.ips:
+            raise ValueError(f"scenario {name} has no backends")
+        self.backend_zone = np.array(zone_index, dtype=np.int64)
+        self.median = np.array(median)
+        self.sigma = np.array(sigma)
+        self.failure_rate = np.array(failure_rate)
+        # Only zones that have backends, like a discovery snapshot
+        self.snapshot = {zone: ips for zone, ips in self.backends_by_zone.items() if ips}
+
+    @classmethod
+    def load(cls, name_or_path):
+        if name_or_path in SCENARIOS:
+            return cls(SCENARIOS[name_or_path], name_or_path)
+        with open(name_or_path) as f:
+            return cls(json.load(f), os.path.splitext(os.path.basename(name_or_path))[0])
+
+    def build_policy(self, name, **options):
+        demand = {zone: ips for zone, ips in self.clients_by_zone.items() if ips}
+        return create_policy(name, demand_source=lambda: demand, **options)
+
+
+class Results:
+    """Accumulates simulated requests chunk by chunk"""
+
+    def __init__(self, scenario):
+        self.scenario = scenario
+        zones = len(scenario.zones)
+        self.requests = 0
+        self.same_zone = 0
+        self.service_fallback = 0
+        self.failures = 0
+        self.backend_load = np.zeros(len(scenario.ips), dtype=np.int64)
+        self.histogram = np.zeros(len(LATENCY_EDGES) - 1, dtype=np.int64)
+        self.zone_histograms = np.zeros((zones, len(LATENCY_EDGES) - 1), dtype=np.int64)
+        self.zone_pairs = np.zeros((zones, zones), dtype=np.int64)
+
+    def add(self, client_zone, backend, latency, failed, via_service=0):
+        scenario = self.scenario
+        target_zone = scenario.backend_zone[backend]
+        self.requests += len(backend)
+        self.same_zone += int(np.count_nonzero(client_zone == target_zone))
+        self.service_fallback += via_service
+        self.failures += int(np.count_nonzero(failed))
+        self.backend_load += np.bincount(backend, minlength=len(scenario.ips))
+        zones = len(scenario.zones)
+        self.zone_pairs += np.bincount(client_zone * zones + target_zone,
+                                       minlength=zones * zones).reshape(zones, zones)
+        bins = np.clip(np.searchsorted(LATENCY_EDGES, latency) - 1, 0, len(LATENCY_EDGES) - 2)
+        self.histogram += np.bincount(bins, minlength=len(self.histogram))
+        for z in range(zones):
+            mask = client_zone == z
+            if mask.any():
+                self.zone_histograms[z] += np.bincount(bins[mask], minlength=len(self.histogram))
+
+    def report(self, policy, elapsed):
+        scenario = self.scenario
+        load = self.backend_load
+        mean_load = load.mean()
+        cross_zone = self.requests - self.same_zone
+        cross_zone_gb = cross_zone * scenario.bytes_per_request / 1024 ** 3
+        by_zone = {}
+        for z, zone in enumerate(scenario.zones):
+            total = int(self.zone_pairs[z].sum())
+            if total:
+                by_zone[zone] = {
+                    'requests': total,
+                    'locality': float(self.zone_pairs[z, z] / total),
+                    'p50_ms': percentile(self.zone_histograms[z], 50) * 1000,
+                    'p99_ms': percentile(self.zone_histograms[z], 99) * 1000,
+                    'to_zone': {target: int(self.zone_pairs[z, t]) for t, target in enumerate(scenario.zones)
+                                if self.zone_pairs[z, t]},
+                }
+        return {
+            'scenario': scenario.name,
+            'policy': policy,
+            'requests': self.requests,
+            'decisions_per_second': self.requests / elapsed if elapsed > 0 else None,
+            'locality': self.same_zone / self.requests,
+            'service_fallback': self.service_fallback,
+            'failure_rate': self.failures / self.requests,
+            'p50_ms': percentile(self.histogram, 50) * 1000,
+            'p99_ms': percentile(self.histogram, 99) * 1000,
+            # max / mean requests per backend; 1.0 is perfectly even
+            'load_skew': float(load.max() / mean_load) if mean_load else None,
+            'load_cv': float(load.std() / mean_load) if mean_load else None,
+            'backend_share': {ip: float(load[i] / self.requests) for i, ip in enumerate(scenario.ips)},
+            'cross_zone_requests': cross_zone,
+            'cross_zone_gb': cross_zone_gb,
+            'by_client_zone': by_zone,
+        }
+
+
+def percentile(histogram, pct):
+    """Percentile from a LATENCY_EDGES histogram, geometric middle of its bin"""
+    total = histogram.sum()
+    if not total:
+        return float('nan')
+    index = int(np.searchsorted(np.cumsum(histogram), total * pct / 100.0))
+    index = min(index, len(histogram) - 1)
+    return float(math.sqrt(LATENCY_EDGES[index] * LATENCY_EDGES[index + 1]))
+
+
+def sample_latency(rng, scenario, client_zone, backend):
+    """Latency and failure of each request, including the cross-zone round trip"""
+    latency = scenario.median[backend] * np.exp(scenario.sigma[backend] * rng.standard_normal(len(backend)))
+    latency += scenario.cross_zone_latency * (scenario.backend_zone[backend] != client_zone)
+    failed = rng.random(len(backend)) < scenario.failure_rate[backend]
+    # Failures come back fast, as connection errors or 5xx
+    latency = np.where(failed, scenario.failure_latency, latency)
+    return latency, failed
+
+
+def pick_in_zone(rng, scenario, zones):
+    """A uniformly random backend in each of `zones`"""
+    return scenario.start[zones] + (rng.random(len(zones)) * scenario.count[zones]).astype(np.int64)
+
+
+def simulate_stateless(scenario, policy_name, requests, rng, chunk=1000000, **options):
+    """Bulk-sample a policy whose choice depends only on the topology"""
+    policy = scenario.build_policy(policy_name, **options)
+    zones = len(scenario.zones)
+    # Zone probabilities per client zone, straight from the policy
+    probabilities = np.zeros((zones, zones))
+    for z, zone in enumerate(scenario.zones):
+        for target, p in policy.zone_probabilities(scenario.snapshot, zone).items():
+            probabilities[z, scenario.zones.index(target)] = p
+    results = Results(scenario)
+    started = time.perf_counter()
+    done = 0
+    while done < requests:
+        n = min(chunk, requests - done)
+        per_zone = rng.multinomial(n, scenario.client_share)
+        client_zone = np.repeat(np.arange(zones), per_zone)
+        backend = np.empty(n, dtype=np.int64)
+        via_service = 0
+        offset = 0
+        for z in range(zones):
+            k = per_zone[z]
+            if not k:
+                continue
+            if probabilities[z].sum() > 0:
+                target = rng.choice(zones, size=k, p=probabilities[z] / probabilities[z].sum())
+                backend[offset:offset + k] = pick_in_zone(rng, scenario, target)
+            else:
+                # No decision possible: the Service load-balances over all pods
+                backend[offset:offset + k] = rng.integers(0, len(scenario.ips), size=k)
+                via_service += k
+            offset += k
+        latency, failed = sample_latency(rng, scenario, client_zone, backend)
+        results.add(client_zone, backend, latency, failed, via_service)
+        done += n
+    return results.report(policy_name, time.perf_counter() - started)
+
+
+def simulate_least_latency(scenario, requests, rng, cross_zone_penalty=0.02, decay_time=5.0,
+                           initial_latency=0.05, parallelism=32, chunk=100000):
+    """Replay LeastLatencyPolicy request by request, one policy state per client pod.
+
+    Like the client, each pod keeps its own EWMA and in-flight count per
+    backend and only ever sees its own requests. Requests arrive as a Poisson
+    stream at scenario.rps spread evenly over the client pods, each one is
+    routed with the costs of that moment, and its completion (at its sampled
+    latency) is fed back to its pod in time order, like request_finished().
+    Costs, the zone averages idle estimates fade towards and the spill
+    decision follow LeastLatencyPolicy.
+    """
+    zones = len(scenario.zones)
+    backends_count = len(scenario.ips)
+    client_zones = [z for z, zone in enumerate(scenario.zones) for _ in scenario.clients_by_zone[zone]]
+    pods = len(client_zones)
+    ewma = [[initial_latency] * backends_count for _ in range(pods)]
+    updated = [[0.0] * backends_count for _ in range(pods)]
+    inflight = [[0] * backends_count for _ in range(pods)]
+    local_pool = [list(range(scenario.start[z], scenario.start[z] + scenario.count[z])) for z in range(zones)]
+    remote_pool = [np.flatnonzero(scenario.backend_zone != z).tolist() for z in range(zones)]
+    backend_zone = scenario.backend_zone.tolist()
+    median, sigma, failure_rate = scenario.median.tolist(), scenario.sigma.tolist(), scenario.failure_rate.tolist()
+    # Per pod and backend zone: the average idle estimates fade towards
+    zone_ewma = [[None] * zones for _ in range(pods)]
+    zone_updated = [[0.0] * zones for _ in range(pods)]
+    idle_decay = decay_time * 4
+    completions = []  # heap of (finish time, pod, backend, latency, failed)
+
+    def estimate(pod, backend, now):
+        if inflight[pod][backend]:
+            return ewma[pod][backend]
+        prior = zone_ewma[pod][backend_zone[backend]]
+        prior = initial_latency if prior is None else prior
+        return prior + (ewma[pod][backend] - prior) * math.exp(-(now - updated[pod][backend]) / idle_decay)
+
+    def cost(pod, backend, now):
+        return estimate(pod, backend, now) * (inflight[pod][backend] + 1)
+
+    def expected(pod, backend, now, penalty=0.0):
+        return (estimate(pod, backend, now) + penalty) * max(1.0, (inflight[pod][backend] + 1) / parallelism)
+
+    def pick_two(pod, pool, u1, u2, now):
+        n = len(pool)
+        first = pool[int(u1 * n)]
+        if n == 1:
+            return first
+        second = pool[(int(u1 * n) + 1 + int(u2 * (n - 1))) % n]
+        return first if cost(pod, first, now) <= cost(pod, second, now) else second
+
+    def finish_until(now):
+        while completions and completions[0][0] <= now:
+            finished, pod, backend, latency, failed = heapq.heappop(completions)
+            inflight[pod][backend] -= 1
+            if failed:
+                latency = max(latency, ewma[pod][backend] * 2)
+            weight = math.exp(-(finished - updated[pod][backend]) / decay_time)
+            ewma[pod][backend] = ewma[pod][backend] * weight + latency * (1 - weight)
+            updated[pod][backend] = finished
+            z = backend_zone[backend]
+            if zone_ewma[pod][z] is None:
+                zone_ewma[pod][z] = latency
+            weight = math.exp(-(finished - zone_updated[pod][z]) / decay_time)
+            zone_ewma[pod][z] = zone_ewma[pod][z] * weight + latency * (1 - weight)
+            zone_updated[pod][z] = finished
+
+    results = Results(scenario)
+    started = time.perf_counter()
+    now = 0.0
+    done = 0
+    while done < requests:
+        n = min(chunk, requests - done)
+        gaps = rng.exponential(1.0 / scenario.rps, n).tolist()
+        pod_of = rng.integers(0, pods, n).tolist()
+        picks = rng.random((n, 4)).tolist()
+        noise = rng.standard_normal(n).tolist()
+        fails = rng.random(n).tolist()
+        client_zone = np.empty(n, dtype=np.int64)
+        backend = np.empty(n, dtype=np.int64)
+        latency = np.empty(n)
+        failed = np.zeros(n, dtype=bool)
+        for i in range(n):
+            now += gaps[i]
+            finish_until(now)
+            pod = pod_of[i]
+            z = client_zones[pod]
+            u = picks[i]
+            remote = pick_two(pod, remote_pool[z], u[2], u[3], now) if remote_pool[z] else None
+            if local_pool[z] and (remote is None or min(expected(pod, b, now) for b in local_pool[z])
+                                  <= expected(pod, remote, now, cross_zone_penalty)):
+                chosen = pick_two(pod, local_pool[z], u[0], u[1], now)
+            else:
+                chosen = remote
+            if fails[i] < failure_rate[chosen]:
+                # Failures come back fast, as connection errors or 5xx
+                took = scenario.failure_latency
+                failed[i] = True
+            else:
+                took = median[chosen] * math.exp(sigma[chosen] * noise[i])
+                if backend_zone[chosen] != z:
+                    took += scenario.cross_zone_latency
+            inflight[pod][chosen] += 1
+            heapq.heappush(completions, (now + took, pod, chosen, took, failed[i]))
+            client_zone[i], backend[i], latency[i] = z, chosen, took
+        results.add(client_zone, backend, latency, failed)
+        done += n
+    return results.report('least-latency', time.perf_counter() - started)
+
+
+def simulate(scenario, policy_name, requests, seed=0, **options):
+    rng = np.random.default_rng(seed)
+    if policy_name == 'least-latency':
+        return simulate_least_latency(scenario, requests, rng, **options)
+    return simulate_stateless(scenario, policy_name, requests, rng, **options)
+
+
+def verify_decisions(scenario, policy_name, samples=20000, seed=0, **options):
+    """Check that choose() agrees with zone_probabilities() on this topology.
+
+    Runs `samples` real route() calls per client zone and returns the largest
+    gap between the observed and the declared zone frequencies, plus the
+    tolerance (5 standard errors) it is held to.
+    """
+    random.seed(seed)
+    policy = scenario.build_policy(policy_name, **options)
+    worst = 0.0
+    for zone in scenario.zones:
+        expected = policy.zone_probabilities(scenario.snapshot, zone)
+        observed = {}
+        for _ in range(samples):
+            ip, target = route(scenario.snapshot, zone, policy)
+            if ip is not None and ip not in scenario.backends_by_zone.get(target, ()):
+                raise AssertionError(f"{policy_name} picked {ip} but reported zone {target}")
+            observed[target] = observed.get(target, 0) + 1
+        for target in set(expected) | set(observed):
+            worst = max(worst, abs(observed.get(target, 0) / samples - expected.get(target, 0.0)))
+    return worst, 5 * math.sqrt(0.25 / samples)
+
+
+def check_thresholds(report, args):
+    """Threshold violations of one report, for CI"""
+    failures = []
+    if args.min_locality is not None and report['locality'] < args.min_locality:
+        failures.append(f"locality {report['locality']:.3f} < {args.min_locality}")
+    if args.max_p99_ms is not None and report['p99_ms'] > args.max_p99_ms:
+        failures.append(f"p99 {report['p99_ms']:.1f}ms > {args.max_p99_ms}ms")
+    if args.max_skew is not None and report['load_skew'] is not None and report['load_skew'] > args.max_skew:
+        failures.append(f"load skew {report['load_skew']:.2f} > {args.max_skew}")
+    if args.max_failure_rate is not None and report['failure_rate'] > args.max_failure_rate:
+        failures.append(f"failure rate {report['failure_rate']:.4f} > {args.max_failure_rate}")
+    return failures
+
+
+def format_report(report):
+    return (f"{report['scenario']:<14} {report['policy']:<16} locality {report['locality'] * 100:5.1f}%  "
+            f"p50 {report['p50_ms']:6.1f}ms  p99 {report['p99_ms']:6.1f}ms  "
+            f"skew {report['load_skew']:4.2f}  failed {report['failure_rate'] * 100:4.1f}%  "
+            f"cross-zone {report['cross_zone_gb']:8.3f} GB  "
+            f"{report['decisions_per_second'] / 1e6:5.2f}M decisions/s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate routing policies without a cluster")
+    parser.add_argument('--policy', default='all', help=f"one of {', '.join(POLICIES)}, or all")
+    parser.add_argument('--scenario', default='all',
+                        help=f"one of {', '.join(SCENARIOS)}, a scenario JSON file, or all")
+    parser.add_argument('--requests', type=int, default=1000000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--rps', type=float, help="total request rate, drives least-latency's in-flight counts")
+    parser.add_argument('--same-zone-preference', type=float, default=0.8)
+    parser.add_argument('--cross-zone-penalty-ms', type=float, default=20.0)
+    parser.add_argument('--parallelism', type=int, default=32,
+                        help="least-latency's BACKEND_PARALLELISM")
+    parser.add_argument('--json', action='store_true', help="print full reports as JSON")
+    parser.add_argument('--verify', action='store_true',
+                        help="also check each stateless policy's choose() against its zone probabilities, "
+                             "and least-latency's locality against zone-preference's")
+    parser.add_argument('--min-locality', type=float)
+    parser.add_argument('--max-p99-ms', type=float)
+    parser.add_argument('--max-skew', type=float)
+    parser.add_argument('--max-failure-rate', type=float)
+    args = parser.parse_args(argv)
+
+    policies = POLICIES if args.policy == 'all' else [args.policy]
+    scenarios = list(SCENARIOS) if args.scenario == 'all' else [args.scenario]
+    reports = []
+    failures = []
+    for scenario_name in scenarios:
+        scenario = Scenario.load(scenario_name)
+        if args.rps:
+            scenario.rps = args.rps
+        by_policy = {}
+        for policy in policies:
+            if policy == 'least-latency':
+                options = {'cross_zone_penalty': args.cross_zone_penalty_ms / 1000,
+                           'parallelism': args.parallelism}
+            else:
+                options = {'same_zone_preference': args.same_zone_preference}
+            report = by_policy[policy] = simulate(scenario, policy, args.requests, args.seed, **options)
+            if args.verify and policy != 'least-latency':
+                gap, tolerance = verify_decisions(scenario, policy, seed=args.seed, **options)
+                report['verify_max_gap'] = gap
+                if gap > tolerance:
+                    failures.append(f"{scenario.name}/{policy}: choose() differs from zone_probabilities() "
+                                    f"by {gap:.4f} (tolerance {tolerance:.4f})")
+            if args.verify and policy == 'least-latency':
+                # Latency awareness must not cost locality: at least the fixed-bias baseline's
+                baseline = by_policy.get('zone-preference') or simulate(
+                    scenario, 'zone-preference', args.requests, args.seed,
+                    same_zone_preference=args.same_zone_preference)
+                report['baseline_locality'] = baseline['locality']
+                if report['locality'] < baseline['locality']:
+                    failures.append(f"{scenario.name}/{policy}: locality {report['locality']:.3f} below "
+                                    f"zone-preference's {baseline['locality']:.3f}")
+            failures += [f"{scenario.name}/{policy}: {failure}" for failure in check_thresholds(report, args)]
+            reports.append(report)
+            if not args.json:
+                print(format_report(report))
+
+    if args.json:
+        print(json.dumps(reports, indent=2))
+    for failure in failures:
+        print(f"FAIL {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())